@@ -0,0 +1,89 @@
+'''
+File: analyzer.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import threading
+import time
+
+# spaCy model used by the Presidio NLP engine
+SPACY_MODEL = "en_core_web_lg"
+
+# Entities requested from Presidio
+ANALYZER_ENTITIES = ["PHONE_NUMBER", "EMAIL_ADDRESS", "PAN"]
+
+# PHONE_NUMBER, EMAIL_ADDRESS and PAN are pattern recognizers; they only need
+# tokens and lemmas for context words, so the parser and NER are never loaded
+EXCLUDED_PIPES = ["parser", "ner"]
+
+# Texts per spaCy nlp.pipe batch in analyze_texts(), and processes nlp.pipe may
+# fork for one call (each loads its own copy of the model, so only worth it for
+# large batches)
+NLP_BATCH_SIZE = 32
+NLP_PROCESSES = 1
+
+_analyzer = None
+_analyzer_load_seconds = 0.0
+_analyzer_lock = threading.Lock()
+
+
+# Download SPACY_MODEL on first use, as Presidio's own engine provider does
+def ensure_spacy_model():
+    import spacy
+    if spacy.util.is_package(SPACY_MODEL):
+        return
+    print(f"spaCy model {SPACY_MODEL} is not installed; downloading it")
+    try:
+        spacy.cli.download(SPACY_MODEL)
+    except (Exception, SystemExit) as e:
+        raise RuntimeError(f"spaCy model {SPACY_MODEL} is not installed and could not be downloaded; "
+                           f"install it with: python -m spacy download {SPACY_MODEL}") from e
+
+# Build a new analyzer; prefer get_analyzer() which reuses one per process.
+# spaCy and Presidio are imported here so that importing this module stays cheap.
+def create_analyzer():
+    import spacy
+    from presidio_analyzer import AnalyzerEngine
+    from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+    ensure_spacy_model()
+    nlp_engine = SpacyNlpEngine(models=[{"lang_code": "en", "model_name": SPACY_MODEL}])
+    # Load the model directly so the excluded components are never built
+    nlp_engine.nlp = {"en": spacy.load(SPACY_MODEL, exclude=EXCLUDED_PIPES)}
+    return AnalyzerEngine(nlp_engine=nlp_engine, supported_languages=["en"])
+
+# Return the process-wide analyzer, loading the spaCy model on first use
+def get_analyzer():
+    global _analyzer, _analyzer_load_seconds
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                start = time.perf_counter()
+                _analyzer = create_analyzer()
+                _analyzer_load_seconds = time.perf_counter() - start
+                print(f"Analyzer loaded in {_analyzer_load_seconds:.2f}s")
+    return _analyzer
+
+# Seconds spent loading the model in this process (0.0 until get_analyzer() runs)
+def analyzer_load_seconds():
+    return _analyzer_load_seconds
+
+# Analyze many texts with one spaCy nlp.pipe pass instead of one pipeline call per text.
+# Returns one list of RecognizerResult per input text, in input order. Stand-ins for
+# AnalyzerEngine with a batching entry point of their own (service.PageBatcher) get
+# all the texts in one call.
+def analyze_texts(analyzer, texts, entities=ANALYZER_ENTITIES, batch_size=NLP_BATCH_SIZE, n_process=NLP_PROCESSES):
+    batch_analyze = getattr(analyzer, "analyze_texts", None)
+    if batch_analyze is not None:
+        return batch_analyze(texts, entities)
+    nlp_engine = getattr(analyzer, "nlp_engine", None)
+    if nlp_engine is None or not texts:
+        return [analyzer.analyze(text=text, entities=entities, language='en') for text in texts]
+    artifacts = nlp_engine.process_batch(texts, language='en', batch_size=batch_size, n_process=n_process)
+    return [
+        analyzer.analyze(text=text, entities=entities, language='en', nlp_artifacts=nlp_artifacts)
+        for text, (_, nlp_artifacts) in zip(texts, artifacts)
+    ]
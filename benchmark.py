@@ -0,0 +1,264 @@
+'''
+File: benchmark.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import tempfile
+import fitz
+from analyzer import get_analyzer, analyzer_load_seconds
+from encryption import EnvelopeEncryptor, embed_payload
+from page_index import PageTextIndex
+from main import OCR_DIRECT_DETECTION, pages_needing_ocr, make_pdf_searchable, ocr_page_indexes, detect_page_pii, redact_page, process_pdf
+from preprocessing import OCR_PRESET, OCR_PRESETS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Expected-count keys written to the ground-truth file, as read by load_pii_counts
+GROUND_TRUTH_KEYS = {"AADHAR": "AADHAR", "PAN": "PAN", "EMAIL_ADDRESS": "EMAIL", "PHONE_NUMBER": "PHONE"}
+
+STAGES = ["searchability", "ocr", "detection", "redaction", "encryption", "attachment", "process_pdf"]
+
+FILLER_WORDS = ("the agreement between parties shall remain in force until terminated by either side "
+                "with written notice and all obligations survive termination of this contract").split()
+
+
+def _fake_pii(entity_type, rng):
+    if entity_type == "AADHAR":
+        return " ".join("".join(rng.choices(string.digits, k=4)) for _ in range(3))
+    if entity_type == "PAN":
+        return "".join(rng.choices(string.ascii_uppercase, k=5)) + "".join(rng.choices(string.digits, k=4)) + rng.choice(string.ascii_uppercase)
+    if entity_type == "EMAIL_ADDRESS":
+        return "".join(rng.choices(string.ascii_lowercase, k=8)) + "@example.com"
+    return "+91 " + rng.choice("6789") + "".join(rng.choices(string.digits, k=9))
+
+def _page_lines(rng, pii_per_page, counts, lines_per_page=40):
+    lines = [" ".join(rng.choices(FILLER_WORDS, k=10)) for _ in range(lines_per_page)]
+    for entity_type, density in pii_per_page.items():
+        for _ in range(density):
+            line_num = rng.randrange(lines_per_page)
+            lines[line_num] += f" {_fake_pii(entity_type, rng)}"
+            counts[entity_type] += 1
+    return lines
+
+def generate_corpus(directory, documents=10, pages=5, pii_per_page=None, scanned_ratio=0.3, seed=0, dpi=150):
+    """Write a deterministic synthetic corpus of text and scanned PDFs.
+
+    pii_per_page maps entity type to hits per page. Scanned documents are
+    rasterized at dpi and contain images only. The expected counts go to
+    pii_counts.txt in the format load_pii_counts reads. Returns the path of
+    that file.
+    """
+    if pii_per_page is None:
+        pii_per_page = {"AADHAR": 1, "PAN": 1, "EMAIL_ADDRESS": 1, "PHONE_NUMBER": 1}
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    ground_truth = []
+
+    for doc_num in range(documents):
+        scanned = rng.random() < scanned_ratio
+        name = f"{'scanned' if scanned else 'text'}_{doc_num:04d}.pdf"
+        counts = {entity_type: 0 for entity_type in pii_per_page}
+        document = fitz.open()
+        for _ in range(pages):
+            page = document.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), "\n".join(_page_lines(rng, pii_per_page, counts)), fontsize=9)
+        if scanned:
+            raster = fitz.open()
+            for page in document:
+                pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+                raster.new_page(width=page.rect.width, height=page.rect.height).insert_image(page.rect, pixmap=pixmap)
+            document.close()
+            document = raster
+        document.save(os.path.join(directory, name), garbage=3, deflate=True)
+        document.close()
+        ground_truth.append(name + "," + ",".join(f"{GROUND_TRUTH_KEYS[t]}={c}" for t, c in counts.items()))
+
+    pii_count_file = os.path.join(directory, "pii_counts.txt")
+    with open(pii_count_file, 'w') as file:
+        file.write("\n".join(ground_truth) + "\n")
+    return pii_count_file
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def rank(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": rank(0.50), "p90": rank(0.90), "p99": rank(0.99), "max": ordered[-1], "mean": sum(ordered) / len(ordered)}
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _timed(timings, stage, pages, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[stage]["latencies"].append(time.perf_counter() - start)
+    timings[stage]["pages"] += pages
+    return result
+
+# Stands in for EnvelopeEncryptor so the redaction stage times redaction alone
+class _SkipEncryption:
+    def encrypt(self, *args):
+        pass
+
+# Scanned pages are indexed from Tesseract's words when OCR_DIRECT_DETECTION is on, as in process_pdf
+def _page_index(page, ocr_indexes):
+    return ocr_indexes[page.number] if page.number in ocr_indexes else PageTextIndex(page)
+
+# Run each stage in isolation on one document; the text layer for later stages comes from OCR when needed
+def _benchmark_document(pdf_path, work_dir, analyzer, timings, stages, ocr_preset=OCR_PRESET):
+    with fitz.open(pdf_path) as document:
+        page_count = len(document)
+        if "searchability" in stages:
+            ocr_pages = _timed(timings, "searchability", page_count, pages_needing_ocr, document)
+        else:
+            ocr_pages = pages_needing_ocr(document)
+
+    text_pdf_path = pdf_path
+    ocr_indexes = {}
+    if ocr_pages and OCR_DIRECT_DETECTION:
+        with fitz.open(pdf_path) as document:
+            def ocr():
+                ocr_indexes.update(ocr_page_indexes(document, ocr_pages, ocr_preset))
+            if "ocr" in stages:
+                _timed(timings, "ocr", len(ocr_pages), ocr)
+            else:
+                ocr()
+    elif ocr_pages:
+        searchable_path = os.path.join(work_dir, f"searchable_{os.path.basename(pdf_path)}")
+        if "ocr" in stages:
+            text_pdf_path = _timed(timings, "ocr", len(ocr_pages), make_pdf_searchable, pdf_path, searchable_path, pages=ocr_pages, preset=ocr_preset)
+        else:
+            text_pdf_path = make_pdf_searchable(pdf_path, searchable_path, pages=ocr_pages, preset=ocr_preset)
+
+    # Kept per page so the redaction stage reuses them instead of detecting again
+    page_detections = {}
+    with fitz.open(text_pdf_path) as document:
+        def detect():
+            for page in document:
+                page_detections[page.number] = detect_page_pii(_page_index(page, ocr_indexes).text, analyzer, page.number)
+        if "detection" in stages:
+            _timed(timings, "detection", page_count, detect)
+        else:
+            detect()
+
+    if "redaction" in stages:
+        with fitz.open(text_pdf_path) as document:
+            def redact():
+                for page in document:
+                    redact_page(page, analyzer, _SkipEncryption(), {}, detections=page_detections[page.number],
+                                page_index=ocr_indexes.get(page.number))
+                document.tobytes(garbage=4, deflate=True)
+            _timed(timings, "redaction", page_count, redact)
+
+    hits = [detection[0] for page_num in sorted(page_detections) for detection in page_detections[page_num]]
+    encryptor = EnvelopeEncryptor('benchmark')
+    if "encryption" in stages:
+        _timed(timings, "encryption", page_count, lambda: [encryptor.encrypt(hit) for hit in hits])
+    else:
+        for hit in hits:
+            encryptor.encrypt(hit)
+
+    if "attachment" in stages:
+        payload = encryptor.take_payload() or b""
+        with fitz.open(text_pdf_path) as document:
+            def attach():
+                embed_payload(document, payload)
+                return document.tobytes(garbage=4, deflate=True)
+            _timed(timings, "attachment", page_count, attach)
+
+    return page_count
+
+def run_benchmark(corpus_dir, pii_count_file, stages=STAGES, analyzer=None, ocr_preset=OCR_PRESET):
+    """Time every selected stage over the corpus; returns a JSON-serializable report."""
+    if analyzer is None:
+        analyzer = get_analyzer()
+    pdf_files = sorted(f for f in os.listdir(corpus_dir) if f.lower().endswith('.pdf'))
+    timings = {stage: {"latencies": [], "pages": 0} for stage in stages}
+    total_pages = 0
+
+    with tempfile.TemporaryDirectory(prefix="pii_benchmark_") as work_dir:
+        start = time.perf_counter()
+        for filename in pdf_files:
+            pdf_path = os.path.join(corpus_dir, filename)
+            total_pages += _benchmark_document(pdf_path, work_dir, analyzer, timings, stages, ocr_preset)
+            if "process_pdf" in stages:
+                with fitz.open(pdf_path) as document:
+                    page_count = len(document)
+                _timed(timings, "process_pdf", page_count, process_pdf, pdf_path, work_dir, True, pii_count_file, analyzer, plot=False, ocr_preset=ocr_preset)
+        wall_seconds = time.perf_counter() - start
+
+    report = {
+        "documents": len(pdf_files),
+        "pages": total_pages,
+        "wall_seconds": wall_seconds,
+        "analyzer_load_seconds": analyzer_load_seconds(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": {},
+    }
+    for stage, timing in timings.items():
+        stage_seconds = sum(timing["latencies"])
+        report["stages"][stage] = {
+            "documents": len(timing["latencies"]),
+            "pages": timing["pages"],
+            "seconds": stage_seconds,
+            "pages_per_second": timing["pages"] / stage_seconds if stage_seconds else None,
+            "latency_seconds": _percentiles(timing["latencies"]),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PII redaction pipeline on a synthetic corpus.")
+    parser.add_argument("--corpus", help="corpus directory (generated into a temp directory if omitted)")
+    parser.add_argument("--generate", action="store_true", help="(re)generate the corpus into --corpus")
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--density", type=int, default=1, help="hits per page for each PII type")
+    parser.add_argument("--scanned-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("--ocr-preset", default=OCR_PRESET, choices=sorted(OCR_PRESETS))
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="pii_corpus_") as temp_corpus:
+        corpus_dir = args.corpus or temp_corpus
+        pii_count_file = os.path.join(corpus_dir, "pii_counts.txt")
+        if args.generate or not args.corpus or not os.path.exists(pii_count_file):
+            density = {entity_type: args.density for entity_type in GROUND_TRUTH_KEYS}
+            pii_count_file = generate_corpus(corpus_dir, args.documents, args.pages, density, args.scanned_ratio, args.seed)
+
+        report = run_benchmark(corpus_dir, pii_count_file, stages, ocr_preset=args.ocr_preset)
+        report["config"] = vars(args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
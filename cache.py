@@ -0,0 +1,173 @@
+'''
+File: cache.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+
+# Default limits used by evict()
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Stable hash of any JSON-serializable settings (patterns, entity lists, model names, ...)
+def config_fingerprint(*settings):
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=list).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Persistent cache of per-document work, keyed on content hashes.
+
+    Four kinds of entries are kept in a SQLite manifest under cache_dir:
+      - results: detected counts and output path for (input hash, detector
+        fingerprint, output fingerprint); a hit skips the document entirely
+      - ocr: a copy of the OCR'd searchable PDF for (input hash, OCR fingerprint)
+      - ocr_words: Tesseract's word boxes per scanned page for (input hash,
+        OCR fingerprint), used when scans are redacted without a searchable copy
+      - spans: per-page detections for (text-layer hash, detector fingerprint),
+        reused when only redaction or output settings changed
+    Every hit refreshes the entry's last-used time, which evict() uses for
+    age and size limits. One instance per process; SQLite serializes writers.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.ocr_dir = os.path.join(cache_dir, "ocr")
+        os.makedirs(self.ocr_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(cache_dir, "manifest.sqlite3"), timeout=30)
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    input_hash TEXT, detector TEXT, output TEXT,
+                    detected_counts TEXT, output_path TEXT, size INTEGER, last_used REAL,
+                    PRIMARY KEY (input_hash, detector, output));
+                CREATE TABLE IF NOT EXISTS ocr (
+                    input_hash TEXT, settings TEXT, path TEXT, size INTEGER, last_used REAL,
+                    PRIMARY KEY (input_hash, settings));
+                CREATE TABLE IF NOT EXISTS ocr_words (
+                    input_hash TEXT, settings TEXT, pages TEXT, size INTEGER, last_used REAL,
+                    PRIMARY KEY (input_hash, settings));
+                CREATE TABLE IF NOT EXISTS spans (
+                    text_hash TEXT, detector TEXT, pages TEXT, size INTEGER, last_used REAL,
+                    PRIMARY KEY (text_hash, detector));
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    def _touch(self, table, where, params):
+        with self.connection:
+            self.connection.execute(f"UPDATE {table} SET last_used = ? WHERE {where}", (time.time(),) + params)
+
+    def get_result(self, input_hash, detector, output):
+        row = self.connection.execute(
+            "SELECT detected_counts, output_path FROM results WHERE input_hash = ? AND detector = ? AND output = ?",
+            (input_hash, detector, output)).fetchone()
+        if row is None:
+            return None
+        detected_counts, output_path = json.loads(row[0]), row[1]
+        # A result is only reusable while its output file is still there
+        if output_path and not os.path.exists(output_path):
+            return None
+        self._touch("results", "input_hash = ? AND detector = ? AND output = ?", (input_hash, detector, output))
+        return detected_counts
+
+    def put_result(self, input_hash, detector, output, detected_counts, output_path):
+        data = json.dumps(detected_counts)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (input_hash, detector, output, data, output_path, len(data), time.time()))
+
+    def get_ocr(self, input_hash, settings):
+        row = self.connection.execute(
+            "SELECT path FROM ocr WHERE input_hash = ? AND settings = ?", (input_hash, settings)).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+        self._touch("ocr", "input_hash = ? AND settings = ?", (input_hash, settings))
+        return row[0]
+
+    def put_ocr(self, input_hash, settings, searchable_pdf_path):
+        cached_path = os.path.join(self.ocr_dir, f"{input_hash}_{settings[:16]}.pdf")
+        shutil.copyfile(searchable_pdf_path, cached_path)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?)",
+                (input_hash, settings, cached_path, os.path.getsize(cached_path), time.time()))
+        return cached_path
+
+    # Returns {page_num: (words, image_size, dpi, deskew_angle)} as taken by OcrTextIndex, or None
+    def get_ocr_words(self, input_hash, settings):
+        row = self.connection.execute(
+            "SELECT pages FROM ocr_words WHERE input_hash = ? AND settings = ?", (input_hash, settings)).fetchone()
+        if row is None:
+            return None
+        self._touch("ocr_words", "input_hash = ? AND settings = ?", (input_hash, settings))
+        return {int(page_num): tuple(page) for page_num, page in json.loads(row[0]).items()}
+
+    def put_ocr_words(self, input_hash, settings, pages):
+        data = json.dumps(pages)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ocr_words VALUES (?, ?, ?, ?, ?)",
+                (input_hash, settings, data, len(data), time.time()))
+
+    # Returns {page_num: [(detected_text, start, end, entity_type), ...]} or None
+    def get_spans(self, text_hash, detector):
+        row = self.connection.execute(
+            "SELECT pages FROM spans WHERE text_hash = ? AND detector = ?", (text_hash, detector)).fetchone()
+        if row is None:
+            return None
+        self._touch("spans", "text_hash = ? AND detector = ?", (text_hash, detector))
+        return {int(page_num): [tuple(span) for span in spans] for page_num, spans in json.loads(row[0]).items()}
+
+    def put_spans(self, text_hash, detector, pages):
+        data = json.dumps(pages)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO spans VALUES (?, ?, ?, ?, ?)",
+                (text_hash, detector, data, len(data), time.time()))
+
+    def evict(self, max_age_days=DEFAULT_MAX_AGE_DAYS, max_bytes=DEFAULT_MAX_BYTES):
+        """Drop entries unused for max_age_days, then the least recently used until under max_bytes."""
+        removed = 0
+        cutoff = time.time() - max_age_days * 86400
+        for path, in self.connection.execute("SELECT path FROM ocr WHERE last_used < ?", (cutoff,)).fetchall():
+            if os.path.exists(path):
+                os.remove(path)
+        with self.connection:
+            for table in ("results", "ocr", "ocr_words", "spans"):
+                removed += self.connection.execute(f"DELETE FROM {table} WHERE last_used < ?", (cutoff,)).rowcount
+
+        entries = self.connection.execute("""
+            SELECT 'ocr', rowid, size, last_used, path FROM ocr
+            UNION ALL SELECT 'ocr_words', rowid, size, last_used, NULL FROM ocr_words
+            UNION ALL SELECT 'spans', rowid, size, last_used, NULL FROM spans
+            UNION ALL SELECT 'results', rowid, size, last_used, NULL FROM results
+            ORDER BY last_used""").fetchall()
+        total = sum(entry[2] for entry in entries)
+        with self.connection:
+            for table, rowid, size, _, path in entries:
+                if total <= max_bytes:
+                    break
+                if path and os.path.exists(path):
+                    os.remove(path)
+                self.connection.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+                total -= size
+                removed += 1
+        return removed
@@ -7,34 +7,42 @@ Python Version: ^3.11
 Dependency Manager: Poetry
 '''
 
+import os
+import re
 import base64
+import zlib
+import fitz
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from encryption import derive_key, ENVELOPE_HEADER_PREFIX, ENVELOPE_RECORD_PREFIX, PAYLOAD_ATTACHMENT_NAME
+from metrics import log_verbose
+
+# Per-line attachments (one legacy record each) written by older versions
+LEGACY_ATTACHMENT_PATTERN = re.compile(r"encrypted_data_line_(\d+)\.txt")
+
+
+# PBKDF2 costs ~100k HMAC rounds; each (password, salt) pair is derived once per process
+@lru_cache(maxsize=1024)
+def cached_derive_key(password: str, salt: bytes) -> bytes:
+    return derive_key(password, salt)
 
 
 def decrypt_pii(encrypted_data: str, password: str):
     # Decode the base64 encoded data
     decoded_data = base64.b64decode(encrypted_data)
-    print(f"Encoded data length: {len(decoded_data)}")
     
     # Extract salt, iv, and encrypted part
     salt = decoded_data[:16]
     iv = decoded_data[16:32]
     encrypted = decoded_data[32:]
-    print(f"Salt length: {len(salt)}, IV length: {len(iv)}, Encrypted length: {len(encrypted)}")
+    log_verbose(f"Salt length: {len(salt)}, IV length: {len(iv)}, Encrypted length: {len(encrypted)}")
     
     # Derive the key using the same method as encryption
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    key = kdf.derive(password.encode())
+    key = cached_derive_key(password, salt)
 
     # Create a Cipher object for decryption
     cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
@@ -51,23 +59,145 @@ def decrypt_pii(encrypted_data: str, password: str):
     return decrypted_data.decode('utf-8')
 
 
-def decrypt_from_file(encrypted_file_path: str, password: str) -> list:
+# Unwrap the data key of an envelope header
+def unwrap_data_key(header: str, password: str) -> AESGCM:
+    decoded_header = base64.b64decode(header)
+    salt = decoded_header[:16]
+    wrap_nonce = decoded_header[16:28]
+    wrapped_key = decoded_header[28:]
+
+    data_key = AESGCM(cached_derive_key(password, salt)).decrypt(wrap_nonce, wrapped_key, None)
+    return AESGCM(data_key)
+
+
+def decrypt_envelope_record(record: str, aead: AESGCM) -> str:
+    decoded_data = base64.b64decode(record)
+    nonce = decoded_data[:12]
+    encrypted = decoded_data[12:]
+    return aead.decrypt(nonce, encrypted, None).decode('utf-8')
+
+
+# Failures are printed, or collected as messages when an errors list is passed
+def decrypt_lines(lines, password: str, errors: list = None) -> list:
     decrypted_lines = []
-    
-    with open(encrypted_file_path, 'r') as encrypted_file:
-        for line in encrypted_file:
-            line = line.strip()
-            try:
+    aead = None
+    header_failed = False
+
+    for line_num, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line.startswith(ENVELOPE_HEADER_PREFIX):
+                aead = None
+                header_failed = True
+                try:
+                    aead = unwrap_data_key(line[len(ENVELOPE_HEADER_PREFIX):], password)
+                except Exception as e:
+                    raise ValueError(f"cannot unwrap key (wrong password?): {type(e).__name__}") from e
+                header_failed = False
+                continue
+            if line.startswith(ENVELOPE_RECORD_PREFIX):
+                if aead is None:
+                    # A wrong password is reported once at the header, not once per record
+                    if header_failed:
+                        continue
+                    raise ValueError("envelope record without a key header")
+                decrypted_data = decrypt_envelope_record(line[len(ENVELOPE_RECORD_PREFIX):], aead)
+            else:
                 decrypted_data = decrypt_pii(line, password)
-                decrypted_lines.append(decrypted_data)
-            except Exception as e:
-                print(f"Error decrypting line: {e}")
+            decrypted_lines.append(decrypted_data)
+        except Exception as e:
+            message = f"line {line_num}: {type(e).__name__}: {e}"
+            if errors is None:
+                print(f"Error decrypting {message}")
+            else:
+                errors.append(message)
 
     return decrypted_lines
 
 
+def decrypt_from_file(encrypted_file_path: str, password: str) -> list:
+    with open(encrypted_file_path, 'r') as encrypted_file:
+        return decrypt_lines(encrypted_file, password)
+
+
+# Decrypt the compressed payload embedded in a redacted PDF
+def decrypt_payload(payload: bytes, password: str, errors: list = None) -> list:
+    return decrypt_lines(payload_lines(payload), password, errors)
+
+
+def payload_lines(payload: bytes) -> list:
+    return zlib.decompress(payload).decode('utf-8').splitlines()
+
+
+# Read every encrypted line embedded in a redacted PDF, in memory and in record order
+def read_encrypted_lines(pdf_path: str) -> list:
+    lines = []
+    with fitz.open(pdf_path) as pdf_document:
+        names = pdf_document.embfile_names()
+        if PAYLOAD_ATTACHMENT_NAME in names:
+            lines.extend(payload_lines(pdf_document.embfile_get(PAYLOAD_ATTACHMENT_NAME)))
+        legacy_names = sorted(
+            (int(match.group(1)), name) for name in names
+            if (match := LEGACY_ATTACHMENT_PATTERN.fullmatch(name)))
+        for _, name in legacy_names:
+            lines.extend(pdf_document.embfile_get(name).decode('utf-8').splitlines())
+    return lines
+
+
+def decrypt_pdf(pdf_path: str, password: str, errors: list = None) -> list:
+    return decrypt_lines(read_encrypted_lines(pdf_path), password, errors)
+
+
+# One document's result: {"records": [...], "errors": [...]}; never raises
+def decrypt_document(pdf_path: str, password: str) -> dict:
+    errors = []
+    try:
+        records = decrypt_pdf(pdf_path, password, errors)
+    except Exception as e:
+        records = []
+        errors.append(f"{type(e).__name__}: {e}")
+    return {"records": records, "errors": errors}
+
+
+def decrypt_documents(pdf_paths, password: str, workers: int = None) -> dict:
+    """Decrypt the embedded PII of many redacted PDFs.
+
+    Returns {pdf_path: {"records": [...], "errors": [...]}} in input order.
+    Every document carries its own key header, so the work is dominated by
+    one PBKDF2 per document (or per record for legacy lines); documents are
+    spread over a process pool when workers > 1.
+    """
+    pdf_paths = list(pdf_paths)
+    if workers is None:
+        workers = min(len(pdf_paths), os.cpu_count() or 1)
+    if workers <= 1 or len(pdf_paths) <= 1:
+        return {pdf_path: decrypt_document(pdf_path, password) for pdf_path in pdf_paths}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(decrypt_document, pdf_paths, [password] * len(pdf_paths), chunksize=4)
+        return dict(zip(pdf_paths, results))
+
+
+# Same as decrypt_documents for every PDF in a directory, keyed by file name
+def decrypt_directory(directory: str, password: str, workers: int = None) -> dict:
+    pdf_files = sorted(f for f in os.listdir(directory) if f.lower().endswith('.pdf'))
+    results = decrypt_documents([os.path.join(directory, f) for f in pdf_files], password, workers)
+    return {os.path.basename(pdf_path): result for pdf_path, result in results.items()}
+
+
 if __name__ == "__main__":
-    pdf_path = input("Enter the path to the PDF file: ")
+    pdf_path = input("Enter the path to the PDF file or directory: ")
     password = input("Enter the decryption password: ")
-    decrypted_pii = decrypt_pii(pdf_path, password)
+    if os.path.isdir(pdf_path):
+        results = decrypt_directory(pdf_path, password)
+    else:
+        results = {os.path.basename(pdf_path): decrypt_document(pdf_path, password)}
+    for document, result in results.items():
+        print(f"{document}: {len(result['records'])} records")
+        for record in result["records"]:
+            print(f"  {record}")
+        for error in result["errors"]:
+            print(f"  error: {error}")
     print("Decryption completed successfully.")
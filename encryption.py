@@ -8,121 +8,102 @@ Dependency Manager: Poetry
 '''
 
 import os
-from pikepdf import Pdf, AttachedFileSpec
-from pathlib import Path
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import base64
+import zlib
 
+# PBKDF2 work factor shared by the legacy and envelope formats
+KDF_ITERATIONS = 100000
 
-def encrypt_pii(pii_data: str, password: str, output_dir: str) -> str:
-    # Generate a random salt
-    salt = os.urandom(16)  # Random salt for KDF
-    # Derive key from password
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    key = kdf.derive(password.encode())
-
-    # Generate a random IV
-    iv = os.urandom(16)  # Random IV for AES
+# Line prefixes of the envelope format. A header line carries the KDF salt
+# and the wrapped data key; every record line after it is encrypted with
+# that data key until the next header. Lines without a prefix are legacy
+# records, each with its own salt (see decryption.decrypt_pii).
+ENVELOPE_HEADER_PREFIX = "v2-key:"
+ENVELOPE_RECORD_PREFIX = "v2:"
 
-    # Create a Cipher object
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
+# Embedded file holding one document's encrypted records (zlib-compressed lines)
+PAYLOAD_ATTACHMENT_NAME = "encrypted_pii"
+PAYLOAD_FILENAME = "encrypted_pii.txt.zlib"
 
-    # Pad the data to be a multiple of the block size
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_data = padder.update(pii_data.encode()) + padder.finalize()
 
-    # Encrypt the padded data
-    encrypted = encryptor.update(padded_data) + encryptor.finalize()
-
-    # Encode the output for storage
-    encrypted_data = base64.b64encode(salt + iv + encrypted).decode('utf-8')
-
-    # Create a unique output file name based on the date or PDF name
-    encrypted_file_path = os.path.join(output_dir, "all_encrypted_pii.txt")
-
-    # Write encrypted data to the same file
-    with open(encrypted_file_path, 'a') as encrypted_file:
-        encrypted_file.write(encrypted_data + '\n')
-    
-    print(f"Encrypted data appended to {encrypted_file_path}")
-    
-    return encrypted_file_path
-
-def encrypt_pii(pii_data: str, password: str, output_dir: str) -> str:
-    # Generate a random salt
-    salt = os.urandom(16)  # Random salt for KDF
-    # Derive key from password
+def derive_key(password: str, salt: bytes) -> bytes:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=100000,
+        iterations=KDF_ITERATIONS,
         backend=default_backend()
     )
-    key = kdf.derive(password.encode())
-
-    # Generate a random IV
-    iv = os.urandom(16)  # Random IV for AES
-
-    # Create a Cipher object
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-
-    # Pad the data
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_data = padder.update(pii_data.encode()) + padder.finalize()
-
-    # Encrypt the padded data
-    encrypted = encryptor.update(padded_data) + encryptor.finalize()
-
-    # Combine the salt, IV, and encrypted data for output
-    encrypted_data = salt + iv + encrypted
-
-    # Encode the output for storage
-    encoded_data = base64.b64encode(encrypted_data).decode('utf-8')
-
-    # Create a unique output file name
-    encrypted_file_path = os.path.join(output_dir, "all_encrypted_pii.txt")
-
-    # Write encrypted data to the file
-    with open(encrypted_file_path, 'a') as encrypted_file:
-        encrypted_file.write(encoded_data + '\n')
-    
-    print(f"Encrypted data appended to {encrypted_file_path}")
-    
-    return encrypted_file_path
-
-def attach_each_line_to_pdf(pdf_path: str, encrypted_file_path: str):
-    with Pdf.open(pdf_path, allow_overwriting_input=True) as pdf:
-        # Open the encrypted file and read line by line
-        with open(encrypted_file_path, 'r') as encrypted_file:
-            for index, line in enumerate(encrypted_file, start=1):
-                # Naming each attachment uniquely
-                attachment_name = f"encrypted_data_line_{index}.txt"
-                # Create an AttachedFileSpec from the line data
-                temp_file_path = Path(fr'C:\Users\HP\Downloads\Harihar Jeevan\Sem 3\Sample\temp\temp_{index}.txt')
-               
-                with open(temp_file_path, 'w') as temp_file:
-                    temp_file.write(line)
-
-                # Create an AttachedFileSpec from the temporary file
-                filespec = AttachedFileSpec.from_filepath(pdf, temp_file_path)
-                # Attach to the PDF
-                pdf.attachments[attachment_name] = filespec
-
-        pdf.save(pdf_path)
-    print(f"All lines from {encrypted_file_path} attached to {pdf_path}")
-
-
-
+    return kdf.derive(password.encode())
+
+class EnvelopeEncryptor:
+    """Encrypts PII items with a per-run data key wrapped by one password-derived key.
+
+    PBKDF2 runs once when the encryptor is created; each item then costs one
+    AES-GCM operation with a fresh 12-byte nonce. Records are buffered until
+    take_payload() returns them as one compressed blob for embedding. Each record
+    keeps the page, entity type and offsets it was encrypted with, which
+    entries() hands to the vault (see vault.py).
+    """
+
+    def __init__(self, password: str, header: str = None):
+        if header is None:
+            self.salt = os.urandom(16)
+            key_encryption_key = derive_key(password, self.salt)
+
+            # Random data key, stored only in wrapped form next to the records
+            data_key = AESGCM.generate_key(bit_length=256)
+            wrap_nonce = os.urandom(12)
+            wrapped_key = AESGCM(key_encryption_key).encrypt(wrap_nonce, data_key, None)
+            self.header = base64.b64encode(self.salt + wrap_nonce + wrapped_key).decode('utf-8')
+        else:
+            # Continue under the data key of an earlier header, e.g. when a run is resumed
+            decoded_header = base64.b64decode(header)
+            self.salt = decoded_header[:16]
+            data_key = AESGCM(derive_key(password, self.salt)).decrypt(decoded_header[16:28], decoded_header[28:], None)
+            self.header = header
+
+        self.aead = AESGCM(data_key)
+        self.records = []
+        self.positions = []
+
+    def encrypt(self, pii_data: str, page: int = None, entity_type: str = None, start: int = None, end: int = None) -> str:
+        nonce = os.urandom(12)
+        encrypted = self.aead.encrypt(nonce, pii_data.encode(), None)
+        record = base64.b64encode(nonce + encrypted).decode('utf-8')
+        self.records.append(record)
+        self.positions.append((page, entity_type, start, end))
+        return record
+
+    # Buffered (record, page, entity_type, start, end) tuples; the buffer is left as it is
+    def entries(self):
+        return [(record,) + position for record, position in zip(self.records, self.positions)]
+
+    def take_payload(self):
+        # Returns the buffered records as compressed bytes and clears the buffer, or None if empty
+        if not self.records:
+            return None
+        payload = build_payload(self.header, self.records)
+        self.records = []
+        self.positions = []
+        return payload
+
+# Compressed payload of one key header and the records encrypted under it (see take_payload)
+def build_payload(header: str, records: list) -> bytes:
+    lines = [ENVELOPE_HEADER_PREFIX + header] + [ENVELOPE_RECORD_PREFIX + record for record in records]
+    return zlib.compress('\n'.join(lines).encode('utf-8'))
+
+# Embed a take_payload() blob into an open PyMuPDF document; it is written by the next save
+def embed_payload(pdf_document, payload: bytes):
+    if PAYLOAD_ATTACHMENT_NAME in pdf_document.embfile_names():
+        pdf_document.embfile_del(PAYLOAD_ATTACHMENT_NAME)
+    pdf_document.embfile_add(
+        PAYLOAD_ATTACHMENT_NAME,
+        payload,
+        filename=PAYLOAD_FILENAME,
+        desc="Encrypted PII removed from this document",
+    )
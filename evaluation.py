@@ -0,0 +1,163 @@
+'''
+File: evaluation.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import csv
+import json
+import argparse
+from analyzer import get_analyzer
+from cache import ResultCache
+from main import EXPECTED_TO_DETECTED_TYPES, load_pii_counts, process_pdf, process_files_in_parallel
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+def evaluate_corpus(ground_truth, detected_by_document):
+    """Compare detected counts with the ground truth over a whole corpus.
+
+    ground_truth is load_pii_counts() output; detected_by_document maps a
+    file name to its detected counts. Only documents present in both are
+    scored. Counts carry no positions, so per document and type
+    min(detected, expected) counts as true positives, any excess as false
+    positives and any shortfall as false negatives. A type detected in a
+    document whose ground truth does not list it is expected 0 times there.
+    Returns a report dict with per-type totals and a row per (document, type).
+    """
+    totals = {}
+    rows = []
+    scored_documents = sorted(set(ground_truth) & set(detected_by_document))
+    detected_to_expected = {detected_type: expected_type for expected_type, detected_type in EXPECTED_TO_DETECTED_TYPES.items()}
+
+    for document in scored_documents:
+        detected_counts = detected_by_document[document]
+        expected_counts = dict(ground_truth[document])
+        for detected_type, detected in sorted(detected_counts.items()):
+            expected_type = detected_to_expected.get(detected_type, detected_type)
+            if detected and expected_type not in expected_counts:
+                expected_counts[expected_type] = 0
+        for expected_type, expected in expected_counts.items():
+            detected_type = EXPECTED_TO_DETECTED_TYPES.get(expected_type, expected_type)
+            detected = detected_counts.get(detected_type, 0)
+            true_positives = min(detected, expected)
+            row = {
+                "document": document,
+                "pii_type": expected_type,
+                "expected": expected,
+                "detected": detected,
+                "true_positives": true_positives,
+                "false_positives": max(0, detected - expected),
+                "false_negatives": max(0, expected - detected),
+            }
+            rows.append(row)
+            total = totals.setdefault(expected_type, {"expected": 0, "detected": 0, "true_positives": 0, "false_positives": 0, "false_negatives": 0})
+            for key in total:
+                total[key] += row[key]
+
+    for total in totals.values():
+        total["precision"] = _ratio(total["true_positives"], total["true_positives"] + total["false_positives"])
+        total["recall"] = _ratio(total["true_positives"], total["true_positives"] + total["false_negatives"])
+        # Same definition as calculate_accuracy_and_false_positives, over the whole corpus
+        total["accuracy"] = 100 * total["true_positives"] / total["expected"] if total["expected"] else 0
+
+    return {
+        "documents_scored": len(scored_documents),
+        "documents_without_ground_truth": sorted(set(detected_by_document) - set(ground_truth)),
+        "by_type": totals,
+        "by_document": rows,
+    }
+
+def write_csv(report, csv_path):
+    fieldnames = ["document", "pii_type", "expected", "detected", "true_positives", "false_positives", "false_negatives"]
+    with open(csv_path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(report["by_document"])
+        for pii_type, total in sorted(report["by_type"].items()):
+            writer.writerow({"document": "TOTAL", "pii_type": pii_type, **{key: total[key] for key in fieldnames[2:]}})
+
+def write_json(report, json_path):
+    with open(json_path, 'w') as json_file:
+        json.dump(report, json_file, indent=2)
+
+def save_chart(report, chart_path):
+    # Non-interactive backend: the chart is written to a file, never shown
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    labels = sorted(report["by_type"])
+    if not labels:
+        print("No data to plot.")
+        return
+    x = range(len(labels))
+    width = 0.27
+
+    figure, axis = plt.subplots(figsize=(10, 6))
+    axis.bar([p - width for p in x], [100 * (report["by_type"][t]["precision"] or 0) for t in labels], width=width, label='Precision (%)', color='skyblue')
+    axis.bar(list(x), [100 * (report["by_type"][t]["recall"] or 0) for t in labels], width=width, label='Recall (%)', color='seagreen')
+    axis.bar([p + width for p in x], [report["by_type"][t]["false_positives"] for t in labels], width=width, label='False Positives', color='salmon')
+    axis.set_title(f"PII Detection over {report['documents_scored']} documents")
+    axis.set_ylabel("Count / Percentage")
+    axis.set_xticks(list(x))
+    axis.set_xticklabels(labels)
+    axis.legend()
+    axis.grid(axis='y')
+    figure.savefig(chart_path, bbox_inches='tight')
+    plt.close(figure)
+
+def run_evaluation(input_directory, output_directory, pii_count_file, report_directory, workers=1, cache_dir=None):
+    """Process a labelled corpus headlessly and write evaluation.csv, evaluation.json and evaluation.png."""
+    os.makedirs(output_directory, exist_ok=True)
+    os.makedirs(report_directory, exist_ok=True)
+    ground_truth = load_pii_counts(pii_count_file)
+    detected_by_document = {}
+    failed = {}
+
+    if workers == 1:
+        analyzer = get_analyzer()
+        cache = ResultCache(cache_dir) if cache_dir else None
+        for filename in sorted(f for f in os.listdir(input_directory) if f.lower().endswith('.pdf')):
+            try:
+                pdf_path = os.path.join(input_directory, filename)
+                detected_by_document[filename] = process_pdf(pdf_path, output_directory, True, pii_count_file, analyzer, plot=False, cache=cache,
+                                                            strict=True)
+            except Exception as e:
+                failed[filename] = f"{type(e).__name__}: {e}"
+        if cache is not None:
+            cache.close()
+    else:
+        for filename, detected_counts, error in process_files_in_parallel(input_directory, output_directory, True, pii_count_file, workers, cache_dir=cache_dir,
+                                                                          strict=True):
+            if error:
+                failed[filename] = error
+            else:
+                detected_by_document[filename] = detected_counts
+
+    report = evaluate_corpus(ground_truth, detected_by_document)
+    report["failed_documents"] = failed
+    write_csv(report, os.path.join(report_directory, "evaluation.csv"))
+    write_json(report, os.path.join(report_directory, "evaluation.json"))
+    save_chart(report, os.path.join(report_directory, "evaluation.png"))
+    print(f"Evaluation of {report['documents_scored']} documents written to {os.path.normpath(report_directory)}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate PII detection over a labelled corpus without interactive plots.")
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("pii_count_file")
+    parser.add_argument("--report-directory", help="where evaluation.csv/.json/.png go (default: output directory)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--cache-dir")
+    args = parser.parse_args()
+    run_evaluation(args.input_directory, args.output_directory, args.pii_count_file,
+                   args.report_directory or args.output_directory, args.workers, args.cache_dir)
+
+if __name__ == "__main__":
+    main()
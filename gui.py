@@ -7,11 +7,27 @@ Dependency Manager: Poetry
 '''
 
 import os
+import time
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, simpledialog
-from decryption import decrypt_pii
-from main import process_pdf
-from pikepdf import Pdf
+from decryption import decrypt_document, decrypt_directory
+from main import process_pdf, ProcessingCancelled
+from analyzer import get_analyzer
+from metrics import metrics
+
+# How often the Tk loop drains the worker's progress queue (milliseconds)
+POLL_INTERVAL_MS = 100
+
+# Share of one file's progress bar segment covered by each stage; documents
+# without image-only pages skip "ocr" and jump straight to "redaction"
+STAGE_SPANS = {
+    "searchability": (0.0, 0.05),
+    "ocr": (0.05, 0.6),
+    "redaction": (0.6, 1.0),
+}
+STAGE_NAMES = {"searchability": "Checking pages", "ocr": "OCR", "redaction": "Redacting"}
 
 class PII_Redaction_Tool:
     def __init__(self, master):
@@ -49,11 +65,21 @@ class PII_Redaction_Tool:
 
         # Progress Bar
         self.progress_bar = ttk.Progressbar(master, length=400, mode='determinate')
-        self.progress_bar.pack(pady=20)
+        self.progress_bar.pack(pady=(20, 5))
+
+        # Current file/stage and throughput/ETA
+        self.status_label = tk.Label(master, text="", fg="#FFFFFF", bg="#001219", font=("Helvetica", 10))
+        self.status_label.pack()
+        self.rate_label = tk.Label(master, text="", fg="#FFFFFF", bg="#001219", font=("Helvetica", 10))
+        self.rate_label.pack()
 
-        # Process Button
-        self.process_button = tk.Button(master, text="Process Files", command=self.process_files, bg="#FFD700", fg="#2E2E2E", relief="flat", font=("Helvetica", 14, "bold"))
-        self.process_button.pack(pady=20)
+        # Process and Cancel Buttons
+        self.button_frame = tk.Frame(master, bg="#001219")
+        self.button_frame.pack(pady=20)
+        self.process_button = tk.Button(self.button_frame, text="Process Files", command=self.process_files, bg="#FFD700", fg="#2E2E2E", relief="flat", font=("Helvetica", 14, "bold"))
+        self.process_button.pack(side="left", padx=10)
+        self.cancel_button = tk.Button(self.button_frame, text="Cancel", command=self.cancel_processing, state="disabled", bg="#AE2012", fg="#FFFFFF", relief="flat", font=("Helvetica", 14, "bold"))
+        self.cancel_button.pack(side="left", padx=10)
 
         # Menu Bar for Decryption
         self.menu_bar = tk.Menu(master)
@@ -63,11 +89,18 @@ class PII_Redaction_Tool:
         self.decrypt_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="Decrypt", menu=self.decrypt_menu)
         self.decrypt_menu.add_command(label="Decrypt PII", command=self.open_decrypt_dialog)
+        self.decrypt_menu.add_command(label="Decrypt Folder", command=self.open_decrypt_folder_dialog)
 
         self.input_directory = None
         self.output_directory = None
         self.selected_pdf = None
 
+        # Background processing state; Tk widgets are only touched from the main thread
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+
     def browse_input_directory(self):
         self.input_directory = filedialog.askdirectory()
         if self.input_directory:
@@ -89,52 +122,202 @@ class PII_Redaction_Tool:
             messagebox.showwarning("Redaction Required", "You must check 'Redact PII' to proceed with file processing.")
             return
 
+        if self.worker is not None and self.worker.is_alive():
+            return
+
         try:
             pdf_files = [f for f in os.listdir(self.input_directory) if f.lower().endswith('.pdf')]
-            total_files = len(pdf_files)
-            self.progress_bar['maximum'] = total_files
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            return
+
+        pii_count_file = r'C:\Users\HP\Downloads\Harihar Jeevan\Sem 3\Sample\PII Count.txt'  # Ensure this path is correct
 
-            pii_count_file = r'C:\Users\HP\Downloads\Harihar Jeevan\Sem 3\Sample\PII Count.txt'  # Ensure this path is correct
+        # One bar unit per file; stages fill it in fractions (see STAGE_SPANS)
+        self.total_files = len(pdf_files)
+        self.progress_bar['maximum'] = max(1, self.total_files)
+        self.progress_bar['value'] = 0
+        self.pages_done = 0
+        self.errors = []
+        self.start_time = time.perf_counter()
+        self.status_label.config(text="Starting...")
+        self.rate_label.config(text="")
+        self.process_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+
+        # Processing runs off the Tk thread; progress comes back through progress_queue
+        self.cancel_event.clear()
+        self.worker = threading.Thread(target=self._process_files_worker, args=(pdf_files, redact_pii, pii_count_file), daemon=True)
+        self.worker.start()
+        self.master.after(POLL_INTERVAL_MS, self._poll_progress)
+
+    # Runs on the worker thread: must not touch any widget, only the queue
+    def _process_files_worker(self, pdf_files, redact_pii, pii_count_file):
+        try:
+            self.progress_queue.put(("status", "Loading analyzer..."))
+            # Loaded once and kept warm across runs of the Process button
+            analyzer = get_analyzer()
 
             for idx, pdf_file in enumerate(pdf_files):
+                if self.cancel_event.is_set():
+                    break
                 file_path = os.path.join(self.input_directory, pdf_file)
+                self.progress_queue.put(("file", idx, pdf_file))
 
                 if not os.path.exists(file_path):
-                    messagebox.showwarning("File Error", f"The file '{pdf_file}' does not exist.")
+                    self.progress_queue.put(("error", pdf_file, "The file does not exist."))
                     continue
 
+                # Checked at every page boundary, so cancelling never waits for a whole document
+                def progress(stage, done, total, idx=idx):
+                    if self.cancel_event.is_set():
+                        raise ProcessingCancelled()
+                    self.progress_queue.put(("progress", idx, stage, done, total))
+
+                # strict: a document that failed raises ProcessingFailed and is listed with the errors
                 try:
-                    process_pdf(file_path, self.output_directory, redact_pii, pii_count_file)
+                    process_pdf(file_path, self.output_directory, redact_pii, pii_count_file, analyzer, plot=False, progress=progress, strict=True)
+                except ProcessingCancelled:
+                    break
                 except Exception as e:
-                    messagebox.showerror("Processing Error", f"An error occurred while processing '{pdf_file}': {e}")
-                    continue
+                    self.progress_queue.put(("error", pdf_file, str(e)))
+                finally:
+                    metrics.flush()
+                self.progress_queue.put(("file_done", idx))
+        except Exception as e:
+            self.progress_queue.put(("error", None, str(e)))
+        finally:
+            self.progress_queue.put(("finished", self.cancel_event.is_set()))
+
+    # Runs on the Tk thread every POLL_INTERVAL_MS while a worker is active
+    def _poll_progress(self):
+        try:
+            while True:
+                message = self.progress_queue.get_nowait()
+                if message[0] == "finished":
+                    self._processing_finished(cancelled=message[1])
+                    return
+                self._handle_progress(message)
+        except queue.Empty:
+            pass
+        self.master.after(POLL_INTERVAL_MS, self._poll_progress)
+
+    def _handle_progress(self, message):
+        kind = message[0]
+        if kind == "status":
+            self.status_label.config(text=message[1])
+        elif kind == "file":
+            _, idx, pdf_file = message
+            self.progress_bar['value'] = idx
+            self.status_label.config(text=f"File {idx + 1}/{self.total_files}: {pdf_file}")
+        elif kind == "progress":
+            _, idx, stage, done, total = message
+            start, end = STAGE_SPANS[stage]
+            # Direct OCR alternates "ocr" and "redaction" chunk by chunk; the bar never moves back
+            self.progress_bar['value'] = max(self.progress_bar['value'], idx + start + (end - start) * done / max(1, total))
+            if stage == "redaction":
+                self.pages_done += 1
+            if stage != "searchability" and done < total:
+                self.status_label.config(text=f"File {idx + 1}/{self.total_files}: {STAGE_NAMES[stage]} page {done}/{total}")
+            self._update_rate()
+        elif kind == "file_done":
+            self.progress_bar['value'] = message[1] + 1
+            self._update_rate()
+        elif kind == "error":
+            _, pdf_file, error = message
+            self.errors.append(f"{pdf_file}: {error}" if pdf_file else error)
 
-                self.progress_bar['value'] = idx + 1
-                self.master.update()
+    def _update_rate(self):
+        elapsed = time.perf_counter() - self.start_time
+        fraction = self.progress_bar['value'] / self.progress_bar['maximum']
+        if elapsed <= 0 or fraction <= 0:
+            return
+        eta = elapsed * (1 - fraction) / fraction
+        minutes, seconds = divmod(int(eta), 60)
+        self.rate_label.config(text=f"{self.pages_done / elapsed:.1f} pages/s - ETA {minutes:02d}:{seconds:02d}")
 
+    def _processing_finished(self, cancelled):
+        self.process_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        elapsed = time.perf_counter() - self.start_time
+        self.rate_label.config(text=f"{self.pages_done} pages in {elapsed:.1f}s")
+        if cancelled:
+            self.status_label.config(text="Cancelled")
+            messagebox.showinfo("Cancelled", "Processing was cancelled.")
+        elif self.errors:
+            self.status_label.config(text=f"Finished with {len(self.errors)} error(s)")
+            messagebox.showerror("Processing Error", "Some files could not be processed:\n" + "\n".join(self.errors))
+        else:
+            self.status_label.config(text="Done")
             messagebox.showinfo("Success", "Processing completed successfully.")
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {e}")
-            self.progress_bar['value'] = 0
-            self.master.update()
+
+    def cancel_processing(self):
+        if self.worker is not None and self.worker.is_alive():
+            self.cancel_event.set()
+            self.cancel_button.config(state="disabled")
+            self.status_label.config(text="Cancelling after the current page...")
+
+    def on_close(self):
+        # The worker is a daemon thread; stop it at the next page and close right away
+        self.cancel_event.set()
+        self.master.destroy()
 
     def open_decrypt_dialog(self):
-        decrypt_window = tk.Toplevel(self.master)
-        decrypt_window.title("Decrypt PII")
-        
         pdf_file_path = filedialog.askopenfilename(filetypes=[("PDF Files", "*.pdf")])
         if pdf_file_path:
             password = simpledialog.askstring("Password", "Enter the decryption password:", show='*')
             if password:
                 self.decrypt_pii_files(pdf_file_path, password)
 
-    def decrypt_pii_files(self, pdf_file_path, password):
-        try:
-            decrypted_pii = decrypt_pii(pdf_file_path, password)
-            messagebox.showinfo("Success", "Decryption completed successfully!")
-            # Optionally, display the decrypted PII or save it as needed
-        except Exception as e:
-            messagebox.showerror("Decryption Error", f"An error occurred: {e}")
+    def open_decrypt_folder_dialog(self):
+        directory = filedialog.askdirectory()
+        if directory:
+            password = simpledialog.askstring("Password", "Enter the decryption password:", show='*')
+            if password:
+                self.decrypt_pii_files(directory, password)
+
+    # Decrypts on a background thread (a folder can hold hundreds of PDFs) and shows the records when done
+    def decrypt_pii_files(self, path, password):
+        results = {}
+
+        def decrypt():
+            try:
+                if os.path.isdir(path):
+                    results.update(decrypt_directory(path, password))
+                else:
+                    results[os.path.basename(path)] = decrypt_document(path, password)
+            except Exception as e:
+                results[None] = {"records": [], "errors": [str(e)]}
+
+        worker = threading.Thread(target=decrypt, daemon=True)
+        worker.start()
+
+        def wait_for_results():
+            if worker.is_alive():
+                self.master.after(POLL_INTERVAL_MS, wait_for_results)
+            elif None in results:
+                messagebox.showerror("Decryption Error", f"An error occurred: {results[None]['errors'][0]}")
+            else:
+                self.show_decrypted_pii(results)
+
+        self.master.after(POLL_INTERVAL_MS, wait_for_results)
+
+    def show_decrypted_pii(self, results):
+        decrypt_window = tk.Toplevel(self.master)
+        decrypt_window.title("Decrypted PII")
+        text = tk.Text(decrypt_window, width=80, height=30)
+        scrollbar = tk.Scrollbar(decrypt_window, command=text.yview)
+        text.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        text.pack(side="left", fill="both", expand=True)
+
+        for document, result in results.items():
+            text.insert("end", f"{document} ({len(result['records'])} records)\n")
+            for record in result["records"]:
+                text.insert("end", f"    {record}\n")
+            for error in result["errors"]:
+                text.insert("end", f"    error: {error}\n")
+        text.config(state="disabled")
 
 if __name__ == "__main__":
     root = tk.Tk()
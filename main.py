@@ -7,72 +7,125 @@ Dependency Manager: Poetry
 
 '''
 import os
+import time
 import fitz
-import pdfplumber
 import re
 import shutil
-import cv2
-import pytesseract
-import pdf2image
-import matplotlib.pyplot as plt
-import re
-from encryption import encrypt_pii
-from encryption import attach_each_line_to_pdf
-from presidio_analyzer import AnalyzerEngine
-from presidio_analyzer.nlp_engine import NlpEngineProvider
-
-# Set the Tesseract executable path
-TESSERACT_PATH = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-# Check if Tesseract executable exists
-if not os.path.exists(TESSERACT_PATH):
-    raise RuntimeError(f"Tesseract executable not found at {TESSERACT_PATH}")
-
-# Set the tesseract command path
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
-
-# Define PII regex patterns
-AADHAAR_PATTERN = r'\b(?:\d{4}[-\s]?){2}\d{4}|\b\d{12}\b'
-PAN_PATTERN = r"\b[A-Z]{5}\d{4}[A-Z]{1}\b"
-EMAIL_PATTERN = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
-#DOB_PATTERN = r'\b(?:\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{2,4}[/-]\d{1,2}[/-]\d{1,2})\b'
-PHONE_PATTERN = r'(?:(?:\+\d{1,3})?\s?\(?\d{1,4}?\)?[\s.-]?\d{1,4}[\s.-]?\d{1,4}[\s.-]?\d{1,9})'
-
-
-# Initialize Presidio analyzer
-def create_analyzer():
-    nlp_provider = NlpEngineProvider().create_engine()
-    analyzer = AnalyzerEngine(nlp_engine=nlp_provider)
-    return analyzer
+import threading
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from encryption import EnvelopeEncryptor, embed_payload
+from analyzer import ANALYZER_ENTITIES, SPACY_MODEL, EXCLUDED_PIPES, get_analyzer, analyzer_load_seconds
+from analyzer import NLP_BATCH_SIZE, NLP_PROCESSES, analyze_texts
+from scanner import PII_PATTERNS
+from scanner import ENTITY_PRIORITY, SCANNER_SCORE, is_valid_pii, may_contain_pii, resolve_overlaps, scan_text
+from page_index import PageTextIndex, OcrTextIndex
+from metrics import metrics, log_verbose
+from cache import ResultCache, file_hash, config_fingerprint
+from vault import PiiVault
+from preprocessing import OCR_PRESET, OCR_PRESETS, preprocess_page_image
+
+# Tesseract is located on first OCR, not at import: an explicit TESSERACT_PATH
+# (or the TESSERACT_CMD environment variable) wins, then 'tesseract' on PATH,
+# then the default Windows install location.
+TESSERACT_PATH = os.environ.get("TESSERACT_CMD")
+TESSERACT_WINDOWS_PATH = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+_tesseract_lock = threading.Lock()
+_tesseract_cmd = None
+
+# Entity types taken straight from the regex scanner; the rest come from Presidio
+SCANNER_ENTITIES = {"AADHAR", "PAN"}
+
+# OCR settings for scanned PDFs; rendering DPI and image cleanup come from
+# the preset (see preprocessing.OCR_PRESETS)
+OCR_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# A page is OCR'd when it has fewer text characters than OCR_MIN_TEXT_CHARS
+# and images cover at least OCR_MIN_IMAGE_COVERAGE of its area
+OCR_MIN_TEXT_CHARS = 20
+OCR_MIN_IMAGE_COVERAGE = 0.3
+
+# Scanned pages are redacted straight from Tesseract's word boxes, without
+# writing and re-parsing a searchable copy. False redacts a searchable copy
+# instead, so redacted scans keep Tesseract's text layer.
+OCR_DIRECT_DETECTION = True
+
+# How redacted PDFs are written:
+#   "compact"     - full rewrite with unused objects dropped and streams deflated
+#   "incremental" - appends only the changed objects; fastest, but the original
+#                   objects stay in the file, so use it only where that is acceptable
+REDACTED_SAVE_MODE = "compact"
+
+# Text-layer documents whose pages share NLP batches in process_files_in_directory
+DOCUMENT_BATCH_SIZE = 8
+
+# Cache keys: anything that changes what is detected, or what OCR produces
+DETECTOR_FINGERPRINT = config_fingerprint(PII_PATTERNS, sorted(SCANNER_ENTITIES), ANALYZER_ENTITIES, SPACY_MODEL, EXCLUDED_PIPES, ENTITY_PRIORITY)
+def ocr_fingerprint(preset=OCR_PRESET):
+    return config_fingerprint(OCR_MIN_TEXT_CHARS, OCR_MIN_IMAGE_COVERAGE, preset, OCR_PRESETS[preset])
+
+OCR_FINGERPRINT = ocr_fingerprint()
+
+
+# Raised from a progress callback to stop processing at the next page boundary
+class ProcessingCancelled(Exception):
+    pass
+
+# Raised by process_pdf(strict=True) when a document could not be processed
+class ProcessingFailed(Exception):
+    pass
+
+# Progress callbacks are called as progress(stage, done, total) after each
+# page of the "ocr" and "redaction" stages, and once for "searchability"
+def report_progress(progress, stage, done, total):
+    if progress is not None:
+        progress(stage, done, total)
+
 
 def normalize_text(text):
     return re.sub(r'\s+', ' ', text).strip()
 
-# Load PII counts from a text file
+# Map expected PII types (as written in the PII count file) to detected PII types
+EXPECTED_TO_DETECTED_TYPES = {
+    "EMAIL": "EMAIL_ADDRESS",
+    "PHONE": "PHONE_NUMBER",
+    "PAN": "PAN"
+    # "DOB": "DOB"
+}
+
+# Parsed PII count files keyed on (path, modification time)
+_pii_counts_cache = {}
+
+# Load PII counts from a text file; the file is parsed once until it changes
 def load_pii_counts(pii_count_file):
+    try:
+        cache_key = (os.path.abspath(pii_count_file), os.path.getmtime(pii_count_file))
+    except OSError:
+        cache_key = None
+    if cache_key in _pii_counts_cache:
+        return _pii_counts_cache[cache_key]
+
     pii_counts = {}
     try:
         with open(pii_count_file, 'r') as file:
             for line in file:
+                if not line.strip():
+                    continue
                 parts = line.strip().split(',')
                 document = parts[0].strip()
-                counts = {p.split('=')[0]: int(p.split('=')[1]) for p in parts[1:]}
+                counts = {p.split('=')[0].strip(): int(p.split('=')[1]) for p in parts[1:]}
                 pii_counts[document] = counts
+        _pii_counts_cache[cache_key] = pii_counts
     except FileNotFoundError:
         print(f"PII count file {pii_count_file} not found.")
     except Exception as e:
         print(f"Error reading PII count file: {e}")
     return pii_counts
 
-# Calculate accuracy and false positives based on expected and detected counts
 # Calculate accuracy and false positives based on expected and detected counts
 def calculate_accuracy_and_false_positives(detected_counts, expected_counts):
-    # Map expected PII types to detected PII types
-    pii_mapping = {
-        "EMAIL": "EMAIL_ADDRESS",
-        "PHONE": "PHONE_NUMBER",
-        "PAN": "PAN"
-        # "DOB": "DOB"
-    }
+    pii_mapping = EXPECTED_TO_DETECTED_TYPES
     
     accuracies = {}
     false_positives = {}
@@ -100,6 +153,9 @@ def calculate_accuracy_and_false_positives(detected_counts, expected_counts):
 
 # Plot accuracy results
 def plot_accuracy_and_false_positives(accuracies, false_positives, document_name):
+    # matplotlib is only loaded when a plot is actually requested
+    import matplotlib.pyplot as plt
+
     # Prepare data for plotting
     labels = list(accuracies.keys())
     accuracy_values = list(accuracies.values())
@@ -129,222 +185,658 @@ def plot_accuracy_and_false_positives(accuracies, false_positives, document_name
     plt.grid(axis='y')
     plt.show()
 
-def image_conversion(inpath, image_path):
-    print("Converting PDF to images")
-    
-    OUTPUT_FOLDER = image_path
-    FIRST_PAGE = None
-    LAST_PAGE = None
-    FORMAT = 'jpeg'
-    USERPWD = None
-    USE_CROPBOX = False
-    STRICT = False
-
-    pil_images = pdf2image.convert_from_path(
-        inpath,
-        output_folder=OUTPUT_FOLDER,
-        first_page=FIRST_PAGE,
-        last_page=LAST_PAGE,
-        fmt=FORMAT,
-        userpw=USERPWD,
-        use_cropbox=USE_CROPBOX,
-        strict=STRICT
-    )
-
-    for i, image in enumerate(pil_images):
-        image.save(f'{image_path}image_converted_{i + 1}.jpg', 'JPEG')
-
-    return len(pil_images)  # Return the number of images generated
-
-def images_to_searchable_pdf(input_image_path, output_pdf_path):
-    # Read the image using OpenCV
-    img = cv2.imread(input_image_path)
-
-    # Convert BGR to RGB
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # Use Tesseract to convert the RGB image to PDF
-    result = pytesseract.image_to_pdf_or_hocr(img_rgb)
-
-    with open(output_pdf_path, "wb") as f:
-        f.write(bytearray(result))
-
-def merge_pdfs(pdf_list, output_pdf_path):
-    """Merge multiple PDF files into a single PDF."""
-    pdf_writer = fitz.open()
-    
-    for pdf in pdf_list:
-        pdf_reader = fitz.open(pdf)
-        pdf_writer.insert_pdf(pdf_reader)
-    
-    pdf_writer.save(output_pdf_path)
-    pdf_writer.close()
+def find_tesseract():
+    candidates = [TESSERACT_PATH, shutil.which("tesseract"), TESSERACT_WINDOWS_PATH]
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            return candidate
+    raise RuntimeError("Tesseract executable not found; set TESSERACT_CMD or add tesseract to PATH")
+
+# Import pytesseract and point it at the Tesseract executable on first use
+def get_pytesseract():
+    global _tesseract_cmd
+    import pytesseract
+    if _tesseract_cmd is None:
+        with _tesseract_lock:
+            if _tesseract_cmd is None:
+                _tesseract_cmd = find_tesseract()
+                pytesseract.pytesseract.tesseract_cmd = _tesseract_cmd
+    return pytesseract
+
+# Tesseract sizes its output page from the image resolution, so it is passed explicitly
+def _tesseract_config(image):
+    return f"--dpi {int(image.info['dpi'][0])}" if 'dpi' in image.info else ''
+
+# Both OCR calls run on pool threads, so their document and page labels are passed
+# in explicitly (see metrics.labels) rather than taken from the calling thread
+def ocr_page_image(image, **labels):
+    # Use Tesseract to convert the preprocessed page image to a one-page searchable PDF
+    pytesseract = get_pytesseract()
+    with metrics.timer("ocr_page", **labels):
+        return pytesseract.image_to_pdf_or_hocr(image, extension='pdf', config=_tesseract_config(image))
+
+# Word-level OCR of a page image: text, pixel boxes and confidence per word, in one call
+def ocr_page_words(image, **labels):
+    pytesseract = get_pytesseract()
+    with metrics.timer("ocr_page", **labels):
+        return pytesseract.image_to_data(image, config=_tesseract_config(image), output_type=pytesseract.Output.DICT)
+
+def ocr_page_indexes(pdf_document, page_nums, preset=OCR_PRESET, ocr_workers=OCR_WORKERS, ocr_words=None):
+    """Yield (page_num, OcrTextIndex) for the given pages, in order.
+
+    Pages are rendered one at a time on this thread (PyMuPDF documents are
+    not thread-safe) and OCR'd on ocr_workers threads, with at most twice
+    that many images waiting. Pages found in ocr_words ({page_num: (words,
+    image_size, dpi, deskew_angle)}, see ResultCache.get_ocr_words) are not
+    OCR'd again, and every page that is gets added to it.
+    """
+    if ocr_words is None:
+        ocr_words = {}
+
+    def index(page_num, ocr_job):
+        if ocr_job is not None:
+            future, image_size, dpi, deskew_angle = ocr_job
+            ocr_words[page_num] = (future.result(), image_size, dpi, deskew_angle)
+        return page_num, OcrTextIndex(pdf_document[page_num], *ocr_words[page_num])
+
+    max_in_flight = 2 * ocr_workers
+    with ThreadPoolExecutor(max_workers=ocr_workers) as pool:
+        in_flight = deque()
+        for page_num in page_nums:
+            if page_num in ocr_words:
+                in_flight.append((page_num, None))
+                continue
+            image = preprocess_page_image(pdf_document[page_num], preset)
+            in_flight.append((page_num, (pool.submit(ocr_page_words, image, **metrics.labels(page=page_num + 1)),
+                                         image.size, image.info['dpi'][0], image.info['deskew_angle'])))
+            if len(in_flight) >= max_in_flight:
+                yield index(*in_flight.popleft())
+        while in_flight:
+            yield index(*in_flight.popleft())
+
+# Fraction of the page area covered by images (overlaps counted once per image)
+def image_coverage(page):
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / page_area)
+
+def page_needs_ocr(page):
+    if len(page.get_text().strip()) >= OCR_MIN_TEXT_CHARS:
+        return False
+    return image_coverage(page) >= OCR_MIN_IMAGE_COVERAGE
 
-def is_pdf_searchable(pdf_path):
+# Page numbers of an open document that have no usable text layer and need OCR
+def pages_needing_ocr(pdf_document):
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                if page.extract_text():
-                    return True
-        return False
+        return [page.number for page in pdf_document if page_needs_ocr(page)]
     except Exception as e:
         print(f"Error checking PDF searchability: {e}")
-        return False
-
-def make_pdf_searchable(pdf_path, searchable_pdf_path):
-    image_path = os.path.dirname(searchable_pdf_path) + '/'
-    num_images = image_conversion(pdf_path, image_path)
-    pdf_paths = []
-
-    for i in range(num_images):
-        input_image = f"{image_path}image_converted_{i + 1}.jpg"
-        output_pdf_path = f"{searchable_pdf_path}_{i + 1}.pdf"
-        images_to_searchable_pdf(input_image, output_pdf_path)
-        pdf_paths.append(output_pdf_path)
+        return []
 
-    # Merge all individual PDFs into one
+def is_pdf_searchable(pdf_path):
+    with fitz.open(pdf_path) as pdf_document:
+        return not pages_needing_ocr(pdf_document)
+
+def make_pdf_searchable(pdf_path, searchable_pdf_path, ocr_workers=OCR_WORKERS, pages=None, progress=None, preset=OCR_PRESET):
+    """OCR the given pages (default: all) of pdf_path and splice them into a copy of it.
+
+    Pages are rendered and cleaned up in memory according to the OCR
+    preset (see preprocessing.OCR_PRESETS) and handed to Tesseract on ocr_workers
+    threads (each call runs its own tesseract process). Each finished page
+    replaces its image-only original in place; pages that already have text
+    are kept as they are. Nothing but the output PDF is written to disk.
+    """
+    print("Running OCR on PDF pages")
     merged_pdf_path = f"{searchable_pdf_path}_merged.pdf"
-    merge_pdfs(pdf_paths, merged_pdf_path)
+    searchable_document = fitz.open(pdf_path)
+    if pages is None:
+        pages = range(len(searchable_document))
+    # Rendered images waiting for Tesseract are capped at twice the worker count
+    max_in_flight = 2 * ocr_workers
 
-    # Clean up temporary images and individual PDFs
-    for img in os.listdir(image_path):
-        if img.endswith('.jpg'):
-            os.remove(os.path.join(image_path, img))
-    for pdf in pdf_paths:
-        if os.path.exists(pdf):
-            os.remove(pdf)
+    try:
+        with ThreadPoolExecutor(max_workers=ocr_workers) as pool:
+            in_flight = deque()
+            done = 0
+            for page_num in pages:
+                image = preprocess_page_image(searchable_document[page_num], preset)
+                in_flight.append((page_num, pool.submit(ocr_page_image, image, **metrics.labels(page=page_num + 1))))
+                if len(in_flight) >= max_in_flight:
+                    done_page, future = in_flight.popleft()
+                    splice_ocr_page(searchable_document, done_page, future.result())
+                    done += 1
+                    report_progress(progress, "ocr", done, len(pages))
+            while in_flight:
+                done_page, future = in_flight.popleft()
+                splice_ocr_page(searchable_document, done_page, future.result())
+                done += 1
+                report_progress(progress, "ocr", done, len(pages))
+
+        metrics.count("pages_ocr", len(pages))
+        searchable_document.save(merged_pdf_path, garbage=3, deflate=True)
+    finally:
+        searchable_document.close()
 
     print(f"Merged searchable PDF saved to {os.path.normpath(merged_pdf_path)}")
     return merged_pdf_path
 
-def is_valid_pii(detected_text, entity_type):
-    password='hello'
-    if entity_type == "AADHAR":
-        return re.match(AADHAAR_PATTERN, detected_text) is not None
-    elif entity_type == "PAN":
-        return re.match(PAN_PATTERN, detected_text) is not None
-    elif entity_type == "EMAIL_ADDRESS":
-        return re.match(EMAIL_PATTERN, detected_text) is not None
-    elif entity_type == "PHONE_NUMBER":
-        return re.match(PHONE_PATTERN, detected_text) is not None
-    
-    print(f"Encrypting PII: {detected_text}")
-    encrypt_pii(detected_text, password)
-    return False  # Default case if no match is found
-
-def redact_text_in_pdf(pdf_path, redacted_pdf_path, detected_counts):
+# Replace page page_num of document with the one-page PDF produced by Tesseract
+def splice_ocr_page(document, page_num, page_pdf_bytes):
+    with fitz.open(stream=page_pdf_bytes, filetype="pdf") as page_document:
+        document.delete_page(page_num)
+        document.insert_pdf(page_document, start_at=page_num)
+
+def save_redacted_document(pdf_document, redacted_pdf_path, save_mode=REDACTED_SAVE_MODE):
+    if save_mode == "incremental":
+        # The document was opened from a working copy, which is updated in place;
+        # redact_text_in_pdf moves it to redacted_pdf_path afterwards
+        pdf_document.saveIncr()
+    elif save_mode == "compact":
+        pdf_document.save(redacted_pdf_path, garbage=4, deflate=True)
+    else:
+        raise ValueError(f"Unknown save mode: {save_mode}")
+
+# Find the valid PII on one page of normalized text; returns (detected_text, start, end, entity_type) tuples
+def detect_page_pii(normalized_page_text, analyzer, page_num):
+    # Pages without a digit or '@' cannot hold any PII; skip the regex and NLP passes
+    if not may_contain_pii(normalized_page_text):
+        log_verbose(f"No PII detected on page {page_num + 1}; skipping redaction.")
+        return []
+
+    # Analyze for PHONE_NUMBER, EMAIL_ADDRESS, PAN, and DOB
+    with metrics.timer("nlp", page=page_num + 1):
+        results = analyzer.analyze(text=normalized_page_text, entities=ANALYZER_ENTITIES, language='en')
+
+    return combine_page_detections(normalized_page_text, results, page_num)
+
+def detect_pages_pii(pages, analyzer, batch_size=NLP_BATCH_SIZE, n_process=NLP_PROCESSES):
+    """Detect PII on many pages with one batched NLP pass.
+
+    pages is an iterable of (key, page_num, normalized_page_text), where key
+    is whatever identifies the page to the caller, e.g. (document, page_num).
+    Pages that pass the prefilter go through analyze_texts() together.
+    Returns {key: detections} with the same tuples as detect_page_pii.
+    """
+    pages = list(pages)
+    detections = {key: [] for key, _, _ in pages}
+    candidates = []
+    for key, page_num, normalized_page_text in pages:
+        if may_contain_pii(normalized_page_text):
+            candidates.append((key, page_num, normalized_page_text))
+        else:
+            log_verbose(f"No PII detected on page {page_num + 1}; skipping redaction.")
+
+    with metrics.timer("nlp"):
+        results = analyze_texts(analyzer, [text for _, _, text in candidates], ANALYZER_ENTITIES, batch_size, n_process)
+    metrics.count("nlp_pages", len(candidates))
+
+    for (key, page_num, normalized_page_text), analyzer_results in zip(candidates, results):
+        detections[key] = combine_page_detections(normalized_page_text, analyzer_results, page_num)
+    return detections
+
+# Merge the scanner's AADHAR/PAN hits with Presidio results, keeping one valid detection per region
+def combine_page_detections(normalized_page_text, results, page_num):
+    # Custom PII detection for AADHAR and PAN in one compiled pass
+    custom_pii_results = scan_text(normalized_page_text, SCANNER_ENTITIES)
+
+    candidates = []
+    for result in custom_pii_results + results:
+        if isinstance(result, tuple):
+            detected_text, start, end, entity_type = result
+            score = SCANNER_SCORE
+        else:
+            start, end = result.start, result.end
+            detected_text = normalized_page_text[start:end].strip()
+            entity_type = result.entity_type
+            score = result.score
+
+        if is_valid_pii(detected_text, entity_type):
+            candidates.append((detected_text, start, end, entity_type, score))
+
+    # Overlapping hits (an Aadhaar number also matches as a phone number) would be
+    # redacted, counted and encrypted once per hit; the resolver keeps one
+    detections = resolve_overlaps(candidates, text=normalized_page_text)
+    if len(detections) < len(candidates):
+        metrics.count("overlaps_resolved", len(candidates) - len(detections))
+
+    if not detections:
+        log_verbose(f"No PII detected on page {page_num + 1}; skipping redaction.")
+    return detections
+
+# Detect, redact and encrypt the PII on one page; returns the page's detections (empty if none).
+# Pass detections to redact previously found spans without running detection again.
+def redact_page(page, analyzer, encryptor, detected_counts, page_num=None, detections=None, page_index=None):
+    # page_num is the page's number in the source document when page belongs to a partial copy
+    if page_num is None:
+        page_num = page.number
+    # Normalized text plus per-character boxes, built once per page
+    if page_index is None:
+        page_index = PageTextIndex(page)
+    if detections is None:
+        detections = detect_page_pii(page_index.text, analyzer, page_num)
+    if not detections:
+        return detections
+
+    page_has_redactions = False
+    redaction_start = time.perf_counter()
+    encryption_seconds = 0.0
+    for detected_text, start, end, entity_type in detections:
+        detected_counts[entity_type] = detected_counts.get(entity_type, 0) + 1
+        metrics.count("matches", entity_type=entity_type)
+        log_verbose(f"Redacting PII of type '{entity_type}' on page {page_num + 1}")
+        # Only this occurrence is redacted; repeats have their own results
+        for rect in page_index.rects_for_span(start, end):
+            page.add_redact_annot(rect, fill=(0, 0, 0))
+            page_has_redactions = True
+
+        # Buffer encrypted PII; embedded in the redacted PDF by the caller
+        encrypt_start = time.perf_counter()
+        encryptor.encrypt(detected_text, page_num, entity_type, start, end)
+        encryption_seconds += time.perf_counter() - encrypt_start
+
+    # Remove the underlying text and paint every region of the page in one pass
+    if page_has_redactions:
+        page.apply_redactions()
+
+    metrics.record_timing("encryption", encryption_seconds, page=page_num + 1)
+    metrics.record_timing("redaction", time.perf_counter() - redaction_start - encryption_seconds, page=page_num + 1)
+    return detections
+
+def redact_text_in_pdf(pdf_path, redacted_pdf_path, detected_counts, analyzer=None, encryptor=None, save_mode=REDACTED_SAVE_MODE, cache=None, progress=None, detections=None, ocr_pages=None, ocr_preset=OCR_PRESET,
+                       vault=None, document_hash=None, document_name=None, open_document=None, text_hash=None):
+    # Returns True when the document was processed without error; cancellation is re-raised.
+    # detections ({page_num: detections}, e.g. from detect_documents_pii) skips the NLP pass.
+    # ocr_pages are image-only pages whose text and boxes come from Tesseract words instead.
+    # With a vault, the records are also indexed under document_hash (default: hash of pdf_path).
+    # open_document is pdf_path already opened by the caller, who closes it; it is redacted
+    # in place except with incremental saves. text_hash is the hash of pdf_path if known.
     password = 'hello'
-    output_dir = r'C:\Users\HP\Downloads\Harihar Jeevan\Sem 3\Sample\Encrypted PII'
+    pdf_document = None
+    # Incremental saves must go to the file that was opened. That copy of the
+    # unredacted input only takes the redacted name once the save succeeded.
+    working_path = f"{redacted_pdf_path}.part" if save_mode == "incremental" else None
     try:
-        analyzer = create_analyzer()
-        pdf_document = fitz.open(pdf_path)
+        if analyzer is None:
+            analyzer = get_analyzer()
+        # Key derivation happens here, once per document unless a run-wide encryptor is passed in
+        if encryptor is None:
+            encryptor = EnvelopeEncryptor(password)
+        if working_path:
+            warnings.warn("Incremental save keeps the original page content in the redacted PDF; "
+                          "the redacted text can still be recovered from it")
+            shutil.copyfile(pdf_path, working_path)
+            pdf_document = fitz.open(working_path)
+        elif open_document is not None:
+            pdf_document = open_document
+        else:
+            pdf_document = fitz.open(pdf_path)
         pii_found = False
 
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            page_text = page.get_text()
-            normalized_page_text = normalize_text(page_text)
-
-            # Custom PII detection for AADHAR
-            custom_pii_results = []
-            for match in re.finditer(AADHAAR_PATTERN, normalized_page_text):
-                custom_pii_results.append((match.group(), match.start(), match.end(), "AADHAR"))
-            
-            for match in re.finditer(PAN_PATTERN, normalized_page_text):
-                custom_pii_results.append((match.group(), match.start(), match.end(), "PAN"))
-                
-            # Analyze for PHONE_NUMBER, EMAIL_ADDRESS, PAN, and DOB
-            results = analyzer.analyze(text=normalized_page_text, entities=["PHONE_NUMBER", "EMAIL_ADDRESS", "PAN"], language='en')
-
-            # Combine results, prioritizing AADHAR
-            all_results = custom_pii_results + results
-
-            if not all_results:
-                print(f"No PII detected on page {page_num + 1}; skipping redaction.")
-                continue
-
-            for result in all_results:
-                if isinstance(result, tuple):
-                    detected_text, start, end, entity_type = result
-                else:
-                    detected_text = normalized_page_text[result.start:result.end].strip()
-                    entity_type = result.entity_type
+        ocr_pages = set(ocr_pages or ())
+        if ocr_pages:
+            metrics.count("pages_ocr", len(ocr_pages))
+
+        # Detections from an earlier run on the same text skip the NLP pass. The text
+        # of OCR'd pages also depends on the OCR settings, and their word boxes are
+        # cached too, since redacting them needs the boxes again.
+        cached_pages = None
+        ocr_words = {}
+        if cache is not None:
+            text_hash = text_hash or file_hash(pdf_path)
+            spans_fingerprint = DETECTOR_FINGERPRINT
+            if ocr_pages:
+                spans_fingerprint = config_fingerprint(DETECTOR_FINGERPRINT, ocr_fingerprint(ocr_preset))
+                ocr_words = cache.get_ocr_words(text_hash, ocr_fingerprint(ocr_preset)) or {}
+            cached_pages = cache.get_spans(text_hash, spans_fingerprint)
+        cached_ocr_pages = len(ocr_words)
+        known_pages = cached_pages if cached_pages is not None else detections
+        page_detections = {}
+        ocr_done = 0
+
+        # Pages are indexed and analyzed NLP_BATCH_SIZE at a time: one nlp.pipe
+        # call per chunk, while only one chunk of character boxes is held
+        for chunk_start in range(0, len(pdf_document), NLP_BATCH_SIZE):
+            chunk = [pdf_document[page_num] for page_num in range(chunk_start, min(chunk_start + NLP_BATCH_SIZE, len(pdf_document)))]
+            ocr_indexes = {}
+            for page_num, page_index in ocr_page_indexes(pdf_document, [page.number for page in chunk if page.number in ocr_pages], ocr_preset,
+                                                         ocr_words=ocr_words):
+                ocr_indexes[page_num] = page_index
+                ocr_done += 1
+                report_progress(progress, "ocr", ocr_done, len(ocr_pages))
+            page_indexes = [ocr_indexes[page.number] if page.number in ocr_indexes else PageTextIndex(page) for page in chunk]
+            if known_pages is not None:
+                chunk_detections = {page.number: known_pages.get(page.number, []) for page in chunk}
+            else:
+                chunk_detections = detect_pages_pii(
+                    ((page.number, page.number, page_index.text) for page, page_index in zip(chunk, page_indexes)), analyzer)
 
-                if is_valid_pii(detected_text, entity_type):
-                    detected_counts[entity_type] = detected_counts.get(entity_type, 0) + 1
+            for page, page_index in zip(chunk, page_indexes):
+                page_pii = redact_page(page, analyzer, encryptor, detected_counts, detections=chunk_detections[page.number], page_index=page_index)
+                page_detections[page.number] = page_pii
+                if page_pii:
                     pii_found = True
-                    print(f"Redacting PII of type '{entity_type}' on page {page_num + 1}")
-                    rects = page.search_for(detected_text)
-                    for rect in rects:
-                        page.draw_rect(rect, color=(0, 0, 0), fill=(0, 0, 0))
-                        
-                        # Append encrypted PII to the same file
-                        encrypted_file_path = encrypt_pii(detected_text, password, output_dir)
+                report_progress(progress, "redaction", page.number + 1, len(pdf_document))
+
+        if cache is not None and cached_pages is None:
+            cache.put_spans(text_hash, spans_fingerprint, page_detections)
+        if cache is not None and len(ocr_words) > cached_ocr_pages:
+            cache.put_ocr_words(text_hash, ocr_fingerprint(ocr_preset), ocr_words)
+
+        # This document's records only, embedded as one attachment in the same save
+        entries = encryptor.entries() if vault is not None else []
+        payload = encryptor.take_payload()
 
         if pii_found:
-            pdf_document.save(redacted_pdf_path)
+            if payload:
+                with metrics.timer("attachment"):
+                    embed_payload(pdf_document, payload)
+            with metrics.timer("save"):
+                save_redacted_document(pdf_document, redacted_pdf_path, save_mode)
+                if working_path:
+                    pdf_document.close()
+                    os.replace(working_path, redacted_pdf_path)
+            metrics.count("bytes_written", os.path.getsize(redacted_pdf_path))
             print(f"Redacted PDF saved to {os.path.normpath(redacted_pdf_path)}")
+            if entries:
+                vault.add_document(document_hash or text_hash or file_hash(pdf_path), document_name or os.path.basename(pdf_path), encryptor.header, entries)
         else:
             print(f"No PII found in {os.path.normpath(pdf_path)}; no redacted PDF saved.")
-        
-        pdf_document.close()
-        if encrypted_file_path:
-            attach_each_line_to_pdf(redacted_pdf_path, encrypted_file_path)
+        return True
+    except ProcessingCancelled:
+        raise
     except Exception as e:
         print(f"Error redacting PDF: {e}")
-
-
-def process_pdf(pdf_path, output_directory, redact_pii, pii_count_file):
-    output= r'C:\Users\HP\Downloads\Harihar Jeevan\Sem 3'
-    print(f"\nProcessing file {os.path.normpath(pdf_path)} with redact_pii={redact_pii}")
+        return False
+    finally:
+        if pdf_document is not None and pdf_document is not open_document and not pdf_document.is_closed:
+            pdf_document.close()
+        # Never leave the unredacted working copy behind, whatever happened
+        if working_path and os.path.exists(working_path):
+            os.remove(working_path)
+
+
+def process_pdf(pdf_path, output_directory, redact_pii, pii_count_file, analyzer=None, plot=True, cache=None, progress=None, detections=None, ocr_preset=OCR_PRESET, vault=None,
+                strict=False, input_hash=None):
+    # Errors are printed and the document skipped; with strict=True they raise ProcessingFailed instead.
+    # input_hash is file_hash(pdf_path) when the caller has already computed it.
+    # Every timing and counter recorded below is tagged with this document
+    with metrics.document(os.path.basename(pdf_path)):
+        output= r'C:\Users\HP\Downloads\Harihar Jeevan\Sem 3'
+        print(f"\nProcessing file {os.path.normpath(pdf_path)} with redact_pii={redact_pii}")
+
+        # Load the shared analyzer before timing so model load is reported separately
+        if redact_pii and analyzer is None:
+            analyzer = get_analyzer()
+        start_time = time.perf_counter()
     
-    redacted_pdf_path = os.path.join(output_directory, f"redacted_{os.path.basename(pdf_path)}")
+        redacted_pdf_path = os.path.join(output_directory, f"redacted_{os.path.basename(pdf_path)}")
+
+        # Keys the result cache and the vault's records
+        if input_hash is None and (cache is not None or vault is not None):
+            input_hash = file_hash(pdf_path)
+
+        # Unchanged input with unchanged settings: reuse the earlier result. The OCR
+        # preset and detection mode decide what scanned pages produce, so they are part
+        # of it, and so is the vault: a hit would leave a newly given vault empty.
+        if cache is not None:
+            vault_path = os.path.abspath(vault.vault_path) if vault is not None else None
+            output_fingerprint = config_fingerprint(redact_pii, REDACTED_SAVE_MODE, os.path.abspath(output_directory),
+                                                    ocr_fingerprint(ocr_preset), OCR_DIRECT_DETECTION, vault_path)
+            cached_counts = cache.get_result(input_hash, DETECTOR_FINGERPRINT, output_fingerprint)
+            if cached_counts is not None:
+                print(f"Unchanged since last run; reusing cached result for {os.path.normpath(pdf_path)}")
+                metrics.count("cache_hits")
+                return cached_counts
     
-    # Load expected PII counts from the text file
-    expected_counts = load_pii_counts(pii_count_file).get(os.path.basename(pdf_path), {})
+        # Load expected PII counts from the text file
+        expected_counts = load_pii_counts(pii_count_file).get(os.path.basename(pdf_path), {})
     
-    detected_counts = {"AADHAR": 0, "PAN": 0, "EMAIL_ADDRESS": 0, "PHONE_NUMBER": 0}
-
-    if not is_pdf_searchable(pdf_path):
-        searchable_pdf_path = os.path.join(output_directory, f"searchable_{os.path.basename(pdf_path)}")
-        merged_pdf_path = make_pdf_searchable(pdf_path, searchable_pdf_path)
+        detected_counts = {"AADHAR": 0, "PAN": 0, "EMAIL_ADDRESS": 0, "PHONE_NUMBER": 0}
+
+        # Pages are classified on the open document, which the redaction of the input
+        # then works on; only image-only pages go through OCR
+        try:
+            pdf_document = fitz.open(pdf_path)
+        except Exception as e:
+            # redact_text_in_pdf reports the error when it tries again
+            print(f"Error checking PDF searchability: {e}")
+            pdf_document = None
+        try:
+            with metrics.timer("searchability"):
+                ocr_pages = pages_needing_ocr(pdf_document) if pdf_document is not None else []
+            report_progress(progress, "searchability", 1, 1)
+
+            succeeded = True
+            output_path = None
+            if ocr_pages and redact_pii and OCR_DIRECT_DETECTION:
+                # Detect on Tesseract's words and redact the scanned pages in place
+                succeeded = redact_text_in_pdf(pdf_path, redacted_pdf_path, detected_counts, analyzer, cache=cache, progress=progress,
+                                               ocr_pages=ocr_pages, ocr_preset=ocr_preset, vault=vault, document_hash=input_hash,
+                                               open_document=pdf_document, text_hash=input_hash)
+                output_path = redacted_pdf_path
+
+            elif ocr_pages:
+                searchable_pdf_path = os.path.join(output_directory, f"searchable_{os.path.basename(pdf_path)}")
+                cached_ocr_path = cache.get_ocr(input_hash, ocr_fingerprint(ocr_preset)) if cache is not None else None
+                if cached_ocr_path:
+                    print(f"Reusing cached OCR text layer for {os.path.normpath(pdf_path)}")
+                    merged_pdf_path = f"{searchable_pdf_path}_merged.pdf"
+                    shutil.copyfile(cached_ocr_path, merged_pdf_path)
+                else:
+                    with metrics.timer("ocr"):
+                        merged_pdf_path = make_pdf_searchable(pdf_path, searchable_pdf_path, pages=ocr_pages, progress=progress, preset=ocr_preset)
+                    if cache is not None:
+                        cache.put_ocr(input_hash, ocr_fingerprint(ocr_preset), merged_pdf_path)
         
-        # Redact text in the newly created merged PDF
-        if redact_pii:
-            redact_text_in_pdf(merged_pdf_path, redacted_pdf_path, detected_counts)
-        else:
-            print(f"Skipping PII redaction for {os.path.normpath(merged_pdf_path)}.")
-            try:
-                copy_path = os.path.join(output_directory, os.path.basename(merged_pdf_path))
-                shutil.copy(merged_pdf_path, copy_path)
-                print(f"Copied {os.path.normpath(merged_pdf_path)} to {os.path.normpath(copy_path)}")
-            except Exception as e:
-                print(f"Error copying file {merged_pdf_path}: {e}")
-
-    elif redact_pii:
-        redact_text_in_pdf(pdf_path, redacted_pdf_path, detected_counts)
-
-    # Log counts to verify
-    print(f"Detected counts: {detected_counts}")
-    print(f"Expected counts: {expected_counts}")
-
-    # Calculate accuracy and false positives based on expected counts and detected counts
-    accuracies, false_positives = calculate_accuracy_and_false_positives(detected_counts, expected_counts)
+                # Redact text in the newly created merged PDF
+                if redact_pii:
+                    succeeded = redact_text_in_pdf(merged_pdf_path, redacted_pdf_path, detected_counts, analyzer, cache=cache, progress=progress,
+                                                   vault=vault, document_hash=input_hash, document_name=os.path.basename(pdf_path))
+                    output_path = redacted_pdf_path
+                else:
+                    print(f"Skipping PII redaction for {os.path.normpath(merged_pdf_path)}.")
+                    try:
+                        copy_path = os.path.join(output_directory, os.path.basename(merged_pdf_path))
+                        shutil.copy(merged_pdf_path, copy_path)
+                        output_path = copy_path
+                        print(f"Copied {os.path.normpath(merged_pdf_path)} to {os.path.normpath(copy_path)}")
+                    except Exception as e:
+                        succeeded = False
+                        print(f"Error copying file {merged_pdf_path}: {e}")
+
+            elif redact_pii:
+                # detections are only valid for the original text layer, never for an OCR'd copy
+                succeeded = redact_text_in_pdf(pdf_path, redacted_pdf_path, detected_counts, analyzer, cache=cache, progress=progress, detections=detections,
+                                               vault=vault, document_hash=input_hash, open_document=pdf_document, text_hash=input_hash)
+                output_path = redacted_pdf_path
+
+        finally:
+            if pdf_document is not None:
+                pdf_document.close()
+
+        if strict and not succeeded:
+            raise ProcessingFailed(f"could not process {os.path.basename(pdf_path)}")
+
+        if cache is not None and succeeded:
+            # No redacted file is written when a document has no PII
+            if output_path and not os.path.exists(output_path):
+                output_path = None
+            cache.put_result(input_hash, DETECTOR_FINGERPRINT, output_fingerprint, detected_counts, output_path)
+
+        document_seconds = time.perf_counter() - start_time
+        metrics.record_timing("document", document_seconds)
+        print(f"Document processed in {document_seconds:.2f}s (analyzer load {analyzer_load_seconds():.2f}s, once per process)")
+
+        # Log counts to verify
+        print(f"Detected counts: {detected_counts}")
+        print(f"Expected counts: {expected_counts}")
+
+        # Calculate accuracy and false positives based on expected counts and detected counts
+        accuracies, false_positives = calculate_accuracy_and_false_positives(detected_counts, expected_counts)
     
-    print(f"Calculated accuracies: {accuracies}")
-    print(f"False positives: {false_positives}")
+        print(f"Calculated accuracies: {accuracies}")
+        print(f"False positives: {false_positives}")
     
-    # Plot the accuracy and false positives
-    plot_accuracy_and_false_positives(accuracies, false_positives, os.path.basename(pdf_path))
+        # Plot the accuracy and false positives
+        if plot:
+            plot_accuracy_and_false_positives(accuracies, false_positives, os.path.basename(pdf_path))
+
+        return detected_counts
     
-def process_files_in_directory(directory_path, output_directory, redact_pii, pii_count_file):
+def process_files_in_directory(directory_path, output_directory, redact_pii, pii_count_file, cache_dir=None, vault_path=None):
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    for filename in os.listdir(directory_path):
-        file_path = os.path.join(directory_path, filename)
-        if filename.lower().endswith('.pdf'):
-            process_pdf(file_path, output_directory, redact_pii, pii_count_file)
+    # One warm analyzer shared by every document in the directory
+    analyzer = get_analyzer() if redact_pii else None
+    cache = ResultCache(cache_dir) if cache_dir else None
+    # Records of many documents are committed together; close() writes the rest
+    vault = PiiVault(vault_path) if vault_path else None
+
+    pdf_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if f.lower().endswith('.pdf')]
+    try:
+        for batch_start in range(0, len(pdf_files), DOCUMENT_BATCH_SIZE):
+            batch = pdf_files[batch_start:batch_start + DOCUMENT_BATCH_SIZE]
+            # Each input is hashed once; the cache and the vault are both keyed on it
+            hashes = {file_path: file_hash(file_path) for file_path in batch} if cache is not None or vault is not None else {}
+            # Text-layer pages of the whole batch go through NLP together
+            batch_detections = detect_documents_pii(batch, analyzer, cache, hashes=hashes) if redact_pii else {}
+            for file_path in batch:
+                # Per-document plots would block the batch; see evaluation.py for corpus reports
+                process_pdf(file_path, output_directory, redact_pii, pii_count_file, analyzer, plot=False, cache=cache,
+                            detections=batch_detections.get(file_path), vault=vault, input_hash=hashes.get(file_path))
+                metrics.flush()
+    finally:
+        # Buffered vault records belong to PDFs already written, so they are kept even after an error
+        if vault is not None:
+            vault.close()
+        if cache is not None:
+            cache.evict()
+            cache.close()
+
+def detect_documents_pii(pdf_paths, analyzer, cache=None, batch_size=NLP_BATCH_SIZE, n_process=NLP_PROCESSES, hashes=None):
+    """Run detection for the pages of several text-layer documents in shared NLP batches.
+
+    Documents that need OCR, fail to open or already have cached spans are
+    left out; process_pdf handles them as usual. Returns
+    {pdf_path: {page_num: detections}}, and stores the spans in cache when
+    one is given, keyed on hashes[pdf_path] where the caller passes them.
+    """
+    hashes = dict(hashes or {})
+    pages = []
+    for pdf_path in pdf_paths:
+        try:
+            if cache is not None:
+                if pdf_path not in hashes:
+                    hashes[pdf_path] = file_hash(pdf_path)
+                if cache.get_spans(hashes[pdf_path], DETECTOR_FINGERPRINT) is not None:
+                    continue
+            with fitz.open(pdf_path) as pdf_document:
+                if pages_needing_ocr(pdf_document):
+                    continue
+                # Same text as redact_text_in_pdf indexes, so offsets line up
+                pages.extend(((pdf_path, page.number), page.number, PageTextIndex(page).text) for page in pdf_document)
+        except Exception as e:
+            print(f"Skipping batched detection for {os.path.normpath(pdf_path)}: {e}")
+
+    documents = {}
+    for (pdf_path, page_num), detections in detect_pages_pii(pages, analyzer, batch_size, n_process).items():
+        documents.setdefault(pdf_path, {})[page_num] = detections
+    if cache is not None:
+        for pdf_path, page_detections in documents.items():
+            cache.put_spans(hashes[pdf_path], DETECTOR_FINGERPRINT, page_detections)
+    return documents
+
+_worker_cache = None
+_worker_vault = None
+
+# Runs once in each pool worker so every worker keeps its own warm analyzer, cache and vault connection
+def _init_batch_worker(redact_pii, cache_dir=None, vault_path=None):
+    global _worker_cache, _worker_vault
+    if redact_pii:
+        get_analyzer()
+    if cache_dir:
+        _worker_cache = ResultCache(cache_dir)
+    if vault_path:
+        _worker_vault = PiiVault(vault_path)
+
+def _process_pdf_in_worker(pdf_path, output_directory, redact_pii, pii_count_file, strict=False):
+    # Plotting would block the worker, so it is always off here.
+    # Metrics go back to the parent, which owns the JSONL/Prometheus output.
+    try:
+        detected_counts = process_pdf(pdf_path, output_directory, redact_pii, pii_count_file, plot=False, cache=_worker_cache, vault=_worker_vault,
+                                      strict=strict)
+        # Workers have no shutdown hook, so each document's records are committed right away
+        if _worker_vault is not None:
+            _worker_vault.flush()
+        return detected_counts, None, metrics.drain()
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", metrics.drain()
+
+def process_files_in_parallel(directory_path, output_directory, redact_pii, pii_count_file, workers=None, max_in_flight=None, cache_dir=None, vault_path=None,
+                              strict=True):
+    """Process every PDF in directory_path on a pool of worker processes.
+
+    At most max_in_flight documents (default: twice the worker count) are
+    submitted at a time to keep memory bounded. Returns a list of
+    (filename, detected_counts, error) tuples sorted by filename; a failed
+    file has detected_counts None and an error message, and does not stop
+    the others; with strict=False only crashes count as failures (see process_pdf).
+    """
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
 
-def process_directory(input_directory, output_directory, redact_pii, pii_count_file):
-    process_files_in_directory(input_directory, output_directory, redact_pii, pii_count_file)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    pdf_files = sorted(f for f in os.listdir(directory_path) if f.lower().endswith('.pdf'))
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(redact_pii, cache_dir, vault_path)) as pool:
+        pending = {}
+        queued = iter(pdf_files)
+        while True:
+            # Top up the in-flight window before waiting on the next completion
+            for filename in queued:
+                file_path = os.path.join(directory_path, filename)
+                try:
+                    future = pool.submit(_process_pdf_in_worker, file_path, output_directory, redact_pii, pii_count_file, strict=strict)
+                except Exception as e:
+                    results[filename] = (None, f"{type(e).__name__}: {e}")
+                    continue
+                pending[future] = filename
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = pending.pop(future)
+                try:
+                    detected_counts, error, events = future.result()
+                    metrics.merge(events)
+                    metrics.flush()
+                    results[filename] = (detected_counts, error)
+                except Exception as e:
+                    # Worker crashed (e.g. killed by the OS); only this file is marked failed
+                    results[filename] = (None, f"{type(e).__name__}: {e}")
+
+    for filename in pdf_files:
+        detected_counts, error = results[filename]
+        if error:
+            print(f"Failed to process {filename}: {error}")
+
+    if cache_dir:
+        cache = ResultCache(cache_dir)
+        cache.evict()
+        cache.close()
+
+    return [(filename,) + results[filename] for filename in pdf_files]
+
+def process_directory(input_directory, output_directory, redact_pii, pii_count_file, workers=1, cache_dir=None, vault_path=None):
+    if workers == 1:
+        process_files_in_directory(input_directory, output_directory, redact_pii, pii_count_file, cache_dir, vault_path)
+    else:
+        return process_files_in_parallel(input_directory, output_directory, redact_pii, pii_count_file, workers, cache_dir=cache_dir, vault_path=vault_path)
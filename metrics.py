@@ -0,0 +1,152 @@
+'''
+File: metrics.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Defaults can be set without code changes:
+#   PII_VERBOSE=0                 silence per-page and per-match messages
+#   PII_METRICS_JSONL=<path>      append one JSON event per timing/counter on flush()
+#   PII_METRICS_PROMETHEUS=<path> rewrite a Prometheus text-format file on flush()
+VERBOSE = os.environ.get("PII_VERBOSE", "1") != "0"
+JSONL_PATH = os.environ.get("PII_METRICS_JSONL")
+PROMETHEUS_PATH = os.environ.get("PII_METRICS_PROMETHEUS")
+
+# Labels kept per event but dropped from Prometheus series to bound cardinality
+_EVENT_ONLY_LABELS = ("document", "page")
+
+
+def configure(verbose=None, jsonl_path=None, prometheus_path=None):
+    global VERBOSE, JSONL_PATH, PROMETHEUS_PATH
+    if verbose is not None:
+        VERBOSE = verbose
+    if jsonl_path is not None:
+        JSONL_PATH = jsonl_path
+    if prometheus_path is not None:
+        PROMETHEUS_PATH = prometheus_path
+
+# Per-page and per-match messages go through here so they can be switched off
+def log_verbose(message):
+    if VERBOSE:
+        print(message)
+
+
+class Metrics:
+    """Thread-safe collector of stage timings and counters.
+
+    Every timing or counter becomes an event tagged with the current document
+    (see document()) and any extra labels. Events wait in memory until
+    flush() writes them out; running totals per stage/counter are kept for
+    the Prometheus export.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._events = []
+        self._totals = {}
+
+    @contextmanager
+    def document(self, name):
+        previous = getattr(self._local, "document", None)
+        self._local.document = name
+        try:
+            yield
+        finally:
+            self._local.document = previous
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_timing(stage, time.perf_counter() - start, **labels)
+
+    def record_timing(self, stage, seconds, **labels):
+        self._record({"type": "timing", "stage": stage, "seconds": seconds, **self._labels(labels)})
+
+    def count(self, name, value=1, **labels):
+        self._record({"type": "counter", "name": name, "value": value, **self._labels(labels)})
+
+    # The current document label plus the given ones, captured for work handed to
+    # another thread (document() only applies to the thread that entered it)
+    def labels(self, **labels):
+        return self._labels(labels)
+
+    def _labels(self, labels):
+        document = getattr(self._local, "document", None)
+        if document is not None and "document" not in labels:
+            labels["document"] = document
+        return labels
+
+    def _record(self, event):
+        event["time"] = time.time()
+        with self._lock:
+            self._events.append(event)
+            self._add_to_totals(event)
+
+    def _add_to_totals(self, event):
+        labels = tuple(sorted(
+            (key, str(value)) for key, value in event.items()
+            if key not in ("type", "stage", "name", "seconds", "value", "time") and key not in _EVENT_ONLY_LABELS
+        ))
+        if event["type"] == "timing":
+            labels = (("stage", event["stage"]),) + labels
+            self._totals[("pii_stage_seconds_total", labels)] = self._totals.get(("pii_stage_seconds_total", labels), 0) + event["seconds"]
+            self._totals[("pii_stage_calls_total", labels)] = self._totals.get(("pii_stage_calls_total", labels), 0) + 1
+        else:
+            metric = f"pii_{event['name']}_total"
+            self._totals[(metric, labels)] = self._totals.get((metric, labels), 0) + event["value"]
+
+    # Take the pending events, e.g. to send them from a worker process to the parent
+    def drain(self):
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    # Add events recorded in another process
+    def merge(self, events):
+        with self._lock:
+            for event in events:
+                self._events.append(event)
+                self._add_to_totals(event)
+
+    def flush(self, jsonl_path=None, prometheus_path=None):
+        jsonl_path = jsonl_path or JSONL_PATH
+        prometheus_path = prometheus_path or PROMETHEUS_PATH
+        events = self.drain()
+        if jsonl_path and events:
+            with open(jsonl_path, 'a') as jsonl_file:
+                jsonl_file.write("".join(json.dumps(event) + "\n" for event in events))
+        if prometheus_path:
+            self.write_prometheus(prometheus_path)
+
+    def write_prometheus(self, prometheus_path):
+        with self._lock:
+            totals = sorted(self._totals.items())
+        lines = []
+        current_metric = None
+        for (metric, labels), value in totals:
+            if metric != current_metric:
+                lines.append(f"# TYPE {metric} counter")
+                current_metric = metric
+            label_text = ",".join(f'{key}="{value_text}"' for key, value_text in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        # Write-then-rename so a scraper never reads a partial file
+        temp_path = prometheus_path + ".tmp"
+        with open(temp_path, 'w') as prometheus_file:
+            prometheus_file.write("\n".join(lines) + "\n")
+        os.replace(temp_path, prometheus_path)
+
+
+# Process-wide collector used by the pipeline
+metrics = Metrics()
@@ -0,0 +1,115 @@
+'''
+File: page_index.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import math
+import fitz
+
+
+class PageTextIndex:
+    """Whitespace-normalized page text with a bounding box for every character.
+
+    The text equals normalize_text(page.get_text()), so offsets returned by the
+    scanner or Presidio on it map straight back to page geometry without
+    searching the page again.
+    """
+
+    def __init__(self, page):
+        chars = []
+        # (x0, y0, x1, y1, line_id) per character of self.text; None for collapsed whitespace
+        boxes = []
+        line_id = 0
+        pending_space = False
+
+        for block in page.get_text("rawdict")["blocks"]:
+            for line in block.get("lines", []):
+                line_id += 1
+                pending_space = True
+                for span in line["spans"]:
+                    for char in span["chars"]:
+                        if char["c"].isspace():
+                            pending_space = True
+                            continue
+                        if pending_space and chars:
+                            chars.append(' ')
+                            boxes.append(None)
+                        pending_space = False
+                        chars.append(char["c"])
+                        boxes.append(tuple(char["bbox"]) + (line_id,))
+
+        self.text = ''.join(chars)
+        self.boxes = boxes
+
+    # Rectangles covering text[start:end], one per text line the span touches
+    def rects_for_span(self, start, end):
+        rects = []
+        current_line = None
+        for box in self.boxes[start:end]:
+            if box is None:
+                continue
+            x0, y0, x1, y1, line_id = box
+            if line_id != current_line:
+                rects.append(fitz.Rect(x0, y0, x1, y1))
+                current_line = line_id
+            else:
+                rects[-1] |= fitz.Rect(x0, y0, x1, y1)
+        return rects
+
+
+class OcrTextIndex(PageTextIndex):
+    """The same index built from Tesseract word boxes instead of a text layer.
+
+    words is pytesseract.image_to_data(..., output_type=Output.DICT) for an
+    image of page rendered at dpi and, if deskew_angle is set, rotated by it
+    (see preprocessing.preprocess_page_image). Word boxes are mapped back to
+    the original page's coordinates, so redactions land on the scanned page
+    itself. Every character of a word gets the whole word's box.
+    """
+
+    def __init__(self, page, words, image_size, dpi, deskew_angle=0.0):
+        to_page = self._image_to_page(page, image_size, dpi, deskew_angle)
+        chars = []
+        boxes = []
+
+        for index, word in enumerate(words["text"]):
+            word = word.strip()
+            if not word or float(words["conf"][index]) < 0:
+                continue
+            line = (words["block_num"][index], words["par_num"][index], words["line_num"][index])
+            if chars:
+                chars.append(' ')
+                boxes.append(None)
+            left, top = words["left"][index], words["top"][index]
+            rect = to_page(left, top, left + words["width"][index], top + words["height"][index])
+            box = (rect.x0, rect.y0, rect.x1, rect.y1, line)
+            chars.append(word)
+            boxes.extend([box] * len(word))
+
+        self.text = ''.join(chars)
+        self.boxes = boxes
+
+    @staticmethod
+    def _image_to_page(page, image_size, dpi, deskew_angle):
+        width, height = image_size
+        center_x, center_y = width / 2, height / 2
+        # Undo the deskew: the image was rotated by -deskew_angle about its center
+        cos_a = math.cos(math.radians(deskew_angle))
+        sin_a = math.sin(math.radians(deskew_angle))
+        scale = 72 / dpi
+        derotation = page.derotation_matrix
+
+        def to_page(x0, y0, x1, y1):
+            points = []
+            for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1)):
+                dx, dy = x - center_x, y - center_y
+                points.append(fitz.Point(
+                    (center_x + cos_a * dx + sin_a * dy) * scale,
+                    (center_y - sin_a * dx + cos_a * dy) * scale) * derotation)
+            # Bounding box of the rotated word box, so it errs on covering more
+            return fitz.Rect(min(p.x for p in points), min(p.y for p in points),
+                             max(p.x for p in points), max(p.y for p in points))
+        return to_page
@@ -0,0 +1,310 @@
+'''
+File: pipeline.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import fitz
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from analyzer import get_analyzer
+from cache import file_hash
+from encryption import EnvelopeEncryptor, build_payload
+from main import ProcessingFailed, detect_pages_pii, make_pdf_searchable, pages_needing_ocr, redact_text_in_pdf
+from metrics import metrics, log_verbose
+from page_index import PageTextIndex
+from preprocessing import OCR_PRESET, OCR_PRESETS
+from vault import PiiVault
+
+# Each document goes through these stages in order:
+#   ocr     - classify pages and OCR the image-only ones into a searchable copy
+#   detect  - batched NLP and pattern detection over every page
+#   encrypt - key derivation and encryption of every detected item
+#   write   - redaction of the detected regions and the save
+STAGES = ("ocr", "detect", "encrypt", "write")
+
+# Seconds per document assumed for a stage until one has finished, and the
+# weight a new measurement gets in the running average
+INITIAL_STAGE_SECONDS = {"ocr": 2.0, "detect": 0.5, "encrypt": 0.1, "write": 0.3}
+LATENCY_SMOOTHING = 0.3
+
+# Documents waiting in front of each stage, per worker
+STAGE_QUEUE_DEPTH_PER_WORKER = 2
+
+# Rough resident size of one worker process: a loaded analyzer plus the pages it works on
+WORKER_MEMORY_MB = 1024
+
+_worker_vault = None
+
+
+# Worker processes allowed by the budgets; each is one CPU slot
+def pipeline_workers(cpu_budget=None, memory_budget_mb=None):
+    workers = cpu_budget or os.cpu_count() or 1
+    if memory_budget_mb:
+        workers = min(workers, max(1, int(memory_budget_mb // WORKER_MEMORY_MB)))
+    return workers
+
+
+class StageScheduler:
+    """Decides which stage gets the next free worker slot.
+
+    Every stage has a bounded queue of documents. Slots are shared out in
+    proportion to the work waiting in each stage (queued and running
+    documents times the stage's average seconds per document), so a batch
+    of scans shifts slots to OCR and a run of text documents shifts them to
+    detection. A stage whose downstream queue is full is held back, which
+    keeps the documents held between stages bounded. A free slot is never
+    left idle while any stage has work it may start.
+    """
+
+    def __init__(self, workers, queue_depth):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.queues = {stage: deque() for stage in STAGES}
+        self.running = {stage: 0 for stage in STAGES}
+        self.latency = dict(INITIAL_STAGE_SECONDS)
+
+    def observe(self, stage, seconds):
+        self.latency[stage] += LATENCY_SMOOTHING * (seconds - self.latency[stage])
+
+    # Target number of slots per stage (fractional), from depth and latency
+    def allocation(self):
+        backlog = {stage: (len(self.queues[stage]) + self.running[stage]) * self.latency[stage] for stage in STAGES}
+        total = sum(backlog.values())
+        return {stage: self.workers * backlog[stage] / total if total else 0.0 for stage in STAGES}
+
+    def _blocked(self, stage):
+        index = STAGES.index(stage)
+        return index + 1 < len(STAGES) and len(self.queues[STAGES[index + 1]]) >= self.queue_depth
+
+    def has_room(self, stage):
+        return len(self.queues[stage]) < self.queue_depth
+
+    # Stage the next free slot should run, or None when no stage can start anything
+    def next_stage(self):
+        allocation = self.allocation()
+        ready = [stage for stage in STAGES if self.queues[stage] and not self._blocked(stage)]
+        if not ready:
+            return None
+        # Furthest below its share first; ties go to the later stage so documents drain
+        return max(reversed(ready), key=lambda stage: allocation[stage] - self.running[stage])
+
+    def start(self, stage):
+        self.running[stage] += 1
+        return self.queues[stage].popleft()
+
+    def finish(self, stage):
+        self.running[stage] -= 1
+
+
+def _init_pipeline_worker(vault_path=None):
+    global _worker_vault
+    # One slot is one core: without this Tesseract starts a thread per core inside every OCR task
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    get_analyzer()
+    if vault_path:
+        _worker_vault = PiiVault(vault_path)
+
+# Searchable copies go to work_directory, which run_pipeline removes afterwards
+def _ocr_stage(pdf_path, work_directory, ocr_preset):
+    with metrics.timer("searchability"), fitz.open(pdf_path) as pdf_document:
+        ocr_pages = pages_needing_ocr(pdf_document)
+    if not ocr_pages:
+        return pdf_path
+    searchable_pdf_path = os.path.join(work_directory, f"searchable_{os.path.basename(pdf_path)}")
+    with metrics.timer("ocr"):
+        return make_pdf_searchable(pdf_path, searchable_pdf_path, ocr_workers=1, pages=ocr_pages, preset=ocr_preset)
+
+# {page_num: detections} for the searchable copy, which is what gets redacted
+def _detect_stage(source_path):
+    with fitz.open(source_path) as pdf_document:
+        pages = [(page.number, page.number, PageTextIndex(page).text) for page in pdf_document]
+    with metrics.timer("detection"):
+        return detect_pages_pii(pages, get_analyzer())
+
+class _EncryptedRecords:
+    """Stands in for EnvelopeEncryptor in the write stage.
+
+    The encrypt stage has already encrypted every detection, page by page in
+    the order redact_page visits them, so encrypt() has nothing left to do
+    and the payload and vault entries are the ones handed over.
+    """
+
+    def __init__(self, header, entries):
+        self.header = header
+        self._entries = entries
+
+    def encrypt(self, pii_data, page=None, entity_type=None, start=None, end=None):
+        pass
+
+    def entries(self):
+        return self._entries
+
+    def take_payload(self):
+        return build_payload(self.header, [entry[0] for entry in self._entries]) if self._entries else None
+
+# One key derivation per document; returns the key header and
+# (record, page, entity_type, start, end) entries, which are all the write stage needs
+def _encrypt_stage(detections, password):
+    with metrics.timer("encryption"):
+        encryptor = EnvelopeEncryptor(password)
+        for page_num in sorted(detections):
+            for detected_text, start, end, entity_type in detections[page_num]:
+                encryptor.encrypt(detected_text, page_num, entity_type, start, end)
+    return encryptor.header, encryptor.entries()
+
+def _write_stage(pdf_path, source_path, output_directory, detections, encrypted):
+    detected_counts = {"AADHAR": 0, "PAN": 0, "EMAIL_ADDRESS": 0, "PHONE_NUMBER": 0}
+    redacted_pdf_path = os.path.join(output_directory, f"redacted_{os.path.basename(pdf_path)}")
+    document_hash = file_hash(pdf_path) if _worker_vault is not None else None
+    if not redact_text_in_pdf(source_path, redacted_pdf_path, detected_counts, encryptor=_EncryptedRecords(*encrypted), detections=detections,
+                              vault=_worker_vault, document_hash=document_hash, document_name=os.path.basename(pdf_path)):
+        raise ProcessingFailed(f"could not redact {os.path.basename(pdf_path)}")
+    if _worker_vault is not None:
+        _worker_vault.flush()
+    return detected_counts
+
+_STAGE_FUNCTIONS = {"ocr": _ocr_stage, "detect": _detect_stage, "encrypt": _encrypt_stage, "write": _write_stage}
+
+# Runs in a worker; returns (result, error, metric events, seconds spent)
+def _run_stage(stage, document_name, *args):
+    start = time.perf_counter()
+    with metrics.document(document_name):
+        try:
+            result, error = _STAGE_FUNCTIONS[stage](*args), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+    return result, error, metrics.drain(), time.perf_counter() - start
+
+def _stage_args(stage, document, output_directory, work_directory, ocr_preset, password):
+    if stage == "ocr":
+        return (document["pdf_path"], work_directory, ocr_preset)
+    if stage == "detect":
+        return (document["source_path"],)
+    if stage == "encrypt":
+        return (document["detections"], password)
+    return (document["pdf_path"], document["source_path"], output_directory, document["detections"], document["encrypted"])
+
+# The searchable copy of a finished or failed document is not needed any more
+def _remove_intermediate(document):
+    source_path = document.get("source_path")
+    if source_path and source_path != document["pdf_path"] and os.path.exists(source_path):
+        os.remove(source_path)
+
+def run_pipeline(input_directory, output_directory, cpu_budget=None, memory_budget_mb=None, vault_path=None, ocr_preset=OCR_PRESET,
+                 password='hello'):
+    """Redact every PDF in input_directory with the stages of all documents sharing one worker pool.
+
+    Unlike process_files_in_parallel, which runs each document start to
+    finish on one worker, every stage of every document is a separate task
+    and StageScheduler picks the stage each free worker runs next, so OCR
+    of scans overlaps detection, encryption and writing of text documents.
+    Scanned pages go through a searchable copy (as with OCR_DIRECT_DETECTION
+    off), kept in a temporary directory until the document is written.
+    Returns a list of (filename, detected_counts, error) tuples sorted by
+    filename, like process_files_in_parallel.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    workers = pipeline_workers(cpu_budget, memory_budget_mb)
+    scheduler = StageScheduler(workers, STAGE_QUEUE_DEPTH_PER_WORKER * workers)
+    pdf_files = sorted(f for f in os.listdir(input_directory) if f.lower().endswith('.pdf'))
+    queued = iter(pdf_files)
+    results = {}
+    in_flight = {}
+    busy_seconds = 0.0
+    start = time.perf_counter()
+    work_directory = tempfile.mkdtemp(prefix="pii_pipeline_")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pipeline_worker, initargs=(vault_path,)) as pool:
+            while True:
+                # New documents enter through the OCR queue, which is bounded like the others
+                while scheduler.has_room("ocr"):
+                    filename = next(queued, None)
+                    if filename is None:
+                        break
+                    scheduler.queues["ocr"].append({"name": filename, "pdf_path": os.path.join(input_directory, filename)})
+
+                while len(in_flight) < workers:
+                    stage = scheduler.next_stage()
+                    if stage is None:
+                        break
+                    document = scheduler.start(stage)
+                    try:
+                        future = pool.submit(_run_stage, stage, document["name"],
+                                             *_stage_args(stage, document, output_directory, work_directory, ocr_preset, password))
+                    except Exception as e:
+                        scheduler.finish(stage)
+                        results[document["name"]] = (None, f"{type(e).__name__}: {e}")
+                        _remove_intermediate(document)
+                        continue
+                    in_flight[future] = (stage, document)
+                log_verbose("Stage slots: " + ", ".join(
+                    f"{stage} {scheduler.running[stage]}/{share:.1f} (queue {len(scheduler.queues[stage])}, {scheduler.latency[stage]:.2f}s)"
+                    for stage, share in scheduler.allocation().items()))
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, document = in_flight.pop(future)
+                    scheduler.finish(stage)
+                    try:
+                        result, error, events, seconds = future.result()
+                    except Exception as e:
+                        # Worker crashed (e.g. killed by the OS); only this document is marked failed
+                        result, error, events, seconds = None, f"{type(e).__name__}: {e}", [], 0.0
+                    metrics.merge(events)
+                    busy_seconds += seconds
+                    if error:
+                        results[document["name"]] = (None, error)
+                        _remove_intermediate(document)
+                        continue
+                    scheduler.observe(stage, seconds)
+                    metrics.record_timing(f"pipeline_{stage}", seconds)
+                    if stage == "ocr":
+                        document["source_path"] = result
+                        scheduler.queues["detect"].append(document)
+                    elif stage == "detect":
+                        document["detections"] = result
+                        scheduler.queues["encrypt"].append(document)
+                    elif stage == "encrypt":
+                        document["encrypted"] = result
+                        scheduler.queues["write"].append(document)
+                    else:
+                        results[document["name"]] = (result, None)
+                        _remove_intermediate(document)
+                        print(f"Redacted {document['name']}: {result}")
+                metrics.flush()
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    for filename in pdf_files:
+        if results[filename][1]:
+            print(f"Failed to process {filename}: {results[filename][1]}")
+    elapsed = time.perf_counter() - start
+    # Includes pool start-up and analyzer loading, so short runs read low
+    utilization = busy_seconds / (workers * elapsed) if elapsed else 0.0
+    print(f"Pipeline processed {len(pdf_files)} documents in {elapsed:.2f}s on {workers} workers ({100 * utilization:.0f}% busy)")
+    return [(filename,) + results[filename] for filename in pdf_files]
+
+def main():
+    parser = argparse.ArgumentParser(description="Redact a folder of PDFs with OCR, detection, encryption and writing scheduled as separate stages.")
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("--cpu-budget", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--memory-budget-mb", type=float, help=f"caps workers at about {WORKER_MEMORY_MB} MB each")
+    parser.add_argument("--vault")
+    parser.add_argument("--ocr-preset", default=OCR_PRESET, choices=sorted(OCR_PRESETS))
+    args = parser.parse_args()
+    run_pipeline(args.input_directory, args.output_directory, args.cpu_budget, args.memory_budget_mb, args.vault, args.ocr_preset)
+
+if __name__ == "__main__":
+    main()
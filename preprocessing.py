@@ -0,0 +1,138 @@
+'''
+File: preprocessing.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import fitz
+from metrics import metrics
+
+# Preprocessing applied to a scanned page before Tesseract sees it:
+#   dpi          - render resolution, or the fallback when adaptive_dpi finds no text
+#   adaptive_dpi - (min, max) DPI range picked per page from the estimated text size,
+#                  or None to always render at dpi
+#   grayscale    - render one channel instead of RGB
+#   binarize     - Otsu threshold to pure black and white (implies grayscale)
+#   deskew       - straighten pages scanned at a slight angle
+# The rendered image is also what ends up in the searchable PDF, so "fast"
+# output pages are black and white.
+OCR_PRESETS = {
+    "accurate": {"dpi": 300, "adaptive_dpi": None, "grayscale": False, "binarize": False, "deskew": True},
+    "balanced": {"dpi": 200, "adaptive_dpi": (150, 300), "grayscale": True, "binarize": False, "deskew": True},
+    "fast": {"dpi": 150, "adaptive_dpi": (100, 200), "grayscale": True, "binarize": True, "deskew": False},
+}
+OCR_PRESET = "balanced"
+
+# Adaptive DPI renders a cheap probe, measures the median glyph height (close
+# to the cap height) and picks the DPI that makes it about TARGET_GLYPH_HEIGHT_PX
+# pixels tall; Tesseract gains little accuracy above that and only gets slower
+PROBE_DPI = 72
+TARGET_GLYPH_HEIGHT_PX = 30
+DPI_STEP = 25
+
+# Skew below MIN_DESKEW_DEGREES is left alone; above MAX_DESKEW_DEGREES the
+# estimate is more likely a layout artifact than a tilted scan
+MIN_DESKEW_DEGREES = 0.2
+MAX_DESKEW_DEGREES = 10.0
+DESKEW_SAMPLE_POINTS = 200000
+
+
+def _render_array(page, dpi, grayscale):
+    import numpy as np
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY if grayscale else fitz.csRGB, alpha=False)
+    array = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+    return array[:, :, 0].copy() if grayscale else array.copy()
+
+# Dark pixels as 255 on a 0 background, as the contour and component functions expect
+def _ink_mask(gray):
+    import cv2
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return mask
+
+# Median glyph height in points, or None when the page has nothing text-like
+def estimate_text_height(page):
+    import cv2
+    import numpy as np
+    mask = _ink_mask(_render_array(page, PROBE_DPI, grayscale=True))
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    # Drop specks, rules and images: glyphs are small and not much wider than tall
+    glyphs = heights[(heights >= 2) & (heights <= PROBE_DPI) & (widths <= 3 * heights)]
+    if len(glyphs) < 10:
+        return None
+    return float(np.median(glyphs)) * 72 / PROBE_DPI
+
+def choose_dpi(page, preset=OCR_PRESET):
+    settings = OCR_PRESETS[preset]
+    if not settings["adaptive_dpi"]:
+        return settings["dpi"]
+    text_height = estimate_text_height(page)
+    if not text_height:
+        return settings["dpi"]
+    min_dpi, max_dpi = settings["adaptive_dpi"]
+    dpi = TARGET_GLYPH_HEIGHT_PX * 72 / text_height
+    return int(max(min_dpi, min(max_dpi, round(dpi / DPI_STEP) * DPI_STEP)))
+
+# Skew angle in degrees (counter-clockwise positive), 0.0 when there is no usable estimate
+def estimate_skew(gray):
+    import cv2
+    import numpy as np
+    points = np.column_stack(np.nonzero(_ink_mask(gray)))[:, ::-1]
+    if len(points) < 100:
+        return 0.0
+    if len(points) > DESKEW_SAMPLE_POINTS:
+        points = points[::len(points) // DESKEW_SAMPLE_POINTS + 1]
+    angle = cv2.minAreaRect(points.astype(np.float32))[-1]
+    # minAreaRect reports [-90, 0) or (0, 90] depending on the OpenCV version; fold into (-45, 45]
+    while angle <= -45:
+        angle += 90
+    while angle > 45:
+        angle -= 90
+    # Image rows grow downwards, so the rectangle's angle is the negated skew
+    angle = -angle
+    if abs(angle) < MIN_DESKEW_DEGREES or abs(angle) > MAX_DESKEW_DEGREES:
+        return 0.0
+    return angle
+
+def _rotate(array, angle):
+    import cv2
+    height, width = array.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), -angle, 1.0)
+    border = 255 if array.ndim == 2 else (255, 255, 255)
+    # Same size as the input so the OCR'd page keeps the original page size
+    return cv2.warpAffine(array, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=border)
+
+def preprocess_page_image(page, preset=OCR_PRESET):
+    """Render page for Tesseract using the given preset; returns a PIL image.
+
+    The image's 'dpi' info is the DPI it was rendered at, so Tesseract's
+    output page has the same size as the original page whatever DPI the
+    preset picked; 'deskew_angle' is the rotation that was undone. Rendering directly at the chosen DPI is also what scales
+    oversized scans down.
+    """
+    import cv2
+    from PIL import Image
+    settings = OCR_PRESETS[preset]
+    with metrics.timer("ocr_preprocess"):
+        dpi = choose_dpi(page, preset)
+        grayscale = settings["grayscale"] or settings["binarize"]
+        array = _render_array(page, dpi, grayscale)
+
+        angle = 0.0
+        if settings["deskew"]:
+            gray = array if grayscale else cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+            angle = estimate_skew(gray)
+            if angle:
+                array = _rotate(array, angle)
+        if settings["binarize"]:
+            _, array = cv2.threshold(array, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+        image = Image.fromarray(array)
+    # Passed to Tesseract as --dpi (pytesseract does not write it into its temp file)
+    image.info['dpi'] = (dpi, dpi)
+    # Needed to map OCR word boxes back onto the original page (see OcrTextIndex)
+    image.info['deskew_angle'] = angle
+    return image
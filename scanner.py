@@ -0,0 +1,141 @@
+'''
+File: scanner.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import re
+from bisect import bisect_left, bisect_right
+
+# Define PII regex patterns
+AADHAAR_PATTERN = r'\b(?:\d{4}[-\s]?){2}\d{4}|\b\d{12}\b'
+PAN_PATTERN = r"\b[A-Z]{5}\d{4}[A-Z]{1}\b"
+EMAIL_PATTERN = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
+#DOB_PATTERN = r'\b(?:\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{2,4}[/-]\d{1,2}[/-]\d{1,2})\b'
+PHONE_PATTERN = r'(?:(?:\+\d{1,3})?\s?\(?\d{1,4}?\)?[\s.-]?\d{1,4}[\s.-]?\d{1,4}[\s.-]?\d{1,9})'
+
+# Entity type -> pattern, in priority order: where two patterns could match
+# at the same position the earlier one wins. EMAIL_ADDRESS goes first so the
+# digits of an address are not split off as a phone number.
+PII_PATTERNS = {
+    "EMAIL_ADDRESS": EMAIL_PATTERN,
+    "AADHAR": AADHAAR_PATTERN,
+    "PAN": PAN_PATTERN,
+    "PHONE_NUMBER": PHONE_PATTERN,
+}
+
+COMPILED_PATTERNS = {entity_type: re.compile(pattern) for entity_type, pattern in PII_PATTERNS.items()}
+
+# Entity types whose patterns can never match overlapping text share one
+# alternation pass (match.lastgroup names the type). Types that can overlap
+# (an Aadhaar number is also a phone number, a PAN can start an email
+# address) get passes of their own, since in an alternation the match that
+# starts first would consume the other.
+SCANNER_GROUPS = [("AADHAR", "PAN"), ("EMAIL_ADDRESS",), ("PHONE_NUMBER",)]
+PII_SCANNERS = [
+    (set(group), re.compile("|".join(f"(?P<{entity_type}>{PII_PATTERNS[entity_type]})" for entity_type in group)))
+    for group in SCANNER_GROUPS
+]
+
+# Every pattern above needs a digit or an '@', so text without either has no PII
+PII_PREFILTER = re.compile(r"[\d@]")
+
+# Where detections overlap, the entity type with the higher priority wins,
+# then the higher confidence, then the longer span. An Aadhaar number is
+# also a valid phone number, so AADHAR must outrank PHONE_NUMBER.
+ENTITY_PRIORITY = {
+    "AADHAR": 40,
+    "PAN": 30,
+    "EMAIL_ADDRESS": 20,
+    "PHONE_NUMBER": 10,
+}
+
+# Confidence of a regex scanner hit (Presidio results carry their own score)
+SCANNER_SCORE = 1.0
+
+
+def may_contain_pii(text):
+    return PII_PREFILTER.search(text) is not None
+
+# Scan text for the given entity types (default: all), one pass per scanner group they touch.
+# Returns (detected_text, start, end, entity_type) tuples ordered by start; spans of
+# different groups may overlap, so callers combine them with resolve_overlaps().
+def scan_text(text, entity_types=None):
+    spans = []
+    if not may_contain_pii(text):
+        return spans
+    for group, scanner in PII_SCANNERS:
+        if entity_types is not None and not group & set(entity_types):
+            continue
+        for match in scanner.finditer(text):
+            entity_type = match.lastgroup
+            if entity_types is None or entity_type in entity_types:
+                spans.append((match.group(), match.start(), match.end(), entity_type))
+    spans.sort(key=lambda span: span[1])
+    return spans
+
+def resolve_overlaps(candidates, priority=None, text=None):
+    """Keep one detection per overlapping region.
+
+    candidates are (detected_text, start, end, entity_type, score) tuples
+    from any mix of sources. They are ranked by priority (default
+    ENTITY_PRIORITY), score and length, and each one wins only if it does
+    not overlap a span already won. Winning spans stay sorted and disjoint,
+    so each overlap check is a binary search. A losing candidate is not
+    counted, but any part of it outside the winners is added to the winner
+    it overlaps, so the whole region it covered is still redacted. The
+    text of a grown span comes from text (what the offsets index into)
+    when given, else from the candidates' own texts. Returns
+    (detected_text, start, end, entity_type) tuples ordered by start.
+    """
+    if priority is None:
+        priority = ENTITY_PRIORITY
+    ranked = sorted(candidates, key=lambda c: (-priority.get(c[3], 0), -c[4], c[1] - c[2], c[1]))
+
+    starts, ends, winners, losers = [], [], [], []
+    for candidate in ranked:
+        detected_text, start, end, entity_type, _ = candidate
+        position = bisect_left(starts, start)
+        if (position > 0 and ends[position - 1] > start) or (position < len(starts) and starts[position] < end):
+            losers.append(candidate)
+            continue
+        starts.insert(position, start)
+        ends.insert(position, end)
+        winners.insert(position, [detected_text, start, end, entity_type])
+
+    # Winners first..last overlap this loser. Its part before the first goes to
+    # the first, its part after the last to the last, and gaps between two
+    # winners to the earlier one; the winners stay disjoint.
+    grown = set()
+    for _, start, end, _, _ in losers:
+        first = bisect_right(ends, start)
+        last = bisect_left(starts, end) - 1
+        if start < starts[first]:
+            starts[first] = winners[first][1] = start
+            grown.add(first)
+        for position in range(first, last):
+            if ends[position] < starts[position + 1]:
+                ends[position] = winners[position][2] = starts[position + 1]
+                grown.add(position)
+        if end > ends[last]:
+            ends[last] = winners[last][2] = end
+            grown.add(last)
+
+    if grown and text is None:
+        # Candidates whose text is exactly their span supply the characters
+        chars = {}
+        for detected_text, start, end, _, _ in candidates:
+            if len(detected_text) == end - start:
+                chars.update(zip(range(start, end), detected_text))
+    for position in grown:
+        _, start, end, _ = winners[position]
+        winners[position][0] = text[start:end].strip() if text is not None else ''.join(chars.get(i, ' ') for i in range(start, end)).strip()
+    return [tuple(winner) for winner in winners]
+
+def is_valid_pii(detected_text, entity_type):
+    pattern = COMPILED_PATTERNS.get(entity_type)
+    if pattern is None:
+        return False  # Default case if no match is found
+    return pattern.match(detected_text) is not None
@@ -0,0 +1,269 @@
+'''
+File: service.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import json
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from analyzer import ANALYZER_ENTITIES, NLP_BATCH_SIZE, get_analyzer, analyze_texts
+from main import ProcessingFailed, process_pdf
+from metrics import metrics
+
+# Local-only by default; other processes on the box POST PDFs here
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+
+# Documents processed at once, and how many more may wait before requests get 503
+MAX_CONCURRENT_JOBS = 2
+MAX_QUEUED_JOBS = 16
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+# Pages from concurrent jobs are gathered for up to BATCH_WINDOW_SECONDS
+# (or MAX_BATCH_PAGES pages) and analyzed in one NLP call
+BATCH_WINDOW_SECONDS = 0.01
+MAX_BATCH_PAGES = NLP_BATCH_SIZE
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class PageBatcher:
+    """Stand-in for AnalyzerEngine that shares NLP calls between jobs.
+
+    analyze() has the same call shape as AnalyzerEngine.analyze, so the
+    normal page pipeline can use it unchanged. Each call blocks its job's
+    thread while a single batching thread collects the texts waiting from
+    all jobs and runs them through analyze_texts() together. With a lock,
+    which every calling job holds around its PyMuPDF work, the lock is
+    released while a job waits for its batch so another job can use
+    PyMuPDF meanwhile.
+    """
+
+    def __init__(self, analyzer, max_batch_pages=MAX_BATCH_PAGES, batch_window=BATCH_WINDOW_SECONDS, lock=None):
+        self.analyzer = analyzer
+        self.max_batch_pages = max_batch_pages
+        self.batch_window = batch_window
+        self.lock = lock
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, name="page-batcher", daemon=True).start()
+
+    def analyze(self, text, entities=ANALYZER_ENTITIES, language='en'):
+        return self.analyze_texts([text], entities)[0]
+
+    # Many texts of one job at once (used by analyzer.analyze_texts), so a chunk
+    # of pages waits for one batch window instead of one per page
+    def analyze_texts(self, texts, entities=ANALYZER_ENTITIES):
+        futures = []
+        for text in texts:
+            futures.append(Future())
+            self.requests.put((text, tuple(entities), futures[-1]))
+        if self.lock is None:
+            return [future.result() for future in futures]
+        self.lock.release()
+        try:
+            return [future.result() for future in futures]
+        finally:
+            self.lock.acquire()
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_pages:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # Requests for different entity lists cannot share a call
+            by_entities = {}
+            for request in batch:
+                by_entities.setdefault(request[1], []).append(request)
+            for entities, requests in by_entities.items():
+                try:
+                    with metrics.timer("nlp_batch"):
+                        results = analyze_texts(self.analyzer, [text for text, _, _ in requests], list(entities))
+                    metrics.count("nlp_pages", len(requests))
+                    for (_, _, future), result in zip(requests, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, _, future in requests:
+                        future.set_exception(e)
+            metrics.count("nlp_batches")
+
+
+class RedactionService:
+    """Runs process_pdf for submitted documents with a warm analyzer.
+
+    At most max_concurrent jobs run at a time; up to max_queued more wait
+    for a slot, and anything beyond that is refused with ServiceBusy so
+    callers can back off instead of piling up. PyMuPDF must not be used
+    from two threads at once, so running jobs take turns on fitz_lock and
+    only their NLP calls, gathered by the PageBatcher, overlap.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS,
+                 max_batch_pages=MAX_BATCH_PAGES, batch_window=BATCH_WINDOW_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.fitz_lock = threading.Lock()
+        self.batcher = PageBatcher(get_analyzer(), max_batch_pages, batch_window, self.fitz_lock)
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+
+    def status(self):
+        with self.lock:
+            return {"pending": self.pending, "completed": self.completed,
+                    "max_concurrent": self.max_concurrent, "max_queued": self.max_queued}
+
+    # Returns (path of the output PDF, detected counts); the caller removes work_dir.
+    # Raises ProcessingFailed rather than ever returning an unredacted document.
+    def redact(self, pdf_path, work_dir):
+        with self.lock:
+            if self.pending >= self.max_concurrent + self.max_queued:
+                metrics.count("jobs_rejected")
+                raise ServiceBusy()
+            self.pending += 1
+        try:
+            with self.slots, self.fitz_lock:
+                # No ground truth for submitted documents
+                detected_counts = process_pdf(pdf_path, work_dir, True, os.devnull, self.batcher, plot=False, strict=True)
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+            metrics.flush()
+
+        redacted_pdf_path = os.path.join(work_dir, f"redacted_{os.path.basename(pdf_path)}")
+        if os.path.exists(redacted_pdf_path):
+            return redacted_pdf_path, detected_counts
+        if any(detected_counts.values()):
+            raise ProcessingFailed(f"no redacted output for {os.path.basename(pdf_path)}")
+        # Processed successfully and found no PII: the document is returned unchanged
+        return pdf_path, detected_counts
+
+
+class RedactionRequestHandler(BaseHTTPRequestHandler):
+    """POST /redact with a PDF body returns the redacted PDF; GET /health returns queue status."""
+
+    service = None
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self.send_error(404)
+            return
+        self._send_json(200, self.service.status())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/redact":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0 or length > MAX_UPLOAD_BYTES:
+            self._send_json(413 if length > 0 else 411, {"error": "a PDF body of at most MAX_UPLOAD_BYTES is required"})
+            return
+
+        # Only the base name is used, so the query cannot point outside the work directory
+        name = os.path.basename(parse_qs(url.query).get("name", ["document.pdf"])[0]) or "document.pdf"
+        if not name.lower().endswith(".pdf"):
+            name += ".pdf"
+
+        work_dir = tempfile.mkdtemp(prefix="pii_service_")
+        try:
+            pdf_path = os.path.join(work_dir, name)
+            with open(pdf_path, 'wb') as pdf_file:
+                remaining = length
+                while remaining:
+                    chunk = self.rfile.read(min(STREAM_CHUNK_BYTES, remaining))
+                    if not chunk:
+                        break
+                    pdf_file.write(chunk)
+                    remaining -= len(chunk)
+
+            try:
+                start = time.perf_counter()
+                output_path, detected_counts = self.service.redact(pdf_path, work_dir)
+            except ServiceBusy:
+                self.send_response(503)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            except Exception as e:
+                self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(os.path.getsize(output_path)))
+            self.send_header("X-PII-Detected-Counts", json.dumps(detected_counts))
+            self.send_header("X-Processing-Seconds", f"{time.perf_counter() - start:.3f}")
+            self.end_headers()
+            with open(output_path, 'rb') as output_file:
+                shutil.copyfileobj(output_file, self.wfile, STREAM_CHUNK_BYTES)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _send_json(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}")
+
+
+def create_server(host=SERVICE_HOST, port=SERVICE_PORT, service=None):
+    # The analyzer is loaded here, before the first request arrives
+    handler = type("BoundRedactionRequestHandler", (RedactionRequestHandler,), {"service": service or RedactionService()})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PII redaction over a local HTTP API with a warm analyzer.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_JOBS, help="documents processed at once")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED_JOBS, help="waiting documents before requests get 503")
+    parser.add_argument("--max-batch-pages", type=int, default=MAX_BATCH_PAGES)
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_SECONDS * 1000)
+    args = parser.parse_args()
+
+    service = RedactionService(args.concurrency, args.max_queued, args.max_batch_pages, args.batch_window_ms / 1000)
+    server = create_server(args.host, args.port, service)
+    print(f"Serving PII redaction on http://{args.host}:{args.port}/redact")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+'''
+File: streaming.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import json
+import argparse
+import fitz
+from concurrent.futures import ThreadPoolExecutor
+from pikepdf import Pdf, AttachedFileSpec
+from analyzer import get_analyzer
+from cache import ResultCache, config_fingerprint, file_hash
+from encryption import EnvelopeEncryptor, build_payload, PAYLOAD_ATTACHMENT_NAME, PAYLOAD_FILENAME
+from main import DETECTOR_FINGERPRINT, redact_page, ocr_fingerprint, ocr_page_image, page_needs_ocr, splice_ocr_page, OCR_WORKERS
+from preprocessing import OCR_PRESET, OCR_PRESETS, preprocess_page_image
+from metrics import metrics
+from vault import PiiVault
+
+# Pages held in memory at once (source copy, rendered images and OCR output)
+DEFAULT_PAGE_BUDGET = 16
+
+
+def _checkpoint_paths(redacted_pdf_path):
+    return {
+        "checkpoint": f"{redacted_pdf_path}.checkpoint.json",
+        "records": f"{redacted_pdf_path}.records",
+        "part": f"{redacted_pdf_path}.part{{:05d}}.pdf",
+    }
+
+# Identifies the input so a checkpoint is never resumed against a different file
+def _source_fingerprint(pdf_path):
+    stat = os.stat(pdf_path)
+    return {"path": os.path.abspath(pdf_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+def _load_checkpoint(checkpoint_path, fingerprint, page_budget):
+    try:
+        with open(checkpoint_path, 'r') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("source") != fingerprint or checkpoint.get("page_budget") != page_budget:
+        print(f"Ignoring stale checkpoint {os.path.normpath(checkpoint_path)}")
+        return None
+    return checkpoint
+
+def _save_checkpoint(checkpoint_path, checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temp_path, checkpoint_path)
+
+# OCR the image-only pages of a window in place, keeping page order; first_page is the
+# window's first page in the source document, used to label the OCR timings
+def _ocr_window(window_document, ocr_workers, ocr_preset=OCR_PRESET, first_page=0):
+    scanned = [page.number for page in window_document if page_needs_ocr(page)]
+    if not scanned:
+        return 0
+    images = [preprocess_page_image(window_document[page_num], ocr_preset) for page_num in scanned]
+    with ThreadPoolExecutor(max_workers=ocr_workers) as pool:
+        futures = [pool.submit(ocr_page_image, image, **metrics.labels(page=first_page + page_num + 1))
+                   for page_num, image in zip(scanned, images)]
+        page_pdfs = [future.result() for future in futures]
+    for page_num, page_pdf_bytes in zip(scanned, page_pdfs):
+        splice_ocr_page(window_document, page_num, page_pdf_bytes)
+    return len(scanned)
+
+def process_pdf_streaming(pdf_path, output_directory, page_budget=DEFAULT_PAGE_BUDGET, analyzer=None, ocr_workers=OCR_WORKERS, password='hello', ocr_preset=OCR_PRESET,
+                          cache=None, vault=None):
+    """Redact a large PDF page_budget pages at a time with resumable progress.
+
+    Each window of pages is copied out of the source, OCR'd where it has no
+    text layer, redacted, and written to its own part file, so peak memory
+    follows page_budget rather than the document size. After every window a
+    checkpoint records the next page, the detected counts and the part files;
+    running again after a crash continues from there, under the same key. The
+    parts are joined with pikepdf, which streams page content from the part
+    files on save, and the encrypted PII of the whole document is embedded as
+    one attachment. With a cache an unchanged document is skipped, as in
+    process_pdf, and with a vault its records are stored there too.
+    Returns the detected counts.
+    """
+    redacted_pdf_path = os.path.join(output_directory, f"redacted_{os.path.basename(pdf_path)}")
+    input_hash = file_hash(pdf_path) if cache is not None or vault is not None else None
+    if cache is not None:
+        vault_path = os.path.abspath(vault.vault_path) if vault is not None else None
+        output_fingerprint = config_fingerprint("streaming", os.path.abspath(output_directory), ocr_fingerprint(ocr_preset), vault_path)
+        cached_counts = cache.get_result(input_hash, DETECTOR_FINGERPRINT, output_fingerprint)
+        if cached_counts is not None:
+            print(f"Unchanged since last run; reusing cached result for {os.path.normpath(pdf_path)}")
+            metrics.count("cache_hits")
+            return cached_counts
+
+    if analyzer is None:
+        analyzer = get_analyzer()
+    paths = _checkpoint_paths(redacted_pdf_path)
+    fingerprint = _source_fingerprint(pdf_path)
+
+    checkpoint = _load_checkpoint(paths["checkpoint"], fingerprint, page_budget)
+    if checkpoint is None:
+        # One key derivation per run; a resumed run derives the key of this header again
+        encryptor = EnvelopeEncryptor(password)
+        checkpoint = {
+            "source": fingerprint,
+            "page_budget": page_budget,
+            "key_header": encryptor.header,
+            "next_page": 0,
+            "parts": [],
+            "records_size": 0,
+            "detected_counts": {"AADHAR": 0, "PAN": 0, "EMAIL_ADDRESS": 0, "PHONE_NUMBER": 0},
+        }
+        if os.path.exists(paths["records"]):
+            os.remove(paths["records"])
+    else:
+        print(f"Resuming {os.path.normpath(pdf_path)} at page {checkpoint['next_page'] + 1}")
+        encryptor = EnvelopeEncryptor(password, header=checkpoint["key_header"])
+        # Drop records written by a window that never reached its checkpoint
+        if os.path.exists(paths["records"]):
+            with open(paths["records"], 'r+b') as records_file:
+                records_file.truncate(checkpoint["records_size"])
+
+    detected_counts = checkpoint["detected_counts"]
+
+    with fitz.open(pdf_path) as source_document:
+        page_count = len(source_document)
+        for first_page in range(checkpoint["next_page"], page_count, page_budget):
+            last_page = min(first_page + page_budget, page_count) - 1
+            window_counts = dict(detected_counts)
+
+            with fitz.open() as window_document:
+                window_document.insert_pdf(source_document, from_page=first_page, to_page=last_page)
+                pages_ocrd = _ocr_window(window_document, ocr_workers, ocr_preset, first_page)
+                metrics.count("pages_ocr", pages_ocrd)
+                for page in window_document:
+                    redact_page(page, analyzer, encryptor, window_counts, first_page + page.number)
+                part_path = paths["part"].format(len(checkpoint["parts"]))
+                window_document.save(part_path, garbage=4, deflate=True)
+
+            # Records, one JSON entry per line, are made durable before the checkpoint that covers them
+            entries = encryptor.entries()
+            encryptor.take_payload()
+            if entries:
+                with open(paths["records"], 'a') as records_file:
+                    records_file.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+
+            checkpoint["parts"].append(os.path.basename(part_path))
+            checkpoint["next_page"] = last_page + 1
+            checkpoint["detected_counts"] = detected_counts = window_counts
+            if os.path.exists(paths["records"]):
+                checkpoint["records_size"] = os.path.getsize(paths["records"])
+            _save_checkpoint(paths["checkpoint"], checkpoint)
+            print(f"Pages {first_page + 1}-{last_page + 1} of {page_count} done ({pages_ocrd} OCR'd)")
+
+    entries = []
+    if os.path.exists(paths["records"]):
+        with open(paths["records"], 'r') as records_file:
+            entries = [tuple(json.loads(line)) for line in records_file]
+
+    part_paths = [os.path.join(output_directory, part) for part in checkpoint["parts"]]
+    with Pdf.new() as redacted_pdf:
+        part_pdfs = [Pdf.open(part_path) for part_path in part_paths]
+        for part_pdf in part_pdfs:
+            redacted_pdf.pages.extend(part_pdf.pages)
+
+        if entries:
+            payload = build_payload(checkpoint["key_header"], [entry[0] for entry in entries])
+            redacted_pdf.attachments[PAYLOAD_ATTACHMENT_NAME] = AttachedFileSpec(
+                redacted_pdf, payload, filename=PAYLOAD_FILENAME, description="Encrypted PII removed from this document"
+            )
+        redacted_pdf.save(redacted_pdf_path, compress_streams=True)
+        for part_pdf in part_pdfs:
+            part_pdf.close()
+
+    if vault is not None and entries:
+        vault.add_document(input_hash, os.path.basename(pdf_path), checkpoint["key_header"], entries)
+    for path in part_paths + [paths["records"], paths["checkpoint"]]:
+        if os.path.exists(path):
+            os.remove(path)
+    if cache is not None:
+        cache.put_result(input_hash, DETECTOR_FINGERPRINT, output_fingerprint, detected_counts, redacted_pdf_path)
+
+    metrics.count("bytes_written", os.path.getsize(redacted_pdf_path))
+    metrics.flush()
+    print(f"Redacted PDF saved to {os.path.normpath(redacted_pdf_path)}")
+    return detected_counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Redact very large PDFs a window of pages at a time, resuming after a crash.")
+    parser.add_argument("input", help="a PDF, or a directory of PDFs")
+    parser.add_argument("output_directory")
+    parser.add_argument("--page-budget", type=int, default=DEFAULT_PAGE_BUDGET, help="pages held in memory at once")
+    parser.add_argument("--ocr-workers", type=int, default=OCR_WORKERS)
+    parser.add_argument("--ocr-preset", default=OCR_PRESET, choices=sorted(OCR_PRESETS))
+    parser.add_argument("--cache-dir")
+    parser.add_argument("--vault")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        pdf_paths = [os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.lower().endswith('.pdf')]
+    else:
+        pdf_paths = [args.input]
+    os.makedirs(args.output_directory, exist_ok=True)
+    cache = ResultCache(args.cache_dir) if args.cache_dir else None
+    vault = PiiVault(args.vault) if args.vault else None
+    try:
+        for pdf_path in pdf_paths:
+            print(f"\nProcessing file {os.path.normpath(pdf_path)} in windows of {args.page_budget} pages")
+            detected_counts = process_pdf_streaming(pdf_path, args.output_directory, args.page_budget, ocr_workers=args.ocr_workers,
+                                                    ocr_preset=args.ocr_preset, cache=cache, vault=vault)
+            print(f"Detected counts: {detected_counts}")
+            # Each document's records are committed once its PDF is written
+            if vault is not None:
+                vault.flush()
+    finally:
+        if vault is not None:
+            vault.close()
+        if cache is not None:
+            cache.evict()
+            cache.close()
+
+if __name__ == "__main__":
+    main()
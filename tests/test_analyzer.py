@@ -0,0 +1,34 @@
+'''
+File: test_analyzer.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import pytest
+import spacy
+import spacy.cli
+from analyzer import SPACY_MODEL, ensure_spacy_model
+
+
+def test_missing_model_is_downloaded(monkeypatch):
+    downloads = []
+    monkeypatch.setattr(spacy.util, "is_package", lambda name: False)
+    monkeypatch.setattr(spacy.cli, "download", downloads.append)
+    ensure_spacy_model()
+    assert downloads == [SPACY_MODEL]
+
+def test_failed_download_names_the_model_and_the_install_command(monkeypatch):
+    def offline(name):
+        raise SystemExit(1)
+
+    monkeypatch.setattr(spacy.util, "is_package", lambda name: False)
+    monkeypatch.setattr(spacy.cli, "download", offline)
+    with pytest.raises(RuntimeError, match=f"python -m spacy download {SPACY_MODEL}"):
+        ensure_spacy_model()
+
+def test_installed_model_is_not_downloaded(monkeypatch):
+    monkeypatch.setattr(spacy.util, "is_package", lambda name: True)
+    monkeypatch.setattr(spacy.cli, "download", None)
+    ensure_spacy_model()
@@ -0,0 +1,135 @@
+'''
+File: test_cache.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import time
+import fitz
+import pytest
+import main
+import cache as cache_module
+from cache import ResultCache, config_fingerprint, file_hash
+
+
+class NoNlpAnalyzer:
+    # Only the regex scanner finds anything (Aadhaar and PAN)
+    def analyze(self, text, entities, language='en'):
+        return []
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    yield cache
+    cache.close()
+
+def test_result_hit_needs_the_same_fingerprints_and_output(cache, tmp_path):
+    output_path = tmp_path / "redacted.pdf"
+    output_path.write_bytes(b"pdf")
+    counts = {"PAN": 2, "EMAIL_ADDRESS": 0}
+    cache.put_result("input", "detector", "output", counts, str(output_path))
+    assert cache.get_result("input", "detector", "output") == counts
+    assert cache.get_result("input", "other detector", "output") is None
+    assert cache.get_result("input", "detector", "other output") is None
+    assert cache.get_result("other input", "detector", "output") is None
+    # A result whose output file is gone has to be produced again
+    output_path.unlink()
+    assert cache.get_result("input", "detector", "output") is None
+
+def test_result_without_output_file(cache):
+    # Documents without PII have no redacted file
+    cache.put_result("input", "detector", "output", {"PAN": 0}, None)
+    assert cache.get_result("input", "detector", "output") == {"PAN": 0}
+
+def test_spans_round_trip(cache):
+    pages = {0: [("ABCDE1234F", 4, 14, "PAN")], 3: []}
+    cache.put_spans("text", "detector", pages)
+    assert cache.get_spans("text", "detector") == pages
+    assert cache.get_spans("text", "other detector") is None
+
+def test_fingerprints_follow_content_and_settings(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"one")
+    first = file_hash(str(path))
+    path.write_bytes(b"two")
+    assert file_hash(str(path)) != first
+    assert config_fingerprint(["PAN"], "model") == config_fingerprint(["PAN"], "model")
+    assert config_fingerprint(["PAN"], "model") != config_fingerprint(["PAN", "EMAIL_ADDRESS"], "model")
+    assert config_fingerprint({"a": 1, "b": 2}) == config_fingerprint({"b": 2, "a": 1})
+
+def test_evict_drops_old_entries_and_their_files(cache, tmp_path, monkeypatch):
+    searchable_path = tmp_path / "searchable.pdf"
+    searchable_path.write_bytes(b"ocr")
+    now = time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now - 40 * 86400)
+    cached_ocr_path = cache.put_ocr("old", "settings", str(searchable_path))
+    cache.put_spans("old", "detector", {})
+    monkeypatch.setattr(cache_module.time, "time", lambda: now)
+    cache.put_spans("new", "detector", {})
+
+    assert cache.evict(max_age_days=30) == 2
+    assert not os.path.exists(cached_ocr_path)
+    assert cache.get_ocr("old", "settings") is None
+    assert cache.get_spans("old", "detector") is None
+    assert cache.get_spans("new", "detector") == {}
+
+def test_evict_drops_least_recently_used_over_the_size_limit(cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: clock[0])
+    for name in ("a", "b", "c"):
+        clock[0] += 1
+        cache.put_spans(name, "detector", {0: [("x" * 100, 0, 100, "PAN")]})
+    clock[0] += 1
+    # A hit refreshes the entry, so "b" is now the oldest
+    cache.get_spans("a", "detector")
+    size = len(cache.connection.execute("SELECT pages FROM spans WHERE text_hash = 'a'").fetchone()[0])
+
+    assert cache.evict(max_age_days=1e6, max_bytes=2 * size) == 1
+    assert cache.get_spans("b", "detector") is None
+    assert cache.get_spans("a", "detector") is not None
+    assert cache.get_spans("c", "detector") is not None
+
+@pytest.fixture
+def scanned_pdf_path(tmp_path):
+    # Image-only pages, so every page goes through OCR
+    path = str(tmp_path / "scan.pdf")
+    document = fitz.open()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 60, 80), False)
+    pixmap.clear_with(255)
+    for _ in range(2):
+        page = document.new_page()
+        page.insert_image(page.rect, pixmap=pixmap)
+    document.save(path)
+    document.close()
+    return path
+
+def _fake_ocr(calls):
+    def ocr_page_words(image, **labels):
+        calls.append(labels)
+        return {"text": ["PAN", "ABCDE1234F"], "conf": [90, 90], "block_num": [1, 1], "par_num": [1, 1], "line_num": [1, 1],
+                "left": [10, 100], "top": [10, 10], "width": [80, 200], "height": [30, 30]}
+    return ocr_page_words
+
+def test_direct_ocr_reuses_cached_word_boxes(scanned_pdf_path, tmp_path, cache, monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "ocr_page_words", _fake_ocr(calls))
+
+    def run(output_directory, ocr_preset=main.OCR_PRESET):
+        calls.clear()
+        output_directory = str(tmp_path / output_directory)
+        os.makedirs(output_directory)
+        detected_counts = main.process_pdf(scanned_pdf_path, output_directory, True, "", NoNlpAnalyzer(),
+                                           plot=False, cache=cache, ocr_preset=ocr_preset, strict=True)
+        return detected_counts["PAN"], len(calls)
+
+    assert run("first") == (2, 2)
+    # A changed output setting misses the result cache but not the OCR
+    assert run("second") == (2, 0)
+    # Other OCR settings produce other words
+    other_preset = next(preset for preset in main.OCR_PRESETS if preset != main.OCR_PRESET)
+    assert run("third", other_preset) == (2, 2)
+    assert os.path.exists(str(tmp_path / "second" / "redacted_scan.pdf"))
@@ -0,0 +1,76 @@
+'''
+File: test_encryption.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import base64
+import fitz
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from decryption import decrypt_lines, decrypt_payload, decrypt_pdf, payload_lines
+from encryption import ENVELOPE_HEADER_PREFIX, EnvelopeEncryptor, derive_key, embed_payload
+
+
+# A record as the old per-item scheme wrote it: its own salt, AES-CBC, base64
+def _legacy_record(text, password):
+    salt, iv = os.urandom(16), os.urandom(16)
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    encryptor = Cipher(algorithms.AES(derive_key(password, salt)), modes.CBC(iv)).encryptor()
+    encrypted = encryptor.update(padder.update(text.encode()) + padder.finalize()) + encryptor.finalize()
+    return base64.b64encode(salt + iv + encrypted).decode('utf-8')
+
+def test_payload_round_trip():
+    encryptor = EnvelopeEncryptor("secret")
+    items = ["ABCDE1234F", "someone@example.com", "1234 5678 9012"]
+    for page_num, item in enumerate(items):
+        encryptor.encrypt(item, page_num, "PAN", 0, len(item))
+    assert [entry[1:] for entry in encryptor.entries()] == [(n, "PAN", 0, len(item)) for n, item in enumerate(items)]
+
+    payload = encryptor.take_payload()
+    # One key header for the whole document
+    assert sum(line.startswith(ENVELOPE_HEADER_PREFIX) for line in payload_lines(payload)) == 1
+    assert decrypt_payload(payload, "secret") == items
+    # The buffer is handed over once
+    assert encryptor.take_payload() is None
+    assert encryptor.entries() == []
+
+def test_wrong_password_is_reported_once():
+    encryptor = EnvelopeEncryptor("secret")
+    encryptor.encrypt("ABCDE1234F")
+    encryptor.encrypt("PQRST6789K")
+    errors = []
+    assert decrypt_payload(encryptor.take_payload(), "wrong", errors) == []
+    assert len(errors) == 1
+    assert "wrong password" in errors[0]
+
+def test_existing_header_continues_under_the_same_key():
+    first = EnvelopeEncryptor("secret")
+    first.encrypt("ABCDE1234F")
+    resumed = EnvelopeEncryptor("secret", header=first.header)
+    resumed.encrypt("PQRST6789K")
+    assert resumed.header == first.header
+    lines = payload_lines(first.take_payload()) + payload_lines(resumed.take_payload())[1:]
+    assert decrypt_lines(lines, "secret") == ["ABCDE1234F", "PQRST6789K"]
+
+def test_pdf_with_payload_and_legacy_attachments(tmp_path):
+    pdf_path = str(tmp_path / "redacted.pdf")
+    encryptor = EnvelopeEncryptor("secret")
+    encryptor.encrypt("ABCDE1234F")
+    document = fitz.open()
+    document.new_page()
+    embed_payload(document, encryptor.take_payload())
+    # Older versions attached one legacy record per line, numbered from 1
+    for index, text in ((10, "tenth"), (2, "second")):
+        document.embfile_add(f"encrypted_data_line_{index}.txt", (_legacy_record(text, "secret") + "\n").encode())
+    document.save(pdf_path)
+    document.close()
+
+    # Payload first, then the legacy lines in numeric order
+    assert decrypt_pdf(pdf_path, "secret") == ["ABCDE1234F", "second", "tenth"]
+    errors = []
+    assert not set(decrypt_pdf(pdf_path, "wrong", errors)) & {"ABCDE1234F", "second", "tenth"}
+    assert "wrong password" in errors[0]
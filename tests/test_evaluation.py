@@ -0,0 +1,73 @@
+'''
+File: test_evaluation.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import fitz
+import pytest
+import evaluation
+from evaluation import evaluate_corpus, run_evaluation
+from main import load_pii_counts
+
+
+class NoNlpAnalyzer:
+    # Only the regex scanner finds anything (Aadhaar and PAN)
+    def analyze(self, text, entities, language='en'):
+        return []
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    input_directory = tmp_path / "corpus"
+    input_directory.mkdir()
+    texts = {
+        # One PAN expected and found, plus an Aadhaar number the ground truth does not list
+        "a.pdf": "PAN ABCDE1234F and 1234 5678 9012",
+        # Two PANs expected, one found
+        "b.pdf": "PAN PQRST6789K",
+    }
+    for name, text in texts.items():
+        document = fitz.open()
+        document.new_page().insert_text((72, 72), text)
+        document.save(str(input_directory / name))
+        document.close()
+    # A document that cannot be opened
+    (input_directory / "broken.pdf").write_bytes(b"not a pdf")
+    pii_count_file = tmp_path / "pii_counts.txt"
+    pii_count_file.write_text("a.pdf,PAN=1\nb.pdf,PAN=2\nbroken.pdf,PAN=1\n")
+    return str(input_directory), str(pii_count_file)
+
+def test_types_missing_from_the_ground_truth_count_as_false_positives(corpus):
+    ground_truth = load_pii_counts(corpus[1])
+    report = evaluate_corpus(ground_truth, {
+        "a.pdf": {"AADHAR": 1, "PAN": 1, "EMAIL_ADDRESS": 0, "PHONE_NUMBER": 0},
+        "b.pdf": {"AADHAR": 0, "PAN": 1, "EMAIL_ADDRESS": 2, "PHONE_NUMBER": 0},
+        "unlabelled.pdf": {"PAN": 1},
+    })
+    assert report["documents_scored"] == 2
+    assert report["documents_without_ground_truth"] == ["unlabelled.pdf"]
+    assert report["by_type"]["PAN"] == {"expected": 3, "detected": 2, "true_positives": 2, "false_positives": 0, "false_negatives": 1,
+                                        "precision": 1.0, "recall": pytest.approx(2 / 3), "accuracy": pytest.approx(200 / 3)}
+    # Reported under the ground-truth name of the type
+    assert report["by_type"]["EMAIL"]["false_positives"] == 2
+    assert report["by_type"]["EMAIL"]["precision"] == 0.0
+    assert report["by_type"]["AADHAR"]["false_positives"] == 1
+    # Types neither expected nor detected get no row
+    assert {(row["document"], row["pii_type"]) for row in report["by_document"]} == {
+        ("a.pdf", "PAN"), ("a.pdf", "AADHAR"), ("b.pdf", "PAN"), ("b.pdf", "EMAIL")}
+
+def test_corpus_report_is_written(corpus, tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluation, "get_analyzer", NoNlpAnalyzer)
+    input_directory, pii_count_file = corpus
+    report_directory = str(tmp_path / "report")
+    report = run_evaluation(input_directory, str(tmp_path / "out"), pii_count_file, report_directory)
+
+    assert list(report["failed_documents"]) == ["broken.pdf"]
+    assert report["by_type"]["PAN"]["true_positives"] == 2
+    assert report["by_type"]["PAN"]["false_negatives"] == 1
+    assert report["by_type"]["AADHAR"]["false_positives"] == 1
+    assert sorted(os.listdir(report_directory)) == ["evaluation.csv", "evaluation.json", "evaluation.png"]
@@ -0,0 +1,63 @@
+'''
+File: test_metrics.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import json
+import threading
+from metrics import Metrics
+
+
+def test_events_carry_the_document_of_their_thread():
+    metrics = Metrics()
+    with metrics.document("a.pdf"):
+        metrics.count("matches", entity_type="PAN")
+        with metrics.timer("nlp", page=1):
+            pass
+        # document() applies to this thread only; labels() carries it to another
+        labels = metrics.labels(page=2)
+        threads = [threading.Thread(target=metrics.count, args=("unlabelled",)),
+                   threading.Thread(target=metrics.record_timing, args=("ocr_page", 0.5), kwargs=labels)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+    metrics.count("after")
+
+    events = {event.get("name") or event["stage"]: event for event in metrics.drain()}
+    assert events["matches"]["document"] == "a.pdf"
+    assert events["matches"]["entity_type"] == "PAN"
+    assert events["nlp"]["page"] == 1 and events["nlp"]["document"] == "a.pdf"
+    assert "document" not in events["unlabelled"]
+    assert events["ocr_page"] == dict(events["ocr_page"], document="a.pdf", page=2, seconds=0.5)
+    assert "document" not in events["after"]
+    assert metrics.drain() == []
+
+def test_worker_events_are_merged_and_flushed(tmp_path):
+    worker = Metrics()
+    with worker.document("a.pdf"):
+        worker.record_timing("ocr", 1.5, page=1)
+        worker.count("matches", 2, entity_type="PAN")
+    parent = Metrics()
+    parent.record_timing("ocr", 0.5)
+    parent.merge(worker.drain())
+
+    jsonl_path = tmp_path / "metrics.jsonl"
+    prometheus_path = tmp_path / "metrics.prom"
+    parent.flush(str(jsonl_path), str(prometheus_path))
+    parent.flush(str(jsonl_path), str(prometheus_path))
+
+    # Each event is written once
+    events = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+    assert [(event["type"], event.get("document")) for event in events] == [("timing", None), ("timing", "a.pdf"), ("counter", "a.pdf")]
+    # Document and page labels stay out of the Prometheus series
+    assert prometheus_path.read_text().splitlines() == [
+        "# TYPE pii_matches_total counter",
+        'pii_matches_total{entity_type="PAN"} 2',
+        "# TYPE pii_stage_calls_total counter",
+        'pii_stage_calls_total{stage="ocr"} 2',
+        "# TYPE pii_stage_seconds_total counter",
+        'pii_stage_seconds_total{stage="ocr"} 2.0',
+    ]
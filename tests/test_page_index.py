@@ -0,0 +1,84 @@
+'''
+File: test_page_index.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import fitz
+import pytest
+from page_index import PageTextIndex, OcrTextIndex
+
+
+@pytest.fixture
+def page():
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 72), "Name:   John    Doe")
+    page.insert_text((72, 100), "PAN ABCDE1234F")
+    page.insert_text((72, 128), "Aadhaar 1234 5678")
+    page.insert_text((72, 142), "9012 end")
+    yield page
+    document.close()
+
+def test_text_is_whitespace_normalized(page):
+    assert PageTextIndex(page).text == "Name: John Doe PAN ABCDE1234F Aadhaar 1234 5678 9012 end"
+
+def test_one_box_per_character(page):
+    index = PageTextIndex(page)
+    assert len(index.boxes) == len(index.text)
+    assert all((box is None) == (char == ' ') for char, box in zip(index.text, index.boxes))
+
+def test_rects_cover_the_span_on_the_page(page):
+    index = PageTextIndex(page)
+    start = index.text.index("ABCDE1234F")
+    [rect] = index.rects_for_span(start, start + len("ABCDE1234F"))
+    # The rectangle holds exactly the detected text, not its neighbours
+    assert page.get_textbox(rect + (-0.5, 0, 0.5, 0)).strip() == "ABCDE1234F"
+
+def test_span_across_lines_gets_one_rect_per_line(page):
+    index = PageTextIndex(page)
+    start = index.text.index("1234 5678 9012")
+    rects = index.rects_for_span(start, start + len("1234 5678 9012"))
+    assert len(rects) == 2
+    assert rects[0].y1 <= rects[1].y1
+
+def test_empty_span_has_no_rects(page):
+    assert PageTextIndex(page).rects_for_span(3, 3) == []
+
+
+def _words(*words):
+    # image_to_data-style dict; each word is (text, left, top, width, height, line_num)
+    keys = ("text", "left", "top", "width", "height", "line_num")
+    data = {key: [word[i] for word in words] for i, key in enumerate(keys)}
+    data.update(conf=[90] * len(words), block_num=[1] * len(words), par_num=[1] * len(words))
+    return data
+
+def test_ocr_index_maps_word_boxes_to_page_points(page):
+    # 144 dpi: two image pixels per point
+    words = _words(("PAN", 100, 200, 60, 20, 1), ("ABCDE1234F", 180, 200, 200, 20, 1))
+    index = OcrTextIndex(page, words, (1224, 1584), 144)
+    assert index.text == "PAN ABCDE1234F"
+    start = index.text.index("ABCDE1234F")
+    assert index.rects_for_span(start, start + 10) == [fitz.Rect(90, 100, 190, 110)]
+
+def test_ocr_index_skips_empty_and_non_word_entries(page):
+    words = _words(("", 0, 0, 10, 10, 1), ("name", 10, 10, 40, 10, 1))
+    words["conf"][1] = -1
+    assert OcrTextIndex(page, words, (612, 792), 72).text == ""
+
+def test_ocr_index_gives_one_rect_per_line(page):
+    words = _words(("1234", 0, 0, 40, 10, 1), ("5678", 50, 0, 40, 10, 1), ("9012", 0, 20, 40, 10, 2))
+    index = OcrTextIndex(page, words, (612, 792), 72)
+    assert len(index.rects_for_span(0, len(index.text))) == 2
+
+def test_ocr_index_undoes_the_deskew_rotation(page):
+    # The image center is a fixed point of the rotation; a box around it keeps its center
+    words = _words(("X", 296, 386, 20, 20, 1))
+    for angle in (0.0, 3.0, -3.0):
+        [rect] = OcrTextIndex(page, words, (612, 792), 72, angle).rects_for_span(0, 1)
+        assert abs(rect.x0 + rect.x1 - 612) < 1e-6 and abs(rect.y0 + rect.y1 - 792) < 1e-6
+    # A rotated box is covered by a larger upright one
+    [rect] = OcrTextIndex(page, words, (612, 792), 72, 3.0).rects_for_span(0, 1)
+    assert rect.width > 20 and rect.height > 20
@@ -0,0 +1,79 @@
+'''
+File: test_pipeline.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import pytest
+from decryption import decrypt_payload
+from pipeline import LATENCY_SMOOTHING, STAGES, StageScheduler, WORKER_MEMORY_MB, _EncryptedRecords, _encrypt_stage, pipeline_workers
+
+
+def _scheduler(workers=4, queue_depth=4, **queued):
+    scheduler = StageScheduler(workers, queue_depth)
+    # Equal latencies, so shares follow the queues alone
+    scheduler.latency = {stage: 1.0 for stage in STAGES}
+    for stage, count in queued.items():
+        scheduler.queues[stage].extend(f"{stage}{n}" for n in range(count))
+    return scheduler
+
+def test_workers_follow_the_cpu_and_memory_budgets():
+    assert pipeline_workers(cpu_budget=8) == 8
+    assert pipeline_workers(cpu_budget=8, memory_budget_mb=3 * WORKER_MEMORY_MB) == 3
+    # Always at least one worker
+    assert pipeline_workers(cpu_budget=8, memory_budget_mb=1) == 1
+
+def test_slots_are_shared_by_queued_work_times_latency():
+    scheduler = _scheduler(ocr=3, detect=1)
+    assert scheduler.allocation() == {"ocr": 3.0, "detect": 1.0, "encrypt": 0.0, "write": 0.0}
+    scheduler.latency["detect"] = 3.0
+    assert scheduler.allocation()["ocr"] == scheduler.allocation()["detect"] == 2.0
+
+def test_running_documents_count_towards_a_share():
+    scheduler = _scheduler(ocr=3, detect=1)
+    assert scheduler.next_stage() == "ocr"
+    assert scheduler.start("ocr") == "ocr0"
+    assert scheduler.running["ocr"] == 1
+    # Still three OCR documents of work against one started
+    assert scheduler.next_stage() == "ocr"
+    scheduler.start("ocr")
+    scheduler.start("ocr")
+    assert scheduler.next_stage() == "detect"
+    scheduler.finish("ocr")
+    assert scheduler.running["ocr"] == 2
+
+def test_ties_go_to_the_later_stage():
+    assert _scheduler(ocr=1, write=1).next_stage() == "write"
+
+def test_full_downstream_queue_holds_a_stage_back():
+    scheduler = _scheduler(queue_depth=2, ocr=4, detect=2)
+    assert not scheduler.has_room("detect")
+    # OCR has the larger share, but its output would have nowhere to go
+    assert scheduler.next_stage() == "detect"
+    scheduler.start("detect")
+    assert scheduler.next_stage() == "ocr"
+
+def test_no_stage_when_nothing_can_start():
+    assert _scheduler().next_stage() is None
+    assert _scheduler().allocation() == {stage: 0.0 for stage in STAGES}
+    # Documents still running keep their share, but there is nothing left to start
+    scheduler = _scheduler(write=1)
+    scheduler.start("write")
+    assert scheduler.next_stage() is None
+    assert scheduler.allocation()["write"] == 4.0
+
+def test_latency_is_a_running_average():
+    scheduler = _scheduler()
+    scheduler.observe("ocr", 3.0)
+    assert scheduler.latency["ocr"] == pytest.approx(1.0 + LATENCY_SMOOTHING * 2.0)
+
+def test_encrypt_stage_records_reach_the_payload():
+    detections = {1: [("ABCDE1234F", 4, 14, "PAN")], 0: [("a@b.co", 0, 6, "EMAIL_ADDRESS"), ("PQRST6789K", 10, 20, "PAN")]}
+    records = _EncryptedRecords(*_encrypt_stage(detections, "secret"))
+    records.encrypt("ignored", 0, "PAN", 0, 7)
+    # Same order as redact_page would have encrypted them in
+    assert [entry[1:] for entry in records.entries()] == [(0, "EMAIL_ADDRESS", 0, 6), (0, "PAN", 10, 20), (1, "PAN", 4, 14)]
+    assert decrypt_payload(records.take_payload(), "secret") == ["a@b.co", "PQRST6789K", "ABCDE1234F"]
+    assert _EncryptedRecords(*_encrypt_stage({0: []}, "secret")).take_payload() is None
@@ -0,0 +1,102 @@
+'''
+File: test_scanner.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import pytest
+from scanner import is_valid_pii, may_contain_pii, resolve_overlaps, scan_text
+
+SCANNER_ENTITIES = {"AADHAR", "PAN"}
+
+
+def _types(spans):
+    return [(detected_text, entity_type) for detected_text, _, _, entity_type in spans]
+
+def test_prefilter_skips_text_without_digits_or_at():
+    assert not may_contain_pii("plain prose with no identifiers")
+    assert scan_text("plain prose with no identifiers") == []
+    assert may_contain_pii("room 4")
+
+def test_finds_each_entity_type():
+    text = "PAN ABCDE1234F, Aadhaar 1234 5678 9012, mail john@example.com"
+    assert _types(scan_text(text, SCANNER_ENTITIES)) == [("ABCDE1234F", "PAN"), ("1234 5678 9012", "AADHAR")]
+    assert ("john@example.com", "EMAIL_ADDRESS") in _types(scan_text(text))
+
+def test_offsets_point_at_the_match():
+    text = "id: 123456789012."
+    [(detected_text, start, end, _)] = scan_text(text, SCANNER_ENTITIES)
+    assert text[start:end] == detected_text == "123456789012"
+
+# A phone number or email address that starts first must not hide an Aadhaar number or PAN
+@pytest.mark.parametrize("text, expected", [
+    ("Ph 022 123456789012", ("123456789012", "AADHAR")),
+    ("Call 98 1234 5678 9012", ("1234 5678 9012", "AADHAR")),
+    ("ref 12345 1234 5678 9012", ("1234 5678 9012", "AADHAR")),
+    ("ABCDE1234F@corp.com", ("ABCDE1234F", "PAN")),
+])
+def test_overlapping_types_do_not_consume_each_other(text, expected):
+    assert _types(scan_text(text, SCANNER_ENTITIES)) == [expected]
+    assert expected in _types(scan_text(text))
+
+def test_all_types_keeps_overlapping_spans_for_the_resolver():
+    types = _types(scan_text("ABCDE1234F@corp.com"))
+    assert ("ABCDE1234F", "PAN") in types
+    assert ("ABCDE1234F@corp.com", "EMAIL_ADDRESS") in types
+
+def test_spans_are_ordered_by_start():
+    spans = scan_text("a@b.co 1234 5678 9012 ABCDE1234F")
+    assert [span[1] for span in spans] == sorted(span[1] for span in spans)
+
+def test_is_valid_pii():
+    assert is_valid_pii("ABCDE1234F", "PAN")
+    assert not is_valid_pii("ABCD1234F", "PAN")
+    assert is_valid_pii("1234 5678 9012", "AADHAR")
+    assert not is_valid_pii("1234", "UNKNOWN")
+
+
+def test_resolver_keeps_disjoint_spans():
+    candidates = [("ABCDE1234F", 0, 10, "PAN", 1.0), ("a@b.co", 20, 26, "EMAIL_ADDRESS", 1.0)]
+    assert resolve_overlaps(candidates) == [("ABCDE1234F", 0, 10, "PAN"), ("a@b.co", 20, 26, "EMAIL_ADDRESS")]
+
+def test_resolver_keeps_one_detection_for_the_same_span():
+    candidates = [("123456789012", 3, 15, "PHONE_NUMBER", 0.75), ("123456789012", 3, 15, "AADHAR", 1.0)]
+    assert resolve_overlaps(candidates) == [("123456789012", 3, 15, "AADHAR")]
+
+def test_resolver_ranks_by_priority_then_score_then_length():
+    assert resolve_overlaps([("x", 0, 4, "A", 0.4), ("x", 0, 4, "B", 0.9)], {"A": 1, "B": 1})[0][3] == "B"
+    candidates = [("AB", 0, 2, "A", 0.5), ("ABCD", 0, 4, "B", 0.5)]
+    assert resolve_overlaps(candidates, {"A": 1, "B": 1})[0][3] == "B"
+    assert resolve_overlaps(candidates, {"A": 2, "B": 1})[0][3] == "A"
+
+# The part of a losing span outside the winner must still be redacted
+def test_losing_email_remainder_is_added_to_the_pan():
+    text = "ABCDE1234F@x.com"
+    candidates = [("ABCDE1234F", 0, 10, "PAN", 1.0), ("ABCDE1234F@x.com", 0, 16, "EMAIL_ADDRESS", 0.85)]
+    assert resolve_overlaps(candidates) == [("ABCDE1234F@x.com", 0, 16, "PAN")]
+    assert resolve_overlaps(candidates, text=text) == [("ABCDE1234F@x.com", 0, 16, "PAN")]
+
+def test_phone_prefix_before_an_aadhaar_is_redacted_with_it():
+    text = "call +91 1234 5678 9012 now"
+    candidates = [("1234 5678 9012", 9, 23, "AADHAR", 1.0), ("+91 1234 5678 9012", 5, 23, "PHONE_NUMBER", 0.75)]
+    assert resolve_overlaps(candidates, text=text) == [("+91 1234 5678 9012", 5, 23, "AADHAR")]
+
+def test_span_bridging_two_winners_keeps_both_and_covers_the_gap():
+    text = "1234 5678 9012 2345 6789 0123"
+    candidates = [("1234 5678 9012", 0, 14, "AADHAR", 1.0), ("2345 6789 0123", 15, 29, "AADHAR", 1.0),
+                  ("9012 2345", 10, 19, "PHONE_NUMBER", 0.5)]
+    detections = resolve_overlaps(candidates, text=text)
+    assert [detection[3] for detection in detections] == ["AADHAR", "AADHAR"]
+    assert detections[0][1] == 0 and detections[0][2] == detections[1][1] and detections[1][2] == 29
+
+def test_scan_and_resolve_redact_everything_the_patterns_cover():
+    text = "Call 98 1234 5678 9012 or ABCDE1234F@corp.com"
+    candidates = [span + (1.0,) for span in scan_text(text)]
+    detections = resolve_overlaps(candidates, text=text)
+    covered = set()
+    for candidate in candidates:
+        covered.update(range(candidate[1], candidate[2]))
+    assert covered == {i for _, start, end, _ in detections for i in range(start, end)}
+    assert {"AADHAR", "PAN"} <= {detection[3] for detection in detections}
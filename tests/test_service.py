@@ -0,0 +1,92 @@
+'''
+File: test_service.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import json
+import threading
+import time
+import fitz
+import pytest
+import main
+import service
+from urllib.request import Request, urlopen
+
+
+class RecordingAnalyzer:
+    # Only the regex scanner finds anything; the number of texts per NLP call is kept
+    def __init__(self):
+        self.batches = []
+
+    def analyze_texts(self, texts, entities):
+        self.batches.append(len(texts))
+        return [[] for _ in texts]
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    analyzer = RecordingAnalyzer()
+    monkeypatch.setattr(service, "get_analyzer", lambda: analyzer)
+    return analyzer
+
+@pytest.fixture
+def server(analyzer):
+    # A long batch window, so both jobs' pages are certain to share one NLP call
+    redaction_service = service.RedactionService(max_concurrent=2, batch_window=1.0)
+    server = service.create_server("127.0.0.1", 0, redaction_service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _pdf_bytes(pan):
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), f"PAN {pan}")
+    data = document.tobytes()
+    document.close()
+    return data
+
+def _post(server, name, data):
+    url = f"http://127.0.0.1:{server.server_address[1]}/redact?name={name}"
+    with urlopen(Request(url, data=data, method="POST"), timeout=30) as response:
+        return response.status, json.loads(response.headers["X-PII-Detected-Counts"]), response.read()
+
+def test_concurrent_requests_take_turns_on_pymupdf(server, analyzer, monkeypatch):
+    active = []
+    overlaps = []
+    redact_page = main.redact_page
+
+    # Holds each job inside PyMuPDF long enough for an unlocked second job to run into it
+    def guarded_redact_page(*args, **kwargs):
+        active.append(threading.current_thread())
+        overlaps.append(len(active))
+        time.sleep(0.1)
+        try:
+            return redact_page(*args, **kwargs)
+        finally:
+            active.pop()
+
+    monkeypatch.setattr(main, "redact_page", guarded_redact_page)
+    pans = {"a.pdf": "ABCDE1234F", "b.pdf": "PQRST6789K"}
+    responses = {}
+
+    def post(name):
+        responses[name] = _post(server, name, _pdf_bytes(pans[name]))
+
+    threads = [threading.Thread(target=post, args=(name,)) for name in pans]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(overlaps) == 1
+    # The NLP step of both jobs still ran together
+    assert analyzer.batches == [2]
+    for name, (status, detected_counts, body) in responses.items():
+        assert status == 200
+        assert detected_counts["PAN"] == 1
+        with fitz.open(stream=body, filetype="pdf") as document:
+            assert pans[name] not in document[0].get_text()
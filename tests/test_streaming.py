@@ -0,0 +1,98 @@
+'''
+File: test_streaming.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import fitz
+import pytest
+import streaming
+from cache import ResultCache, file_hash
+from decryption import decrypt_pdf, read_encrypted_lines
+from encryption import ENVELOPE_HEADER_PREFIX
+from streaming import process_pdf_streaming
+from vault import PiiVault
+
+PAGES = 5
+
+
+class NoNlpAnalyzer:
+    # Only the regex scanner finds anything (Aadhaar and PAN)
+    def analyze(self, text, entities, language='en'):
+        return []
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = str(tmp_path / "long.pdf")
+    document = fitz.open()
+    for page_num in range(PAGES):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Page {page_num} PAN ABCDE{1000 + page_num}F")
+    document.save(path)
+    document.close()
+    return path
+
+def _run(pdf_path, output_directory, **kwargs):
+    return process_pdf_streaming(pdf_path, str(output_directory), page_budget=2, analyzer=NoNlpAnalyzer(), **kwargs)
+
+def test_windows_are_joined_with_every_record(pdf_path, tmp_path):
+    detected_counts = _run(pdf_path, tmp_path)
+    redacted_pdf_path = str(tmp_path / "redacted_long.pdf")
+    with fitz.open(redacted_pdf_path) as document:
+        assert len(document) == PAGES
+        assert "ABCDE" not in "".join(page.get_text() for page in document)
+    assert detected_counts["PAN"] == PAGES
+    assert sorted(decrypt_pdf(redacted_pdf_path, 'hello')) == sorted(f"ABCDE{1000 + n}F" for n in range(PAGES))
+    # Checkpoint, records and part files are removed once the output is written
+    assert sorted(os.listdir(tmp_path)) == ["long.pdf", "redacted_long.pdf"]
+
+def test_resume_continues_after_the_last_checkpoint(pdf_path, tmp_path, monkeypatch):
+    redact_page = streaming.redact_page
+    seen = []
+    crash = True
+
+    def failing_redact_page(page, analyzer, encryptor, detected_counts, page_num):
+        seen.append(page_num)
+        if page_num == 3 and crash:
+            raise RuntimeError("crash")
+        return redact_page(page, analyzer, encryptor, detected_counts, page_num)
+
+    monkeypatch.setattr(streaming, "redact_page", failing_redact_page)
+    with pytest.raises(RuntimeError):
+        _run(pdf_path, tmp_path)
+    assert os.path.exists(tmp_path / "redacted_long.pdf.checkpoint.json")
+
+    seen.clear()
+    crash = False
+    with PiiVault(str(tmp_path / "vault.sqlite3")) as vault:
+        detected_counts = _run(pdf_path, tmp_path, vault=vault)
+        # Pages 0-1 were checkpointed; the failed window starts again from page 2
+        assert seen == [2, 3, 4]
+        assert detected_counts["PAN"] == PAGES
+        # The resumed run kept the first run's key, so one header covers every record
+        lines = read_encrypted_lines(str(tmp_path / "redacted_long.pdf"))
+        assert sum(line.startswith(ENVELOPE_HEADER_PREFIX) for line in lines) == 1
+        assert len(decrypt_pdf(str(tmp_path / "redacted_long.pdf"), 'hello')) == PAGES
+        vault.flush()
+        assert [record["page"] for record in vault.lookup(file_hash(pdf_path), 'hello')] == list(range(PAGES))
+
+def test_unchanged_document_is_taken_from_the_cache(pdf_path, tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"))
+    output_directory = tmp_path / "out"
+    output_directory.mkdir()
+    detected_counts = _run(pdf_path, output_directory, cache=cache)
+    monkeypatch.setattr(streaming, "redact_page", None)
+    assert _run(pdf_path, output_directory, cache=cache) == detected_counts
+    cache.close()
+
+def test_checkpoint_of_another_input_is_ignored(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    streaming._save_checkpoint(checkpoint_path, {"source": {"path": "a.pdf", "size": 1, "mtime": 0}, "page_budget": 2})
+    assert streaming._load_checkpoint(checkpoint_path, {"path": "a.pdf", "size": 1, "mtime": 0}, 2) is not None
+    assert streaming._load_checkpoint(checkpoint_path, {"path": "a.pdf", "size": 2, "mtime": 0}, 2) is None
+    assert streaming._load_checkpoint(checkpoint_path, {"path": "a.pdf", "size": 1, "mtime": 0}, 4) is None
+    assert streaming._load_checkpoint(str(tmp_path / "missing.json"), {}, 2) is None
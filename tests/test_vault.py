@@ -0,0 +1,75 @@
+'''
+File: test_vault.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import pytest
+import vault as vault_module
+from encryption import EnvelopeEncryptor
+from vault import PiiVault
+
+
+@pytest.fixture
+def vault(tmp_path):
+    vault = PiiVault(str(tmp_path / "vault.sqlite3"))
+    yield vault
+    vault.close()
+
+# (name, page, entity_type, start, end) items encrypted the way redact_page does
+def _document(items, password="secret"):
+    encryptor = EnvelopeEncryptor(password)
+    for text, page, entity_type, start, end in items:
+        encryptor.encrypt(text, page, entity_type, start, end)
+    return encryptor.header, encryptor.entries()
+
+ITEMS = [("ABCDE1234F", 1, "PAN", 4, 14), ("someone@example.com", 0, "EMAIL_ADDRESS", 10, 29), ("PQRST6789K", 0, "PAN", 40, 50)]
+
+def test_lookup_decrypts_in_page_and_offset_order(vault):
+    vault.add_document("doc", "a.pdf", *_document(ITEMS))
+    vault.flush()
+    assert [(r["text"], r["page"], r["entity_type"], r["start"], r["end"]) for r in vault.lookup("doc", "secret")] == [
+        ITEMS[1], ITEMS[2], ITEMS[0]]
+    assert [r["text"] for r in vault.lookup("doc", "secret", page=0, entity_type="PAN")] == ["PQRST6789K"]
+    assert vault.lookup("unknown", "secret") == []
+    with pytest.raises(Exception):
+        vault.lookup("doc", "wrong")
+
+def test_records_wait_for_flush_or_a_full_batch(tmp_path):
+    with PiiVault(str(tmp_path / "vault.sqlite3"), batch_records=4) as vault:
+        vault.add_document("a", "a.pdf", *_document(ITEMS))
+        assert vault.documents() == []
+        # The fourth record fills the batch
+        vault.add_document("b", "b.pdf", *_document(ITEMS[:1]))
+        assert [document["name"] for document in vault.documents()] == ["a.pdf", "b.pdf"]
+        vault.add_document("c", "c.pdf", *_document(ITEMS[:1]))
+    # close() writes the rest
+    with PiiVault(str(tmp_path / "vault.sqlite3")) as vault:
+        assert len(vault.lookup("c", "secret")) == 1
+
+def test_reprocessed_document_replaces_its_records(vault):
+    vault.add_document("doc", "a.pdf", *_document(ITEMS))
+    vault.flush()
+    vault.add_document("doc", "a.pdf", *_document(ITEMS[:1], password="new secret"))
+    vault.flush()
+    assert [r["text"] for r in vault.lookup("doc", "new secret")] == ["ABCDE1234F"]
+    assert len(vault.documents()) == 1
+
+def test_export_delete_and_purge(vault, monkeypatch):
+    now = vault_module.time.time()
+    monkeypatch.setattr(vault_module.time, "time", lambda: now - 10 * 86400)
+    vault.add_document("old", "old.pdf", *_document(ITEMS[:1]))
+    vault.flush()
+    monkeypatch.setattr(vault_module.time, "time", lambda: now)
+    vault.add_document("new", "new.pdf", *_document(ITEMS[1:]))
+    vault.add_document("other", "other.pdf", *_document(ITEMS[:1]))
+    vault.flush()
+
+    assert [(r["name"], r["text"]) for r in vault.export("secret", ["new"])] == [("new.pdf", ITEMS[1][0]), ("new.pdf", ITEMS[2][0])]
+    assert len(list(vault.export("secret"))) == 4
+    assert vault.delete_document("other") == 1
+    assert vault.purge(max_age_days=5) == 1
+    assert [document["name"] for document in vault.documents()] == ["new.pdf"]
+    assert vault.lookup("old", "secret") == []
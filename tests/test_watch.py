@@ -0,0 +1,141 @@
+'''
+File: test_watch.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import pytest
+import watch
+from watch import StabilityTracker, WorkQueue
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "queue.sqlite3")
+
+@pytest.fixture
+def work_queue(queue_path):
+    work_queue = WorkQueue(queue_path, max_attempts=2, retry_delay=0)
+    yield work_queue
+    work_queue.close()
+
+def test_each_version_of_a_file_is_queued_once(work_queue):
+    assert work_queue.enqueue("a.pdf", "hash1", 10, 1)
+    assert not work_queue.enqueue("a.pdf", "hash1", 10, 2)
+    assert work_queue.enqueue("a.pdf", "hash2", 11, 3)
+    assert work_queue.is_known("a.pdf", 10, 1)
+    assert not work_queue.is_known("a.pdf", 10, 2)
+    assert work_queue.pending_count() == 2
+
+def test_claim_marks_jobs_running_in_queue_order(work_queue):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        work_queue.enqueue(name, name, 1, 1)
+    assert [job[1] for job in work_queue.claim(2)] == ["a.pdf", "b.pdf"]
+    assert [job[1] for job in work_queue.claim(5)] == ["c.pdf"]
+    assert work_queue.claim(5) == []
+    assert work_queue.counts() == {"running": 3}
+
+def test_failures_are_retried_then_dead_lettered(work_queue):
+    work_queue.enqueue("a.pdf", "hash", 1, 1)
+    [(job_id, _, _, _)] = work_queue.claim(1)
+    assert not work_queue.fail(job_id, "first")
+    assert [job[0] for job in work_queue.claim(1)] == [job_id]
+    assert work_queue.fail(job_id, "second")
+    assert work_queue.claim(1) == []
+    assert work_queue.dead_letters() == [(job_id, "a.pdf", 2, "second")]
+
+    assert work_queue.requeue_dead() == 1
+    assert [job[0] for job in work_queue.claim(1)] == [job_id]
+
+def test_retry_waits_for_the_backoff(queue_path):
+    work_queue = WorkQueue(queue_path, retry_delay=60)
+    work_queue.enqueue("a.pdf", "hash", 1, 1)
+    [(job_id, _, _, _)] = work_queue.claim(1)
+    work_queue.fail(job_id, "error")
+    assert work_queue.counts() == {"pending": 1}
+    assert work_queue.claim(1) == []
+    work_queue.close()
+
+def test_finished_jobs_are_not_claimed_again(work_queue):
+    work_queue.enqueue("a.pdf", "a", 1, 1)
+    work_queue.enqueue("b.pdf", "b", 1, 1)
+    (a_id, _, _, _), (b_id, _, _, _) = work_queue.claim(2)
+    work_queue.complete(a_id)
+    work_queue.supersede(b_id)
+    assert work_queue.claim(2) == []
+    assert work_queue.counts() == {"done": 1, "superseded": 1}
+
+def test_interrupted_jobs_survive_a_restart(queue_path):
+    work_queue = WorkQueue(queue_path)
+    work_queue.enqueue("a.pdf", "hash", 1, 1)
+    work_queue.enqueue("b.pdf", "hash", 1, 1)
+    [(done_id, _, _, _), _] = work_queue.claim(2)
+    work_queue.complete(done_id)
+    work_queue.close()
+
+    work_queue = WorkQueue(queue_path)
+    assert work_queue.recover() == 1
+    assert [job[1] for job in work_queue.claim(5)] == ["b.pdf"]
+    # Attempts are only counted for real failures
+    assert work_queue.connection.execute("SELECT attempts FROM jobs WHERE path = 'b.pdf'").fetchone() == (0,)
+    work_queue.close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(watch.time, "monotonic", clock)
+    return clock
+
+def _write(path, data, mtime_ns):
+    with open(path, 'wb') as file:
+        file.write(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_file_is_reported_once_it_stops_changing(tmp_path, clock):
+    tracker = StabilityTracker(stable_seconds=5)
+    path = str(tmp_path / "a.pdf")
+    _write(path, b"part", 1)
+    assert tracker.scan(tmp_path) == []
+    clock.now = 3
+    _write(path, b"partial upload", 2)
+    assert tracker.scan(tmp_path) == []
+    clock.now = 7
+    assert tracker.scan(tmp_path) == []
+    clock.now = 8
+    assert tracker.scan(tmp_path) == [(path, 14, 2)]
+
+def test_handled_file_is_reported_again_only_after_it_changes(tmp_path, clock):
+    tracker = StabilityTracker(stable_seconds=5)
+    path = str(tmp_path / "a.pdf")
+    _write(path, b"data", 1)
+    tracker.scan(tmp_path)
+    clock.now = 5
+    assert tracker.scan(tmp_path) == [(path, 4, 1)]
+    # Not marked handled (e.g. under backpressure): reported again
+    assert tracker.scan(tmp_path) == [(path, 4, 1)]
+    tracker.mark_handled(path)
+    clock.now = 20
+    assert tracker.scan(tmp_path) == []
+    _write(path, b"new data", 2)
+    assert tracker.scan(tmp_path) == []
+    clock.now = 25
+    assert tracker.scan(tmp_path) == [(path, 8, 2)]
+
+def test_only_non_empty_pdfs_are_reported(tmp_path, clock):
+    tracker = StabilityTracker(stable_seconds=0)
+    _write(str(tmp_path / "notes.txt"), b"text", 1)
+    _write(str(tmp_path / "empty.pdf"), b"", 1)
+    _write(str(tmp_path / "b.PDF"), b"data", 1)
+    tracker.scan(tmp_path)
+    assert [os.path.basename(path) for path, _, _ in tracker.scan(tmp_path)] == ["b.PDF"]
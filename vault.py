@@ -0,0 +1,188 @@
+'''
+File: vault.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+import getpass
+from decryption import unwrap_data_key, decrypt_envelope_record
+
+# Buffered records are committed in one transaction once this many are waiting
+VAULT_BATCH_RECORDS = 5000
+
+
+class PiiVault:
+    """Indexed store of encrypted PII records, backed by one SQLite file.
+
+    Every record is kept under (document hash, page, start, end, entity
+    type), next to the wrapped data key of the document it came from, so
+    one document's PII is found with an index lookup and decrypted with a
+    single key unwrap. add_document() buffers; the buffer is written in one
+    transaction when it reaches batch_records, on flush() and on close().
+    Storing a document again replaces its earlier records.
+    """
+
+    def __init__(self, vault_path, batch_records=VAULT_BATCH_RECORDS):
+        self.vault_path = vault_path
+        self.batch_records = batch_records
+        self.pending = []
+        self.pending_records = 0
+        self.connection = sqlite3.connect(vault_path, timeout=30)
+        # WAL lets several worker processes write while readers keep going
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    document_hash TEXT PRIMARY KEY, name TEXT, key_header TEXT, created REAL);
+                CREATE INDEX IF NOT EXISTS documents_by_created ON documents (created);
+                CREATE TABLE IF NOT EXISTS records (
+                    document_hash TEXT, page INTEGER, start_offset INTEGER, end_offset INTEGER,
+                    entity_type TEXT, record TEXT,
+                    PRIMARY KEY (document_hash, page, start_offset, end_offset, entity_type)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS records_by_type ON records (entity_type, document_hash);
+            """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    # entries are EnvelopeEncryptor.entries() tuples: (record, page, entity_type, start, end)
+    def add_document(self, document_hash, name, key_header, entries):
+        self.pending.append((document_hash, name, key_header, list(entries)))
+        self.pending_records += len(self.pending[-1][3])
+        if self.pending_records >= self.batch_records:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        now = time.time()
+        with self.connection:
+            for document_hash, name, key_header, entries in self.pending:
+                self.connection.execute("DELETE FROM records WHERE document_hash = ?", (document_hash,))
+                self.connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                                        (document_hash, name, key_header, now))
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)",
+                    [(document_hash, page, start, end, entity_type, record)
+                     for record, page, entity_type, start, end in entries])
+        self.pending = []
+        self.pending_records = 0
+
+    def documents(self):
+        return [{"document_hash": row[0], "name": row[1], "created": row[2]}
+                for row in self.connection.execute("SELECT document_hash, name, created FROM documents ORDER BY created")]
+
+    def lookup(self, document_hash, password, page=None, entity_type=None):
+        """Decrypt one document's records, optionally only one page and/or entity type.
+
+        Returns dicts with page, entity_type, start, end and text, in page
+        and offset order; an empty list for an unknown document.
+        """
+        row = self.connection.execute("SELECT key_header FROM documents WHERE document_hash = ?", (document_hash,)).fetchone()
+        if row is None:
+            return []
+        query = "SELECT page, start_offset, end_offset, entity_type, record FROM records WHERE document_hash = ?"
+        params = [document_hash]
+        if page is not None:
+            query += " AND page = ?"
+            params.append(page)
+        if entity_type is not None:
+            query += " AND entity_type = ?"
+            params.append(entity_type)
+        aead = unwrap_data_key(row[0], password)
+        return [
+            {"page": page_num, "entity_type": record_type, "start": start, "end": end,
+             "text": decrypt_envelope_record(record, aead)}
+            for page_num, start, end, record_type, record in self.connection.execute(query + " ORDER BY page, start_offset", params)
+        ]
+
+    def export(self, password, document_hashes=None):
+        """Yield every record of the given documents (default: all) with its document hash and name.
+
+        Records are read document by document, so the key of each document
+        is unwrapped once and memory stays flat however large the vault is.
+        """
+        if document_hashes is None:
+            document_hashes = [document["document_hash"] for document in self.documents()]
+        for document_hash in document_hashes:
+            name = self.connection.execute("SELECT name FROM documents WHERE document_hash = ?", (document_hash,)).fetchone()
+            for record in self.lookup(document_hash, password):
+                yield dict(record, document_hash=document_hash, name=name[0] if name else None)
+
+    # Returns the number of records removed
+    def delete_document(self, document_hash):
+        self.flush()
+        with self.connection:
+            removed = self.connection.execute("DELETE FROM records WHERE document_hash = ?", (document_hash,)).rowcount
+            self.connection.execute("DELETE FROM documents WHERE document_hash = ?", (document_hash,))
+        return removed
+
+    # Delete every document stored more than max_age_days ago; returns the number of documents removed
+    def purge(self, max_age_days):
+        self.flush()
+        cutoff = time.time() - max_age_days * 86400
+        expired = [row[0] for row in self.connection.execute("SELECT document_hash FROM documents WHERE created < ?", (cutoff,))]
+        for document_hash in expired:
+            self.delete_document(document_hash)
+        return len(expired)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up, export or delete PII held in a vault.")
+    parser.add_argument("vault_path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list stored documents")
+    lookup_parser = commands.add_parser("lookup", help="decrypt one document's PII")
+    lookup_parser.add_argument("document_hash")
+    lookup_parser.add_argument("--page", type=int, help="zero-based page number")
+    lookup_parser.add_argument("--entity-type")
+    export_parser = commands.add_parser("export", help="decrypt records as JSON lines")
+    export_parser.add_argument("document_hash", nargs="*", help="default: every document")
+    export_parser.add_argument("--output", help="write here instead of stdout")
+    delete_parser = commands.add_parser("delete", help="delete one document's records")
+    delete_parser.add_argument("document_hash")
+    purge_parser = commands.add_parser("purge", help="delete documents older than a retention period")
+    purge_parser.add_argument("--max-age-days", type=float, required=True)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.vault_path):
+        parser.error(f"no vault at {args.vault_path}")
+    with PiiVault(args.vault_path) as vault:
+        if args.command == "list":
+            for document in vault.documents():
+                print(f"{document['document_hash']}  {document['name']}")
+        elif args.command == "lookup":
+            records = vault.lookup(args.document_hash, getpass.getpass("Password: "), args.page, args.entity_type)
+            for record in records:
+                print(f"page {record['page'] + 1}  {record['entity_type']:<14} {record['text']}")
+        elif args.command == "export":
+            password = getpass.getpass("Password: ")
+            output = open(args.output, 'w') if args.output else None
+            try:
+                for record in vault.export(password, args.document_hash or None):
+                    print(json.dumps(record), file=output)
+            finally:
+                if output:
+                    output.close()
+        elif args.command == "delete":
+            print(f"{vault.delete_document(args.document_hash)} records deleted")
+        elif args.command == "purge":
+            print(f"{vault.purge(args.max_age_days)} documents deleted")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+'''
+File: watch.py
+Title: A Personally Identifiable Information (PII) Detection and Redaction Tool
+Author: Aventra
+Python Version: ^3.11
+Dependency Manager: Poetry
+'''
+
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from cache import ResultCache, file_hash
+from main import _init_batch_worker, _process_pdf_in_worker
+from metrics import metrics
+
+# Seconds between directory scans, and how long a file's size and mtime must
+# stay unchanged before it counts as fully written
+POLL_INTERVAL_SECONDS = 2.0
+STABLE_SECONDS = 5.0
+
+# Pending jobs above which new files are left in the directory until the queue drains
+MAX_PENDING_JOBS = 1000
+
+# A failing file is retried after RETRY_DELAY_SECONDS, doubling each time;
+# after MAX_ATTEMPTS failures it is dead-lettered
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 30.0
+
+QUEUE_FILENAME = "watch_queue.sqlite3"
+
+
+class WorkQueue:
+    """Durable queue of files to process, backed by one SQLite file.
+
+    A job is one version of one file: (path, content hash). Enqueueing a
+    version that is already known is a no-op, so a file is processed once
+    however often it is seen, across restarts, and again only when its
+    content changes. Job states:
+      - pending: waiting, not before next_attempt
+      - running: handed to a worker; put back to pending by recover()
+      - done / dead: finished, or failed max_attempts times (dead letter)
+      - superseded: the file changed or vanished before it was processed
+    """
+
+    def __init__(self, queue_path, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY_SECONDS):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.connection = sqlite3.connect(queue_path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY, path TEXT, content_hash TEXT, size INTEGER, mtime_ns INTEGER,
+                    state TEXT, attempts INTEGER DEFAULT 0, next_attempt REAL, last_error TEXT,
+                    enqueued REAL, updated REAL,
+                    UNIQUE (path, content_hash));
+                CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, next_attempt);
+                CREATE INDEX IF NOT EXISTS jobs_by_file ON jobs (path, size, mtime_ns);
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    # Jobs left running by a stopped or crashed watcher; a failed attempt is not counted for them
+    def recover(self):
+        with self.connection:
+            return self.connection.execute("UPDATE jobs SET state = 'pending', updated = ? WHERE state = 'running'",
+                                           (time.time(),)).rowcount
+
+    # True when this exact (path, size, mtime) was already enqueued, so it need not be hashed again
+    def is_known(self, path, size, mtime_ns):
+        return self.connection.execute("SELECT 1 FROM jobs WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                       (path, size, mtime_ns)).fetchone() is not None
+
+    # Returns True when a new job was created
+    def enqueue(self, path, content_hash, size, mtime_ns):
+        now = time.time()
+        with self.connection:
+            return self.connection.execute(
+                "INSERT OR IGNORE INTO jobs (path, content_hash, size, mtime_ns, state, next_attempt, enqueued, updated) "
+                "VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+                (path, content_hash, size, mtime_ns, now, now, now)).rowcount == 1
+
+    def pending_count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM jobs WHERE state = 'pending'").fetchone()[0]
+
+    # Oldest due jobs as (id, path, size, mtime_ns), marked running
+    def claim(self, limit):
+        now = time.time()
+        with self.connection:
+            jobs = self.connection.execute(
+                "SELECT id, path, size, mtime_ns FROM jobs WHERE state = 'pending' AND next_attempt <= ? "
+                "ORDER BY next_attempt, id LIMIT ?", (now, limit)).fetchall()
+            self.connection.executemany("UPDATE jobs SET state = 'running', updated = ? WHERE id = ?",
+                                        [(now, job[0]) for job in jobs])
+        return jobs
+
+    def _set_state(self, job_id, state, error=None):
+        with self.connection:
+            self.connection.execute("UPDATE jobs SET state = ?, last_error = ?, updated = ? WHERE id = ?",
+                                    (state, error, time.time(), job_id))
+
+    def complete(self, job_id):
+        self._set_state(job_id, "done")
+
+    def supersede(self, job_id):
+        self._set_state(job_id, "superseded")
+
+    # Schedules a retry with exponential backoff; returns True when the job was dead-lettered instead
+    def fail(self, job_id, error):
+        now = time.time()
+        with self.connection:
+            attempts = self.connection.execute("UPDATE jobs SET attempts = attempts + 1 WHERE id = ? RETURNING attempts",
+                                               (job_id,)).fetchone()[0]
+            dead = attempts >= self.max_attempts
+            self.connection.execute(
+                "UPDATE jobs SET state = ?, next_attempt = ?, last_error = ?, updated = ? WHERE id = ?",
+                ("dead" if dead else "pending", now + self.retry_delay * 2 ** (attempts - 1), error, now, job_id))
+        return dead
+
+    def dead_letters(self):
+        return self.connection.execute("SELECT id, path, attempts, last_error FROM jobs WHERE state = 'dead' ORDER BY updated").fetchall()
+
+    # Give dead-lettered jobs a fresh set of attempts; returns how many were requeued
+    def requeue_dead(self):
+        now = time.time()
+        with self.connection:
+            return self.connection.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, next_attempt = ?, updated = ? WHERE state = 'dead'",
+                (now, now)).rowcount
+
+    def counts(self):
+        return dict(self.connection.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+
+class StabilityTracker:
+    """Reports files whose size and mtime have not changed for stable_seconds.
+
+    Uploads and copies grow a file over several scans; a file is only
+    handed on once it has stopped changing, and again only after it changes.
+    """
+
+    def __init__(self, stable_seconds=STABLE_SECONDS):
+        self.stable_seconds = stable_seconds
+        self.seen = {}
+
+    # Returns [(path, size, mtime_ns)] of files that became stable since the last call
+    def scan(self, directory_path):
+        now = time.monotonic()
+        stable = []
+        current = set()
+        for entry in os.scandir(directory_path):
+            if not entry.is_file() or not entry.name.lower().endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            current.add(entry.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self.seen.get(entry.path)
+            if previous is None or previous[0] != signature:
+                self.seen[entry.path] = (signature, now, False)
+            elif not previous[2] and now - previous[1] >= self.stable_seconds and stat.st_size > 0:
+                stable.append((entry.path,) + signature)
+        # Forget deleted files so a re-upload under the same name is tracked from scratch
+        for path in set(self.seen) - current:
+            del self.seen[path]
+        return stable
+
+    # Files reported by scan() but never marked handled (e.g. under backpressure) are reported again
+    def mark_handled(self, path):
+        signature, since, _ = self.seen[path]
+        self.seen[path] = (signature, since, True)
+
+
+def _still_unchanged(path, size, mtime_ns):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
+def watch_directory(input_directory, output_directory, redact_pii=True, pii_count_file=os.devnull, workers=None,
+                    queue_path=None, cache_dir=None, vault_path=None, poll_interval=POLL_INTERVAL_SECONDS,
+                    stable_seconds=STABLE_SECONDS, max_pending=MAX_PENDING_JOBS, max_attempts=MAX_ATTEMPTS,
+                    retry_delay=RETRY_DELAY_SECONDS, stop_event=None):
+    """Process PDFs as they arrive in input_directory until stop_event is set (or Ctrl+C).
+
+    Stable new or changed files go into a WorkQueue (default: in
+    output_directory) and are processed on a pool of worker processes with
+    warm analyzers; at most two per worker are in flight. While more than
+    max_pending jobs wait, new files stay untouched in the directory.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    stop_event = stop_event or threading.Event()
+    work_queue = WorkQueue(queue_path or os.path.join(output_directory, QUEUE_FILENAME), max_attempts, retry_delay)
+    tracker = StabilityTracker(stable_seconds)
+    recovered = work_queue.recover()
+    if recovered:
+        print(f"Requeued {recovered} interrupted jobs")
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                   initargs=(redact_pii, cache_dir, vault_path))
+
+    pool = new_pool()
+    in_flight = {}
+    print(f"Watching {os.path.normpath(input_directory)} with {workers} workers")
+    try:
+        while not stop_event.is_set():
+            # Enqueue newly stable files unless the queue is already backed up
+            for path, size, mtime_ns in tracker.scan(input_directory):
+                if work_queue.is_known(path, size, mtime_ns):
+                    tracker.mark_handled(path)
+                    continue
+                if work_queue.pending_count() >= max_pending:
+                    metrics.count("watch_backpressure")
+                    break
+                try:
+                    content_hash = file_hash(path)
+                except OSError:
+                    continue
+                if work_queue.enqueue(path, content_hash, size, mtime_ns):
+                    metrics.count("watch_enqueued")
+                    print(f"Queued {os.path.basename(path)}")
+                tracker.mark_handled(path)
+
+            # Top up the workers from the queue
+            if len(in_flight) < max_in_flight:
+                for job_id, path, size, mtime_ns in work_queue.claim(max_in_flight - len(in_flight)):
+                    # Replaced or removed since it was queued; its newer version has a job of its own
+                    if not _still_unchanged(path, size, mtime_ns):
+                        work_queue.supersede(job_id)
+                        continue
+                    future = pool.submit(_process_pdf_in_worker, path, output_directory, redact_pii, pii_count_file, strict=True)
+                    in_flight[future] = (job_id, path)
+
+            if not in_flight:
+                stop_event.wait(poll_interval)
+                continue
+
+            done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            pool_broken = False
+            for future in done:
+                job_id, path = in_flight.pop(future)
+                try:
+                    detected_counts, error, events = future.result()
+                    metrics.merge(events)
+                    metrics.flush()
+                except BrokenProcessPool as e:
+                    error = f"{type(e).__name__}: {e}"
+                    pool_broken = True
+                if error:
+                    if work_queue.fail(job_id, error):
+                        metrics.count("watch_dead_lettered")
+                        print(f"Gave up on {os.path.basename(path)}: {error}")
+                    else:
+                        print(f"Failed to process {os.path.basename(path)}, will retry: {error}")
+                else:
+                    work_queue.complete(job_id)
+                    metrics.count("watch_completed")
+            if pool_broken:
+                # A worker died (e.g. killed by the OS); every job it shared the pool with failed too
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Stopping; waiting for documents in progress")
+        pool.shutdown(wait=True, cancel_futures=True)
+        for future, (job_id, path) in in_flight.items():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                _, error, events = future.result()
+                metrics.merge(events)
+                if error:
+                    work_queue.fail(job_id, error)
+                else:
+                    work_queue.complete(job_id)
+        metrics.flush()
+        # Anything still marked running is picked up again on the next start
+        work_queue.recover()
+        work_queue.close()
+        if cache_dir:
+            cache = ResultCache(cache_dir)
+            cache.evict()
+            cache.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Redact PII from PDFs as they arrive in a folder.")
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--queue", help=f"queue database (default: output_directory/{QUEUE_FILENAME})")
+    parser.add_argument("--cache-dir")
+    parser.add_argument("--vault")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL_SECONDS)
+    parser.add_argument("--stable-seconds", type=float, default=STABLE_SECONDS)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_JOBS)
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    parser.add_argument("--dead-letters", action="store_true", help="list dead-lettered files and exit")
+    parser.add_argument("--requeue-dead", action="store_true", help="retry dead-lettered files, then watch")
+    args = parser.parse_args()
+
+    queue_path = args.queue or os.path.join(args.output_directory, QUEUE_FILENAME)
+    if args.dead_letters or args.requeue_dead:
+        os.makedirs(os.path.dirname(os.path.abspath(queue_path)), exist_ok=True)
+        work_queue = WorkQueue(queue_path)
+        if args.dead_letters:
+            for job_id, path, attempts, error in work_queue.dead_letters():
+                print(f"{path}  ({attempts} attempts)  {error}")
+            work_queue.close()
+            return
+        print(f"Requeued {work_queue.requeue_dead()} dead-lettered jobs")
+        work_queue.close()
+
+    watch_directory(args.input_directory, args.output_directory, workers=args.workers, queue_path=queue_path,
+                    cache_dir=args.cache_dir, vault_path=args.vault, poll_interval=args.poll_interval,
+                    stable_seconds=args.stable_seconds, max_pending=args.max_pending, max_attempts=args.max_attempts)
+
+if __name__ == "__main__":
+    main()